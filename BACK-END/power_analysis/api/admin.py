@@ -1,7 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from api.models import Transformer, TransformerMeasurement, CustomUser, SupportSession, SupportMessage, AdminNotification
+from api.models import Transformer, TransformerMeasurement, CustomUser, SupportSession, SupportMessage, AdminNotification, MeasurementArchive, MeasurementAnomaly
 from django.utils.translation import gettext_lazy as _
+from api.search import filter_support_messages, filter_support_sessions
 
 class CustomUserAdmin(UserAdmin):
     fieldsets = (
@@ -40,15 +41,29 @@ class SupportMessageInline(admin.TabularInline):
 class SupportSessionAdmin(admin.ModelAdmin):
     list_display = ('user', 'title', 'created_at', 'updated_at', 'is_resolved')
     list_filter = ('is_resolved', 'created_at', 'user')
-    search_fields = ('user__username', 'title')
+    search_fields = ('user__username',)
     readonly_fields = ('created_at', 'updated_at')
     inlines = [SupportMessageInline]
 
+    def get_search_results(self, request, queryset, search_term):
+        # Titles are matched through the full-text index instead of a LIKE scan
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term.strip():
+            results |= filter_support_sessions(queryset, search_term)
+        return results, may_have_duplicates
+
 class SupportMessageAdmin(admin.ModelAdmin):
     list_display = ('sender', 'session', 'content_preview', 'timestamp', 'is_read')
     list_filter = ('is_read', 'timestamp', 'sender')
-    search_fields = ('sender__username', 'content')
+    search_fields = ('sender__username',)
     readonly_fields = ('timestamp',)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Message bodies are matched through the full-text index instead of a LIKE scan
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term.strip():
+            results |= filter_support_messages(queryset, search_term)
+        return results, may_have_duplicates
     
     def content_preview(self, obj):
         return obj.content[:50] + "..." if len(obj.content) > 50 else obj.content
@@ -61,7 +76,8 @@ class AdminNotificationAdmin(admin.ModelAdmin):
     readonly_fields = ('created_at',)
     
     def message_preview(self, obj):
-        return obj.message.content[:50] + "..." if len(obj.message.content) > 50 else obj.message.content
+        content = obj.anomaly.summary if obj.anomaly_id else obj.message.content
+        return content[:50] + "..." if len(content) > 50 else content
     message_preview.short_description = 'Message Content'
 
 # Register your models here.
@@ -71,3 +87,19 @@ admin.site.register(TransformerMeasurement)
 admin.site.register(SupportSession, SupportSessionAdmin)
 admin.site.register(SupportMessage, SupportMessageAdmin)
 admin.site.register(AdminNotification, AdminNotificationAdmin)
+
+class MeasurementArchiveAdmin(admin.ModelAdmin):
+    list_display = ('transformer', 'month', 'row_count', 'first_timestamp', 'last_timestamp')
+    list_filter = ('month',)
+    exclude = ('data',)
+    readonly_fields = ('transformer', 'month', 'row_count', 'first_timestamp', 'last_timestamp')
+
+admin.site.register(MeasurementArchive, MeasurementArchiveAdmin)
+
+class MeasurementAnomalyAdmin(admin.ModelAdmin):
+    list_display = ('transformer', 'timestamp', 'max_score', 'created_at')
+    list_filter = ('created_at',)
+    search_fields = ('transformer__name',)
+    readonly_fields = ('transformer', 'measurement', 'timestamp', 'flags', 'max_score', 'created_at')
+
+admin.site.register(MeasurementAnomaly, MeasurementAnomalyAdmin)
@@ -0,0 +1,201 @@
+import logging
+import math
+from django.conf import settings
+from django.db import transaction
+from .models import MeasurementAnomaly, TransformerAnomalyState
+from .notifications import create_notifications
+
+logger = logging.getLogger(__name__)
+
+ANOMALY_GASES = ['h2', 'co', 'c2h2', 'c2h4']
+
+
+def _ewma_update(stats, value, alpha):
+    """
+    Fold one observation into an EWMA mean/variance pair in place.
+
+    Incremental form of the exponentially weighted variance, so the state
+    is two floats no matter how long the history is.
+    """
+    diff = value - stats['mean']
+    increment = alpha * diff
+    stats['mean'] += increment
+    stats['var'] = (1 - alpha) * (stats['var'] + diff * increment)
+
+
+def _score(stats, value, min_std):
+    """Distance of ``value`` from the EWMA mean in (floored) standard deviations."""
+    std = max(math.sqrt(max(stats['var'], 0.0)), min_std)
+    return (value - stats['mean']) / std
+
+
+def observe(state, values, timestamp, anomaly_settings=None):
+    """
+    Check one measurement against a transformer's state, then update the state.
+
+    Args:
+        state: Dict with 'count', 'last_timestamp' (epoch seconds) and per-gas
+            {'level': {mean, var}, 'rate': {mean, var}, 'last': value}; mutated in place
+        values: Dict of gas -> concentration for the new measurement
+        timestamp: Measurement time as a datetime
+        anomaly_settings: Overrides for settings.ANOMALY_SETTINGS
+    Returns:
+        List of flags: dicts with gas, kind, value, expected and score
+    """
+    anomaly_settings = anomaly_settings or settings.ANOMALY_SETTINGS
+    alpha = anomaly_settings['ALPHA']
+    threshold = anomaly_settings['Z_THRESHOLD']
+    warm = state['count'] >= anomaly_settings['WARMUP']
+
+    seconds = timestamp.timestamp()
+    last_seconds = state.get('last_timestamp')
+    # Backfilled (out-of-order) rows update the level statistics but have no meaningful rate
+    in_order = last_seconds is not None and seconds > last_seconds
+    hours = (seconds - last_seconds) / 3600 if in_order else None
+
+    flags = []
+    for gas in ANOMALY_GASES:
+        value = values.get(gas)
+        if value is None:
+            continue
+        gas_state = state['gases'].get(gas)
+        if gas_state is None:
+            # First reading seeds the mean; the variance grows from there
+            state['gases'][gas] = {'level': {'mean': value, 'var': 0.0}, 'rate': {'mean': 0.0, 'var': 0.0}, 'last': value}
+            continue
+
+        observed = {'level': value}
+        if hours:
+            observed['rate'] = (value - gas_state['last']) / hours
+
+        for kind, current in observed.items():
+            stats = gas_state[kind]
+            score = _score(stats, current, anomaly_settings['MIN_STD'][kind])
+            if warm and abs(score) > threshold:
+                flags.append({
+                    'gas': gas,
+                    'kind': kind,
+                    'value': current,
+                    'expected': stats['mean'],
+                    'score': round(score, 2),
+                })
+            _ewma_update(stats, current, alpha)
+
+        if in_order or last_seconds is None:
+            gas_state['last'] = value
+
+    state['count'] += 1
+    if last_seconds is None or seconds > last_seconds:
+        state['last_timestamp'] = seconds
+    return flags
+
+
+def empty_state():
+    return {'count': 0, 'last_timestamp': None, 'gases': {}}
+
+
+def _measurement_values(measurement):
+    return {gas: getattr(measurement, gas) for gas in ANOMALY_GASES}
+
+
+def record_anomaly(measurement, flags):
+    """Store the flags of one measurement and notify the transformer's owner."""
+    transformer = measurement.transformer
+    anomaly = MeasurementAnomaly.objects.create(
+        transformer=transformer,
+        measurement=measurement,
+        timestamp=measurement.timestamp,
+        flags=flags,
+        max_score=max(abs(flag['score']) for flag in flags),
+    )
+    owner = transformer.user
+    # Staff owners read the admin notification list, everyone else the user list
+    create_notifications([owner.id], is_for_admin=owner.is_staff, anomaly=anomaly)
+    logger.info(f"Anomaly on transformer {transformer.id}, measurement {measurement.id}: {flags}")
+    return anomaly
+
+
+def observe_measurement(measurement):
+    """
+    Update the transformer's anomaly state with a newly saved measurement.
+
+    Runs inside the caller's transaction; the state row is locked so that
+    concurrent inserts for one transformer apply their updates in turn.
+    Constant work per measurement: one state row read and written.
+    """
+    with transaction.atomic():
+        states = TransformerAnomalyState.objects.select_for_update()
+        state_row = states.filter(transformer_id=measurement.transformer_id).first()
+        if state_row is None:
+            # First reading of the transformer
+            state_row, _ = TransformerAnomalyState.objects.get_or_create(
+                transformer_id=measurement.transformer_id, defaults={'state': empty_state()}
+            )
+            state_row = states.get(pk=state_row.pk)
+        flags = observe(state_row.state, _measurement_values(measurement), measurement.timestamp)
+        state_row.save(update_fields=['state', 'updated_at'])
+        if flags:
+            record_anomaly(measurement, flags)
+    return flags
+
+
+def observe_measurements(measurements):
+    """
+    Batch form of observe_measurement for saved measurements, applied in the order given.
+
+    Each transformer's state row is locked, read and written once for the
+    whole batch. Returns the number of anomalies recorded.
+    """
+    by_transformer = {}
+    for measurement in measurements:
+        by_transformer.setdefault(measurement.transformer_id, []).append(measurement)
+
+    found = 0
+    with transaction.atomic():
+        states = TransformerAnomalyState.objects.select_for_update()
+        rows = {row.transformer_id: row for row in states.filter(transformer_id__in=by_transformer)}
+        missing = [pk for pk in by_transformer if pk not in rows]
+        if missing:
+            TransformerAnomalyState.objects.bulk_create(
+                [TransformerAnomalyState(transformer_id=pk, state=empty_state()) for pk in missing],
+                ignore_conflicts=True,
+            )
+            rows.update({row.transformer_id: row for row in states.filter(transformer_id__in=missing)})
+
+        for transformer_id, batch in by_transformer.items():
+            state_row = rows[transformer_id]
+            for measurement in batch:
+                flags = observe(state_row.state, _measurement_values(measurement), measurement.timestamp)
+                if flags:
+                    record_anomaly(measurement, flags)
+                    found += 1
+            state_row.save(update_fields=['state', 'updated_at'])
+    return found
+
+
+def rebuild_states(transformer_ids, measurements, notify=False):
+    """
+    Recompute anomaly state from stored data, one pass in time order.
+
+    Args:
+        transformer_ids: Transformers whose state is rebuilt (reset even if they have no rows)
+        measurements: Iterator of measurements ordered by transformer, then timestamp
+        notify: Record anomalies found during the replay (off by default, they are historical)
+    Returns:
+        Number of anomalies found
+    """
+    states = {pk: empty_state() for pk in transformer_ids}
+    found = 0
+    for measurement in measurements:
+        flags = observe(states[measurement.transformer_id], _measurement_values(measurement), measurement.timestamp)
+        if flags:
+            found += 1
+            if notify:
+                record_anomaly(measurement, flags)
+
+    with transaction.atomic():
+        TransformerAnomalyState.objects.filter(transformer_id__in=states).delete()
+        TransformerAnomalyState.objects.bulk_create([
+            TransformerAnomalyState(transformer_id=pk, state=state) for pk, state in states.items()
+        ])
+    return found
@@ -0,0 +1,168 @@
+import hashlib
+import logging
+import re
+import threading
+import unicodedata
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+CACHE_ALIAS = 'chat_answers'
+STAT_NAMES = ('hits', 'similar_hits', 'misses', 'stores')
+
+
+def normalize_question(text):
+    """Case, Unicode form, punctuation and spacing differences do not make a new question."""
+    text = unicodedata.normalize('NFKC', text).casefold()
+    return ' '.join(re.sub(r'\W+', ' ', text).split())
+
+
+def load_embedder(model_name):
+    """Mean-pooled, unit-length sentence embeddings from a local transformers encoder."""
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name, cache_dir='.model_cache')
+    model = AutoModel.from_pretrained(model_name, cache_dir='.model_cache').eval()
+
+    def embed(texts):
+        batch = tokenizer(texts, padding=True, truncation=True, max_length=128, return_tensors='pt')
+        with torch.inference_mode():
+            hidden = model(**batch).last_hidden_state
+        mask = batch['attention_mask'].unsqueeze(-1).to(hidden.dtype)
+        vectors = (hidden * mask).sum(1) / mask.sum(1).clamp(min=1)
+        return torch.nn.functional.normalize(vectors, dim=-1).numpy()
+
+    return embed
+
+
+class AnswerCache:
+    """
+    Answers to context-free first questions.
+
+    Exact tier: the normalized question plus ``version`` (model, prompt and
+    sampling settings) keys an entry in the 'chat_answers' cache, which
+    applies the TTL and entry limit. Similarity tier (when
+    CHAT_CACHE_SETTINGS['EMBEDDING_MODEL'] is set): cached questions are also
+    embedded in this process, and an exact miss is answered from the closest
+    one at or above SIMILARITY_THRESHOLD cosine similarity.
+    """
+
+    def __init__(self, version):
+        self.version = version
+        # Callable: list of str -> (n, dim) array of unit vectors; loaded on first use
+        self.embedder = None
+        self._embedder_failed = False
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._keys = []
+
+    @property
+    def cache(self):
+        return caches[CACHE_ALIAS]
+
+    def eligible(self, question, context=None):
+        cache_settings = settings.CHAT_CACHE_SETTINGS
+        return (
+            cache_settings['ENABLED']
+            and not context
+            and 0 < len(question) <= cache_settings['MAX_QUESTION_LENGTH']
+        )
+
+    def _key(self, question):
+        digest = hashlib.sha1(normalize_question(question).encode()).hexdigest()
+        return f'{self.version}:{digest}'
+
+    def _count(self, stat):
+        key = f'{self.version}:stats:{stat}'
+        self.cache.add(key, 0, timeout=None)
+        try:
+            self.cache.incr(key)
+        except ValueError:
+            # Culled between add and incr
+            self.cache.set(key, 1, timeout=None)
+
+    def _get_embedder(self):
+        model_name = settings.CHAT_CACHE_SETTINGS['EMBEDDING_MODEL']
+        if self.embedder is None and model_name and not self._embedder_failed:
+            with self._lock:
+                if self.embedder is None and not self._embedder_failed:
+                    try:
+                        self.embedder = load_embedder(model_name)
+                    except Exception as e:
+                        logger.error(f"Error loading chat cache embedding model, similarity tier disabled: {str(e)}")
+                        self._embedder_failed = True
+        return self.embedder
+
+    def _closest(self, vector):
+        """Key of the most similar cached question above the threshold, or None."""
+        with self._lock:
+            if self._vectors is None:
+                return None
+            similarities = self._vectors @ vector
+            best = int(similarities.argmax())
+            if similarities[best] < settings.CHAT_CACHE_SETTINGS['SIMILARITY_THRESHOLD']:
+                return None
+            return self._keys[best]
+
+    def _forget(self, key):
+        with self._lock:
+            if key in self._keys:
+                index = self._keys.index(key)
+                del self._keys[index]
+                self._vectors = np.delete(self._vectors, index, axis=0) if self._keys else None
+
+    def peek(self, question):
+        return self.cache.get(self._key(question)) is not None
+
+    def lookup(self, question):
+        """Return (answer, 'exact' | 'similar') or (None, None)."""
+        answer = self.cache.get(self._key(question))
+        if answer is not None:
+            self._count('hits')
+            return answer, 'exact'
+
+        embedder = self._get_embedder()
+        if embedder is not None:
+            key = self._closest(embedder([normalize_question(question)])[0])
+            if key is not None:
+                answer = self.cache.get(key)
+                if answer is not None:
+                    self._count('similar_hits')
+                    return answer, 'similar'
+                # Expired or evicted from the exact tier
+                self._forget(key)
+
+        self._count('misses')
+        return None, None
+
+    def store(self, question, answer):
+        key = self._key(question)
+        cache_settings = settings.CHAT_CACHE_SETTINGS
+        self.cache.set(key, answer, cache_settings['TTL'])
+        self._count('stores')
+
+        embedder = self._get_embedder()
+        if embedder is None:
+            return
+        vector = embedder([normalize_question(question)])[0]
+        with self._lock:
+            if key in self._keys:
+                return
+            self._keys.append(key)
+            self._vectors = vector[None, :] if self._vectors is None else np.vstack([self._vectors, vector])
+            # Oldest questions go first
+            overflow = len(self._keys) - cache_settings['MAX_EMBEDDINGS']
+            if overflow > 0:
+                del self._keys[:overflow]
+                self._vectors = self._vectors[overflow:]
+
+    def stats(self):
+        counts = self.cache.get_many([f'{self.version}:stats:{stat}' for stat in STAT_NAMES])
+        stats = {stat: counts.get(f'{self.version}:stats:{stat}', 0) for stat in STAT_NAMES}
+        lookups = stats['hits'] + stats['similar_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['hits'] + stats['similar_hits']) / lookups, 3) if lookups else None
+        stats['embedded_questions'] = len(self._keys)
+        return stats
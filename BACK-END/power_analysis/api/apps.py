@@ -6,6 +6,12 @@ class ApiConfig(AppConfig):
     name = "api"
 
     def ready(self):
-        # Initialize chat model when Django starts
-        from .chat_model import ChatModel
-        ChatModel()
+        from django.db.models.signals import post_migrate
+        from .search import ensure_search_index
+        post_migrate.connect(ensure_search_index, sender=self)
+
+        # Cache invalidation on measurement/transformer writes
+        from . import signals  # noqa: F401
+
+        # The chat model is loaded by the WSGI/ASGI entry points, not here, so
+        # migrate, other commands and the test runner start without it
@@ -0,0 +1,230 @@
+import heapq
+import io
+import logging
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import groupby
+import numpy as np
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from .dga import evaluate_dga, DGA_GASES
+from .models import MeasurementAnomaly, MeasurementArchive, TransformerMeasurement
+
+logger = logging.getLogger(__name__)
+
+# Values stored per archived measurement; timestamps are kept as UTC microseconds
+ARCHIVE_INT_COLUMNS = ['id', 'timestamp', 'change_seq']
+ARCHIVE_FLOAT_COLUMNS = ['co', 'h2', 'c2h2', 'c2h4', 'fdd', 'rul', 'temperature']
+ARCHIVE_COLUMNS = ARCHIVE_INT_COLUMNS + ARCHIVE_FLOAT_COLUMNS
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _to_micros(value):
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def _from_micros(value):
+    return EPOCH + timedelta(microseconds=int(value))
+
+
+def next_month(value):
+    return (value.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def pack_chunk(columns):
+    """Compress a dict of column arrays into the bytes stored in MeasurementArchive.data."""
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **columns)
+    return buffer.getvalue()
+
+
+def unpack_chunk(data):
+    """Inverse of pack_chunk."""
+    with np.load(io.BytesIO(bytes(data)), allow_pickle=False) as archive:
+        return {name: archive[name] for name in ARCHIVE_COLUMNS}
+
+
+def _rows_to_columns(rows):
+    """Turn values_list(*ARCHIVE_COLUMNS) tuples into typed column arrays (None becomes NaN)."""
+    columns = {}
+    for i, name in enumerate(ARCHIVE_COLUMNS):
+        if name == 'timestamp':
+            columns[name] = np.fromiter((_to_micros(row[i]) for row in rows), dtype=np.int64, count=len(rows))
+        elif name in ARCHIVE_INT_COLUMNS:
+            columns[name] = np.fromiter((row[i] for row in rows), dtype=np.int64, count=len(rows))
+        else:
+            columns[name] = np.array([row[i] for row in rows], dtype=np.float64)
+    return columns
+
+
+def _merge_columns(existing, new):
+    """Append new rows to a chunk, keeping it sorted by (timestamp, id)."""
+    merged = {name: np.concatenate([existing[name], new[name]]) for name in ARCHIVE_COLUMNS}
+    order = np.lexsort((merged['id'], merged['timestamp']))
+    return {name: values[order] for name, values in merged.items()}
+
+
+def archive_cutoff(age_days=None):
+    """First day of the month before which measurements are archived; only whole months move."""
+    age_days = settings.ARCHIVE_SETTINGS['AGE_DAYS'] if age_days is None else age_days
+    cutoff = timezone.now() - timedelta(days=age_days)
+    return cutoff.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _delete_archived(ids, using):
+    """
+    Remove archived rows from the hot table with a plain DELETE, without delete signals.
+
+    The rows are not gone for the user: date-range lists, exports and the
+    series endpoint still read them from the archive. A tombstone would make
+    delta-sync clients drop readings that still exist, and a version bump per
+    row would make them refetch for nothing; compact_measurements bumps each
+    user's version once instead, for the hot lists' ETags.
+    """
+    table = connections[using].ops.quote_name(TransformerMeasurement._meta.db_table)
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE id IN ({placeholders})', ids)
+
+
+def archive_transformer_month(transformer_id, month, batch_size):
+    """
+    Move one transformer-month of hot measurements into its archive chunk.
+
+    Each batch is its own short transaction: read up to ``batch_size`` rows,
+    merge them into the chunk, then delete them from the hot table.
+    Returns the number of rows moved.
+    """
+    start = datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc)
+    end = datetime(next_month(month).year, next_month(month).month, 1, tzinfo=dt_timezone.utc)
+    moved = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                TransformerMeasurement.objects.filter(
+                    transformer_id=transformer_id, timestamp__gte=start, timestamp__lt=end
+                ).order_by('timestamp', 'id').values_list(*ARCHIVE_COLUMNS)[:batch_size]
+            )
+            if not rows:
+                break
+
+            new = _rows_to_columns(rows)
+            archive = MeasurementArchive.objects.select_for_update().filter(
+                transformer_id=transformer_id, month=month
+            ).first()
+            if archive is None:
+                archive = MeasurementArchive(transformer_id=transformer_id, month=month)
+                columns = new
+            else:
+                columns = _merge_columns(unpack_chunk(archive.data), new)
+
+            archive.data = pack_chunk(columns)
+            archive.row_count = len(columns['id'])
+            archive.first_timestamp = _from_micros(columns['timestamp'][0])
+            archive.last_timestamp = _from_micros(columns['timestamp'][-1])
+            archive.save()
+
+            ids = [row[0] for row in rows]
+            # Anomalies outlive the row and keep their own timestamp
+            MeasurementAnomaly.objects.filter(measurement_id__in=ids).update(measurement=None)
+            _delete_archived(ids, archive._state.db)
+        moved += len(rows)
+    return moved
+
+
+def _chunk_mask(data, start_date=None, end_date=None, gases=None):
+    """Vectorized version of the list endpoint's date-range and gas filters."""
+    mask = np.ones(len(data['id']), dtype=bool)
+    if start_date:
+        mask &= data['timestamp'] >= _to_micros(datetime.combine(start_date, datetime.min.time(), dt_timezone.utc))
+    if end_date:
+        mask &= data['timestamp'] < _to_micros(datetime.combine(end_date + timedelta(days=1), datetime.min.time(), dt_timezone.utc))
+    if gases:
+        mask &= np.logical_or.reduce([data[gas] > 0 for gas in gases])
+    return mask
+
+
+def _chunk_rows(archive, columns, start_date=None, end_date=None, gases=None, descending=False):
+    """Return the rows of one archive chunk as tuples of ``columns``, filtered like the list endpoint."""
+    data = unpack_chunk(archive.data)
+    mask = _chunk_mask(data, start_date, end_date, gases)
+    count = int(mask.sum())
+
+    dga = None
+    if 'dga_condition' in columns or 'dga_fault' in columns:
+        # Derived from the stored gases rather than kept in the chunk
+        dga = dict(zip(('dga_condition', 'dga_fault'), evaluate_dga({gas: data[gas][mask] for gas in DGA_GASES})))
+
+    values = []
+    for name in columns:
+        if dga is not None and name in dga:
+            values.append(dga[name].tolist())
+        elif name == 'transformer_id':
+            values.append([archive.transformer_id] * count)
+        elif name == 'transformer__name':
+            values.append([archive.transformer.name] * count)
+        elif name == 'timestamp':
+            values.append([_from_micros(v) for v in data['timestamp'][mask]])
+        elif name in ARCHIVE_INT_COLUMNS:
+            values.append(data[name][mask].tolist())
+        else:
+            # NaN was stored for missing values
+            values.append([None if v != v else v for v in data[name][mask].tolist()])
+
+    rows = list(zip(*values))
+    if descending:
+        rows.reverse()
+    return rows
+
+
+def _user_archives(user, transformer_ids=None, start_date=None, end_date=None):
+    archives = MeasurementArchive.objects.filter(transformer__user=user)
+    if transformer_ids is not None:
+        archives = archives.filter(transformer_id__in=transformer_ids)
+    if start_date:
+        archives = archives.filter(last_timestamp__date__gte=start_date)
+    if end_date:
+        archives = archives.filter(first_timestamp__date__lte=end_date)
+    return archives
+
+
+def _valid_gases(gases):
+    return [gas for gas in (gases or []) if gas in ARCHIVE_FLOAT_COLUMNS]
+
+
+def iter_archived_rows(user, columns, transformer_ids=None, start_date=None, end_date=None, gases=None, descending=False):
+    """
+    Yield archived measurements of ``user`` as ``values_list(*columns)``-style tuples, in time order.
+
+    Chunks are read one month at a time; the chunks of a month are merged by
+    timestamp so rows from different transformers interleave as in the hot table.
+    """
+    gases = _valid_gases(gases)
+    archives = _user_archives(user, transformer_ids, start_date, end_date).select_related('transformer')
+    archives = archives.order_by('-month' if descending else 'month', 'transformer_id')
+
+    ts_index = columns.index('timestamp') if 'timestamp' in columns else None
+    for _, month_archives in groupby(archives.iterator(chunk_size=50), key=lambda a: a.month):
+        streams = [
+            _chunk_rows(archive, columns, start_date, end_date, gases, descending)
+            for archive in month_archives
+        ]
+        if ts_index is None or len(streams) == 1:
+            for stream in streams:
+                yield from stream
+        else:
+            yield from heapq.merge(*streams, key=lambda row: row[ts_index], reverse=descending)
+
+
+def count_archived_rows(user, transformer_ids=None, start_date=None, end_date=None, gases=None):
+    """Number of archived rows matching the filters; uses the stored counts when no row filter applies."""
+    gases = _valid_gases(gases)
+    archives = _user_archives(user, transformer_ids, start_date, end_date)
+    if not (start_date or end_date or gases):
+        return archives.aggregate(total=Sum('row_count'))['total'] or 0
+    return sum(
+        int(_chunk_mask(unpack_chunk(data), start_date, end_date, gases).sum())
+        for data in archives.values_list('data', flat=True).iterator(chunk_size=50)
+    )
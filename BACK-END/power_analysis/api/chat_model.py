@@ -1,21 +1,88 @@
-from transformers import pipeline
+from transformers import AutoTokenizer, pipeline
 import threading
 import logging
 import torch
 import asyncio
 import re
+import uuid
+import hashlib
+import time
 from django.conf import settings
-from concurrent.futures import ThreadPoolExecutor
-from functools import partial
+from .answer_cache import AnswerCache
+from .generation import GenerationScheduler
+from .quantization import load_quantized_model
 
 logger = logging.getLogger(__name__)
 
+class _IncrementalText:
+    """
+    Decode a growing list of token ids into the newly completed text.
+
+    Only a short trailing window is decoded per token, as in transformers'
+    streamers: the tokens already sent before ``read_offset`` are decoded
+    again from ``prefix_offset`` for context (leading spaces and merges
+    depend on it), and the new text is what the window adds beyond them.
+    """
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.token_ids = []
+        self.prefix_offset = 0
+        self.read_offset = 0
+
+    def push(self, token_id):
+        self.token_ids.append(token_id)
+        prefix = self.tokenizer.decode(self.token_ids[self.prefix_offset:self.read_offset], skip_special_tokens=True)
+        text = self.tokenizer.decode(self.token_ids[self.prefix_offset:], skip_special_tokens=True)
+        # Hold back half of a multi-byte character until its other tokens arrive
+        if len(text) <= len(prefix) or text.endswith('\ufffd'):
+            return ''
+        self.prefix_offset, self.read_offset = self.read_offset, len(self.token_ids)
+        return text[len(prefix):]
+
+
+# Stream id -> (user id, cancel event) for generations running in this process
+_active_streams = {}
+
+
+def open_stream(user_id):
+    stream_id = uuid.uuid4().hex
+    cancel_event = threading.Event()
+    _active_streams[stream_id] = (user_id, cancel_event)
+    return stream_id, cancel_event
+
+
+def cancel_stream(user_id, stream_id):
+    """Ask a running generation to stop; False if the user has no such stream here."""
+    owner, cancel_event = _active_streams.get(stream_id, (None, None))
+    if owner != user_id:
+        return False
+    cancel_event.set()
+    return True
+
+
+def close_stream(stream_id):
+    _active_streams.pop(stream_id, None)
+
+
+class ModelNotReady(RuntimeError):
+    """The model has not finished loading in this process (or is not loaded here at all)."""
+
+
 class ChatModel:
     _instance = None
     _pipeline = None
     _lock = threading.Lock()
-    _is_loading = False
-    _executor = ThreadPoolExecutor(max_workers=1)
+    _load_lock = threading.Lock()
+    # 'idle', 'disabled', 'loading' or 'failed'; load_state() reports 'ready' once the pipeline is set
+    _load_state = 'idle'
+    _load_error = None
+    _load_seconds = None
+    _scheduler = None
+    _answer_cache = None
+    _worker = None
+
+    MODEL_NAME = "Gensyn/Qwen2.5-0.5B-Instruct"
 
     # Add system prompt
     SYSTEM_PROMPT = """You are an expert electrical engineer specializing in power transformers with extensive knowledge of their design, operation, maintenance, and fault diagnosis. 
@@ -35,17 +102,103 @@ IMPORTANT: Limit your responses strictly to power transformer engineering. If as
 # IMPORTANT: Limit your responses strictly to power transformer engineering. If asked about unrelated topics, politely redirect the conversation back to power transformer topics. Do not provide information about subjects unrelated to power transformers."""
 
     def __new__(cls):
+        # Cheap: the model itself is loaded by load() or start_loading()
         if cls._instance is None:
             with cls._lock:
                 if cls._instance is None:
                     cls._instance = super(ChatModel, cls).__new__(cls)
-                    cls._is_loading = True
-                    try:
-                        cls._load_model()
-                    finally:
-                        cls._is_loading = False
         return cls._instance
 
+    @classmethod
+    def worker(cls):
+        """Client of the inference worker when AI_MODEL_SETTINGS['WORKER_SOCKET'] is set, else None."""
+        path = settings.AI_MODEL_SETTINGS['WORKER_SOCKET']
+        if not path:
+            return None
+        if cls._worker is None or cls._worker.path != path:
+            from .inference import InferenceClient
+            cls._worker = InferenceClient(path, timeout=settings.AI_MODEL_SETTINGS['WORKER_TIMEOUT'])
+        return cls._worker
+
+    @classmethod
+    def local_status(cls):
+        """Load state of the model in this process."""
+        ready = cls._pipeline is not None
+        return {
+            'state': 'ready' if ready else cls._load_state,
+            'ready': ready,
+            'load_seconds': cls._load_seconds,
+        }
+
+    @classmethod
+    def status(cls):
+        """Load state of the model that serves this process: the inference worker's, if there is one."""
+        worker = cls.worker()
+        return worker.status() if worker else cls.local_status()
+
+    @classmethod
+    def is_ready(cls):
+        return cls.status()['ready']
+
+    @classmethod
+    def load_state(cls):
+        return cls.status()['state']
+
+    @classmethod
+    def scheduler_stats(cls):
+        worker = cls.worker()
+        if worker:
+            return worker.scheduler_stats()
+        return cls._scheduler.stats() if cls._scheduler else None
+
+    @classmethod
+    def load(cls):
+        """Load the model in this thread, once; raises if loading fails."""
+        with cls._load_lock:
+            if cls._pipeline is not None:
+                return
+            cls._load_state, cls._load_error = 'loading', None
+            start = time.perf_counter()
+            try:
+                cls._load_model()
+            except Exception as e:
+                cls._load_state, cls._load_error = 'failed', str(e)
+                raise
+            cls._load_seconds = round(time.perf_counter() - start, 1)
+
+    @classmethod
+    def start_loading(cls):
+        """
+        Load the model on a background thread, unless AI_MODEL_SETTINGS['LOAD_ON_STARTUP'] is off.
+
+        Called by the WSGI and ASGI entry points once the server starts (never
+        at import), so only serving processes pay for the model; management
+        commands and tests never load it. Returns
+        the thread, or None when loading is disabled or already under way.
+        """
+        if cls.worker():
+            logger.info("Chat generation runs in the inference worker, not loading the model here")
+            return None
+        if not settings.AI_MODEL_SETTINGS['LOAD_ON_STARTUP']:
+            cls._load_state = 'disabled'
+            logger.info("Chat model loading disabled, chat requests will get 503 unless answered from the cache")
+            return None
+        with cls._lock:
+            if cls._pipeline is not None or cls._load_state == 'loading':
+                return None
+            cls._load_state = 'loading'
+
+        def run():
+            try:
+                cls.load()
+            except Exception:
+                # Already logged; load_state() reports 'failed'
+                pass
+
+        thread = threading.Thread(target=run, name='chat-model-loader', daemon=True)
+        thread.start()
+        return thread
+
     @classmethod
     def _load_model(cls):
         """Load the model pipeline only once"""
@@ -56,18 +209,34 @@ IMPORTANT: Limit your responses strictly to power transformer engineering. If as
             if device == "cuda":
                 torch.cuda.empty_cache()
                 torch.backends.cudnn.benchmark = True
+            elif settings.AI_MODEL_SETTINGS['CPU_THREADS']:
+                # Leave cores to the web workers and the scheduler thread
+                torch.set_num_threads(settings.AI_MODEL_SETTINGS['CPU_THREADS'])
 
-            cls._pipeline = pipeline(
-                "text-generation", 
-                model="Gensyn/Qwen2.5-0.5B-Instruct",
-                device=device,
-                torch_dtype=torch.float16 if device == "cuda" else torch.float32,
-                model_kwargs={
-                    "cache_dir": ".model_cache",
-                    "max_memory": {0: f"{settings.AI_MODEL_SETTINGS['MAX_CACHE_SIZE']}"} if device == "cuda" else None
-                }
-            )
+            quantization = settings.AI_MODEL_SETTINGS['CPU_QUANTIZATION']
+            if device == "cpu" and quantization:
+                text_pipeline = pipeline(
+                    "text-generation",
+                    model=load_quantized_model(cls.MODEL_NAME, quantization),
+                    tokenizer=AutoTokenizer.from_pretrained(cls.MODEL_NAME, cache_dir=".model_cache"),
+                    device=device,
+                )
+            else:
+                text_pipeline = pipeline(
+                    "text-generation", 
+                    model=cls.MODEL_NAME,
+                    device=device,
+                    torch_dtype=torch.float16 if device == "cuda" else torch.float32,
+                    model_kwargs={
+                        "cache_dir": ".model_cache",
+                        "max_memory": {0: f"{settings.AI_MODEL_SETTINGS['MAX_CACHE_SIZE']}"} if device == "cuda" else None
+                    }
+                )
             logger.info("Qwen2.5 model pipeline loaded successfully")
+            # Encodes the system prompt once, every request starts from its key/value cache
+            cls._scheduler = cls._create_scheduler(text_pipeline)
+            # Set last: requests are accepted from here on
+            cls._pipeline = text_pipeline
         except Exception as e:
             logger.error(f"Error loading model: {str(e)}")
             raise
@@ -85,59 +254,183 @@ IMPORTANT: Limit your responses strictly to power transformer engineering. If as
     def _format_conversation(self, messages):
         """Format conversation history into a prompt string"""
         formatted = self.SYSTEM_PROMPT + "\n\n"
-        for msg in messages[-settings.AI_MODEL_SETTINGS['CONTEXT_WINDOW']:]:
+        # The caller picks the window; slicing here would shift the prompt prefix every turn
+        for msg in messages:
             role = "assistant" if msg['role'] == 'assistant' else "user"
             content = msg['content'].strip()
             formatted += f"{role}: {content}\n"
         return formatted.strip()
 
-    async def generate_response(self, input_text: str, context: list = None) -> str:
+    def _build_prompt(self, input_text, context=None):
+        # Format the conversation including context
+        if context:
+            return self._format_conversation(context) + f"\nuser: {input_text}\nassistant:"
+        return self.SYSTEM_PROMPT + f"\n\nuser: {input_text}\nassistant:"
+
+    def _generation_kwargs(self):
+        return dict(
+            max_new_tokens=settings.AI_MODEL_SETTINGS['MAX_LENGTH'],
+            temperature=settings.AI_MODEL_SETTINGS['TEMPERATURE'],
+            top_p=settings.AI_MODEL_SETTINGS['TOP_P'],
+        )
+
+    @classmethod
+    def _create_scheduler(cls, text_pipeline):
+        """Continuous-batching scheduler over a loaded pipeline, with the system prompt pre-encoded."""
+        tokenizer = text_pipeline.tokenizer
+        # Chat models end a turn with their own token as well as the tokenizer's EOS
+        eos_token_ids = text_pipeline.model.generation_config.eos_token_id
+        if not isinstance(eos_token_ids, (list, tuple)):
+            eos_token_ids = [eos_token_ids]
+        return GenerationScheduler(
+            text_pipeline.model,
+            eos_token_ids={tokenizer.eos_token_id, *eos_token_ids} - {None},
+            pad_token_id=tokenizer.pad_token_id,
+            max_batch_size=settings.AI_MODEL_SETTINGS['MAX_BATCH_SIZE'],
+            batch_wait=settings.AI_MODEL_SETTINGS['BATCH_WAIT_MS'] / 1000,
+            prefix_cache_tokens=settings.AI_MODEL_SETTINGS['PREFIX_CACHE_TOKENS'],
+            pinned_prefixes={'system': tokenizer(cls.SYSTEM_PROMPT + "\n\n")['input_ids']},
+        )
+
+    @classmethod
+    def get_answer_cache(cls):
+        """Answer cache versioned by model, system prompt and sampling settings, so a change to any of them starts afresh."""
+        model_settings = settings.AI_MODEL_SETTINGS
+        version = hashlib.sha1('|'.join([
+            cls.MODEL_NAME, cls.SYSTEM_PROMPT, model_settings['CPU_QUANTIZATION'],
+            str(model_settings['MAX_LENGTH']), str(model_settings['TEMPERATURE']), str(model_settings['TOP_P']),
+        ]).encode()).hexdigest()[:12]
+        if cls._answer_cache is None or cls._answer_cache.version != version:
+            cls._answer_cache = AnswerCache(version)
+        return cls._answer_cache
+
+    def has_cached_answer(self, input_text):
+        """Whether a first question can be answered without the model (exact tier only; no stats counted)."""
+        answer_cache = self.get_answer_cache()
+        return bool(answer_cache.eligible(input_text)) and answer_cache.peek(input_text)
+
+    @classmethod
+    def _get_scheduler(cls):
+        if cls._scheduler is None:
+            with cls._lock:
+                if cls._scheduler is None:
+                    cls._scheduler = cls._create_scheduler(cls._pipeline)
+        return cls._scheduler
+
+    async def stream_response(self, input_text: str, context: list = None, cancel_event=None, metrics=None,
+                              conversation_id=None):
         """
-        Generate a response asynchronously for the given input text
+        Yield the response in text chunks as the model generates them
         Args:
             input_text: The user's input text
-            context: List of previous messages for context
+            context: List of previous messages for context, oldest first
+            cancel_event: threading.Event; setting it stops generation after the current token
+            metrics: Optional dict, filled with the request's queue wait, time to first token and tokens/sec at the end
+            conversation_id: Keeps this exchange's key/value cache for the conversation's next prompt
         """
-        while self._is_loading:
-            await asyncio.sleep(0.1)
+        # Context-free first questions are answered from the cache, even before the model is ready
+        answer_cache = self.get_answer_cache()
+        cacheable = answer_cache.eligible(input_text, context)
+        if cacheable:
+            answer, kind = await asyncio.to_thread(answer_cache.lookup, input_text)
+            if metrics is not None:
+                metrics['cache'] = kind or 'miss'
+            if answer is not None:
+                yield answer
+                return
 
-        if not self._pipeline:
-            raise RuntimeError("Model pipeline not initialized properly")
+        cancel_event = cancel_event or threading.Event()
+        request_metrics = {}
+        worker = self.worker()
+        if worker:
+            chunks_source = worker.stream(input_text, context, cancel_event, request_metrics, conversation_id)
+        else:
+            chunks_source = self.generate_tokens(input_text, context, cancel_event, request_metrics, conversation_id)
 
+        finished = False
+        chunks = []
         try:
-            # Format the conversation including context
-            if context:
-                prompt = self._format_conversation(context) + f"\nuser: {input_text}\nassistant:"
-            else:
-                prompt = self.SYSTEM_PROMPT + f"\n\nuser: {input_text}\nassistant:"
-
-            # Run model inference in thread pool to prevent blocking
-            loop = asyncio.get_event_loop()
-            with self._lock:
-                outputs = await loop.run_in_executor(
-                    self._executor,
-                    partial(
-                        self._pipeline,
-                        prompt,
-                        max_new_tokens=settings.AI_MODEL_SETTINGS['MAX_LENGTH'],
-                        temperature=settings.AI_MODEL_SETTINGS['TEMPERATURE'],
-                        do_sample=True,
-                        top_p=settings.AI_MODEL_SETTINGS['TOP_P'],
-                        num_return_sequences=1,
-                        pad_token_id=self._pipeline.tokenizer.eos_token_id
-                    )
-                )
+            async for chunk in chunks_source:
+                chunks.append(chunk)
+                yield chunk
+            finished = True
+            answer = self._clean_response(''.join(chunks))
+            # A cancelled answer is incomplete, do not serve it to anyone else
+            if cacheable and answer and not cancel_event.is_set():
+                await asyncio.to_thread(answer_cache.store, input_text, answer)
+        finally:
+            if not finished:
+                # The consumer went away (e.g. the client disconnected): stop generating
+                cancel_event.set()
+            await chunks_source.aclose()
+            logger.info(f"Chat generation: {request_metrics}")
+            if metrics is not None:
+                metrics.update(request_metrics)
 
-            # Extract and clean the generated text
-            if isinstance(outputs, list) and len(outputs) > 0:
-                generated_text = outputs[0]['generated_text']
-                # Remove the prompt and clean the response
-                response = generated_text[len(prompt):].strip()
-                cleaned_response = self._clean_response(response)
-                return cleaned_response if cleaned_response else "I apologize, but I couldn't generate a proper response. Please try again."
-            else:
-                raise ValueError("No response generated by the model")
+    async def generate_tokens(self, input_text, context, cancel_event, metrics, conversation_id=None):
+        """Generate with the model loaded in this process, yielding text chunks; fills ``metrics`` at the end."""
+        if self._pipeline is None:
+            raise ModelNotReady(f"Chat model is not ready ({self._load_state})")
+
+        prompt = self._build_prompt(input_text, context)
+        tokenizer = self._pipeline.tokenizer
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        end = object()
+        text = _IncrementalText(tokenizer)
+
+        # Both callbacks run on the scheduler thread
+        def on_token(token_id):
+            chunk = text.push(token_id)
+            if chunk:
+                loop.call_soon_threadsafe(queue.put_nowait, chunk)
+
+        def on_finish(error):
+            loop.call_soon_threadsafe(queue.put_nowait, error or end)
+
+        request = self._get_scheduler().submit(
+            tokenizer(prompt)['input_ids'],
+            on_token=on_token,
+            on_finish=on_finish,
+            cancel_event=cancel_event,
+            cache_key=conversation_id,
+            **self._generation_kwargs()
+        )
+
+        finished = False
+        try:
+            while True:
+                chunk = await queue.get()
+                if chunk is end:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+            finished = True
+        finally:
+            if not finished:
+                cancel_event.set()
+            metrics.update(request.metrics())
+
+    async def generate_response(self, input_text: str, context: list = None, metrics=None,
+                                conversation_id=None) -> str:
+        """
+        Generate a response asynchronously for the given input text
+        Args:
+            input_text: The user's input text
+            context: List of previous messages for context, oldest first
+            metrics: Optional dict, filled with the request's queue wait, time to first token and tokens/sec
+            conversation_id: Keeps this exchange's key/value cache for the conversation's next prompt
+        """
+        try:
+            # Concurrent requests share decode steps in the scheduler instead of queueing behind a lock
+            chunks = [
+                chunk async for chunk in
+                self.stream_response(input_text, context, metrics=metrics, conversation_id=conversation_id)
+            ]
+            cleaned_response = self._clean_response(''.join(chunks))
+            return cleaned_response if cleaned_response else "I apologize, but I couldn't generate a proper response. Please try again."
 
         except Exception as e:
             logger.error(f"Error generating response: {str(e)}")
-            raise
\ No newline at end of file
+            raise
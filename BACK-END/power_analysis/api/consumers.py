@@ -0,0 +1,37 @@
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from .push import STAFF_GROUP, user_group
+
+
+class EventConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Per-user push channel.
+
+    The user comes from the Django session cookie (AuthMiddlewareStack in
+    asgi.py); anonymous sockets are closed with 4401. Every socket joins the
+    user's group, staff sockets also join the staff group. Events are published by api.push after the writing transaction
+    commits and are forwarded to the browser unchanged.
+    """
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=4401)
+            return
+        self.groups_joined = [user_group(user.id)]
+        if user.is_staff:
+            self.groups_joined.append(STAFF_GROUP)
+        for group in self.groups_joined:
+            await self.channel_layer.group_add(group, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        for group in getattr(self, 'groups_joined', []):
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        # Clients only listen; a ping keeps intermediaries from closing idle sockets
+        if content.get('type') == 'ping':
+            await self.send_json({'type': 'pong'})
+
+    async def push_event(self, message):
+        await self.send_json(message['event'])
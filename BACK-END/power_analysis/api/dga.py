@@ -0,0 +1,111 @@
+import logging
+import operator
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DGA_GASES = ['h2', 'co', 'c2h2', 'c2h4']
+
+# IEEE C57.104-2008 Table 1: upper bounds (ppm) of conditions 1, 2 and 3;
+# anything above the last bound is condition 4
+DGA_LIMITS = {
+    'h2': (100, 700, 1800),
+    'co': (350, 570, 1400),
+    'c2h2': (1, 9, 35),
+    'c2h4': (50, 100, 200),
+}
+
+# Fault rules in priority order, the first match wins. Each condition is
+# (gas or 'gas/gas' ratio, operator, threshold); the string 'limit' stands for
+# the gas's condition 1 bound. Ratio bounds follow IEC 60599 Table 1 as far as
+# the four measured gases allow (no CH4/C2H6, so no Duval triangle or full Rogers code).
+# Table 1 separates D1 (C2H2/C2H4 > 1) from D2 (0.6-2.5) by CH4/H2 and
+# C2H4/C2H6, which are not measured, so the overlap 1-2.5 is classed D1.
+DGA_RULES = [
+    ('D1', 'Low-energy discharge', [('c2h2', '>', 'limit'), ('c2h2/c2h4', '>', 1)]),
+    ('D2', 'High-energy discharge', [('c2h2', '>', 'limit'), ('c2h2/c2h4', '>=', 0.6)]),
+    ('T', 'Thermal fault in oil', [('c2h4', '>', 'limit'), ('c2h2/c2h4', '<', 0.2)]),
+    ('PD', 'Partial discharge', [('h2', '>', 'limit'), ('c2h4', '<=', 'limit'), ('c2h2', '<=', 'limit')]),
+    ('C', 'Paper (cellulose) overheating', [('co', '>', 'limit')]),
+    ('DT', 'Mixed thermal and electrical fault', [('h2', '>', 'limit')]),
+    ('DT', 'Mixed thermal and electrical fault', [('c2h2', '>', 'limit')]),
+    ('DT', 'Mixed thermal and electrical fault', [('c2h4', '>', 'limit')]),
+]
+DGA_NORMAL = 'N'
+
+DGA_FAULTS = {DGA_NORMAL: 'Normal'}
+DGA_FAULTS.update({code: description for code, description, _ in DGA_RULES})
+
+_OPERATORS = {'>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le}
+
+
+def _ratio(numerator, denominator):
+    """Element-wise ratio where x/0 is +inf for x > 0 and 0/0 is NaN (matches no rule)."""
+    out = np.where(numerator > 0, np.inf, np.nan)
+    np.divide(numerator, denominator, out=out, where=denominator > 0)
+    return out
+
+
+def _compile_condition(expression, op, threshold):
+    if '/' in expression:
+        numerator, denominator = expression.split('/')
+        operand = lambda gases: _ratio(gases[numerator], gases[denominator])
+    else:
+        operand = lambda gases: gases[expression]
+    if threshold == 'limit':
+        threshold = DGA_LIMITS[expression][0]
+    compare = _OPERATORS[op]
+    # Missing readings are NaN, and every comparison with NaN is False
+    return lambda gases: compare(operand(gases), threshold)
+
+
+def compile_rules(rules):
+    """Turn a declarative rule list into (codes, [mask function]) for np.select."""
+    codes, predicates = [], []
+    for code, _, conditions in rules:
+        compiled = [_compile_condition(*condition) for condition in conditions]
+        predicates.append(lambda gases, compiled=compiled: np.logical_and.reduce([c(gases) for c in compiled]))
+        codes.append(code)
+    return codes, predicates
+
+
+_COMPILED_RULES = compile_rules(DGA_RULES)
+
+
+def evaluate_dga(gases):
+    """
+    Evaluate the rule set over whole columns at once.
+
+    Args:
+        gases: Dict of gas name -> array-like of ppm values (None/NaN for missing)
+    Returns:
+        (conditions, faults): int array of IEEE conditions 1-4 and an array of fault codes
+    """
+    gases = {gas: np.asarray(gases[gas], dtype=np.float64) for gas in DGA_GASES}
+    size = len(gases[DGA_GASES[0]])
+
+    # Overall condition is the worst individual gas condition
+    condition = np.ones(size, dtype=np.int64)
+    for gas, bounds in DGA_LIMITS.items():
+        values = np.nan_to_num(gases[gas], nan=0.0)
+        condition = np.maximum(condition, np.searchsorted(bounds, values, side='left') + 1)
+
+    codes, predicates = _COMPILED_RULES
+    if not size:
+        return condition, np.array([], dtype=object)
+    faults = np.select([predicate(gases) for predicate in predicates], codes, default=DGA_NORMAL)
+    return condition, faults
+
+
+def apply_dga(measurements):
+    """Set dga_condition and dga_fault on a batch of (unsaved or loaded) measurements."""
+    measurements = list(measurements)
+    conditions, faults = evaluate_dga({
+        gas: [getattr(m, gas) if getattr(m, gas) is not None else np.nan for m in measurements]
+        for gas in DGA_GASES
+    })
+    for measurement, condition, fault in zip(measurements, conditions.tolist(), faults.tolist()):
+        measurement.dga_condition = condition
+        measurement.dga_fault = fault
+    return measurements
+
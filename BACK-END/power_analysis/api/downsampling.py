@@ -0,0 +1,174 @@
+import logging
+from itertools import chain
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Columns returned for every point of a downsampled series
+SERIES_FIELDS = ['id', 'transformer_id', 'timestamp', 'co', 'h2', 'c2h2', 'c2h4', 'fdd', 'rul', 'temperature']
+# Numeric columns that can drive the point selection
+VALUE_FIELDS = ['h2', 'co', 'c2h2', 'c2h4', 'fdd', 'rul', 'temperature']
+GAS_FIELDS = ['h2', 'co', 'c2h2', 'c2h4']
+
+DOWNSAMPLING_METHODS = ('lttb', 'minmax')
+DEFAULT_POINTS = 1000
+MAX_POINTS = 10000
+MIN_POINTS = 3
+
+
+class _RowWindow:
+    """
+    Sliding window over a row iterator.
+
+    Rows are pulled from the database cursor only when a bucket needs them and
+    dropped once the bucket has been reduced, so memory is bounded by the size
+    of two buckets rather than by the length of the series.
+    """
+
+    def __init__(self, rows):
+        self._rows = rows
+        self._buffer = []
+        self._offset = 0  # absolute index of self._buffer[0]
+
+    def take(self, start, stop):
+        """Return rows [start, stop), reading more from the cursor if needed."""
+        while self._offset + len(self._buffer) < stop:
+            try:
+                self._buffer.append(next(self._rows))
+            except StopIteration:
+                break
+        return self._buffer[max(0, start - self._offset):max(0, stop - self._offset)]
+
+    def release(self, upto):
+        """Forget every row before the absolute index ``upto``."""
+        drop = upto - self._offset
+        if drop > 0:
+            del self._buffer[:drop]
+            self._offset += drop
+
+    def last(self):
+        return self._buffer[-1] if self._buffer else None
+
+
+def _bucket_edges(total, buckets):
+    """Split the interior rows 1..total-2 into ``buckets`` contiguous, non-empty buckets."""
+    buckets = max(1, min(buckets, total - 2))
+    return np.floor(np.linspace(1, total - 1, buckets + 1)).astype(np.int64)
+
+
+def _to_arrays(rows, value_idx):
+    """Convert row tuples to an x vector (epoch seconds) and a (rows, fields) value matrix."""
+    x = np.fromiter((row[2].timestamp() for row in rows), dtype=np.float64, count=len(rows))
+    # None (e.g. a missing fdd/rul) becomes NaN
+    y = np.array([[row[i] for i in value_idx] for row in rows], dtype=np.float64).reshape(len(rows), len(value_idx))
+    return x, y
+
+
+def _lttb(window, total, points, value_idx):
+    """Largest-Triangle-Three-Buckets selection over the streamed rows."""
+    first = window.take(0, 1)
+    selected = [first[0]]
+    a_x, a_y = _to_arrays(first, value_idx)
+    a_x, a_y = a_x[0], np.nan_to_num(a_y[0])
+
+    edges = _bucket_edges(total, points - 2)
+    next_rows = window.take(edges[0], edges[1])
+    next_arrays = _to_arrays(next_rows, value_idx)
+
+    for i in range(len(edges) - 1):
+        rows, (b_x, b_y) = next_rows, next_arrays
+        if not rows:
+            break
+        b_y = np.nan_to_num(b_y)
+
+        # The average of the following bucket (or the final row) is the third vertex
+        if i + 2 < len(edges):
+            next_rows = window.take(edges[i + 1], edges[i + 2])
+        else:
+            next_rows = window.take(total - 1, total)
+        next_arrays = _to_arrays(next_rows, value_idx)
+        if next_rows:
+            c_x = next_arrays[0].mean()
+            c_y = np.nan_to_num(next_arrays[1]).mean(axis=0)
+        else:
+            c_x, c_y = b_x[-1], b_y[-1]
+
+        # Triangle area for every candidate and every field at once: (rows, fields)
+        area = np.abs((a_x - c_x) * (b_y - a_y) - (a_x - b_x)[:, None] * (c_y - a_y))
+
+        # Normalize per field so that every selected gas has the same weight
+        peak = area.max(axis=0)
+        peak[peak == 0] = 1.0
+        best = int(np.argmax((area / peak).sum(axis=1)))
+
+        selected.append(rows[best])
+        a_x, a_y = b_x[best], b_y[best]
+        window.release(edges[i + 1])
+
+    last = window.take(total - 1, total) or [window.last()]
+    if last[0] is not None and last[0] is not selected[-1]:
+        selected.append(last[0])
+    return selected
+
+
+def _minmax(window, total, points, value_idx):
+    """Keep the minimum and maximum of every field in each bucket so spikes are never dropped."""
+    first = window.take(0, 1)
+    selected = [first[0]]
+
+    per_bucket = 2 * len(value_idx)
+    edges = _bucket_edges(total, max(1, (points - 2) // per_bucket))
+
+    for i in range(len(edges) - 1):
+        rows = window.take(edges[i], edges[i + 1])
+        if not rows:
+            break
+        _, y = _to_arrays(rows, value_idx)
+        lows = np.argmin(np.where(np.isnan(y), np.inf, y), axis=0)
+        highs = np.argmax(np.where(np.isnan(y), -np.inf, y), axis=0)
+        # np.unique also sorts, which keeps the bucket in time order
+        for idx in np.unique(np.concatenate([lows, highs])):
+            selected.append(rows[idx])
+        window.release(edges[i + 1])
+
+    last = window.take(total - 1, total) or [window.last()]
+    if last[0] is not None and last[0] is not selected[-1]:
+        selected.append(last[0])
+    return selected
+
+
+def downsample_measurements(queryset, total, points=DEFAULT_POINTS, method='lttb', fields=None, chunk_size=2000, archived_rows=None):
+    """
+    Reduce a time-ordered measurement queryset to roughly ``points`` rows.
+
+    Args:
+        queryset: TransformerMeasurement queryset, already ordered by timestamp
+        total: Number of rows in the queryset
+        points: Target number of points in the result
+        method: 'lttb' (visual shape) or 'minmax' (per-bucket extremes of every field)
+        fields: Value fields that drive the selection, defaults to the four gases
+        chunk_size: Rows fetched per database round trip
+        archived_rows: Optional time-ordered archived rows (SERIES_FIELDS order) that precede the queryset
+    Returns:
+        List of dicts keyed like the measurement serializer, in time order
+    """
+    if method not in DOWNSAMPLING_METHODS:
+        raise ValueError(f"Unknown downsampling method: {method}")
+
+    fields = fields or GAS_FIELDS
+    value_idx = [SERIES_FIELDS.index(f) for f in fields]
+    points = max(MIN_POINTS, min(points, MAX_POINTS))
+
+    rows = queryset.values_list(*SERIES_FIELDS).iterator(chunk_size=chunk_size)
+    if archived_rows is not None:
+        rows = chain(archived_rows, rows)
+    if total <= points:
+        selected = list(rows)
+    else:
+        window = _RowWindow(rows)
+        reducer = _lttb if method == 'lttb' else _minmax
+        selected = reducer(window, total, points, value_idx)
+        logger.debug(f"Downsampled {total} measurements to {len(selected)} points using {method}")
+
+    keys = ['transformer' if f == 'transformer_id' else f for f in SERIES_FIELDS]
+    return [dict(zip(keys, row)) for row in selected]
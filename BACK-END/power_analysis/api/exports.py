@@ -0,0 +1,166 @@
+import csv
+import io
+import logging
+import zlib
+from itertools import chain, islice
+
+logger = logging.getLogger(__name__)
+
+# (header, queryset lookup) for every exported column
+EXPORT_COLUMNS = [
+    ('id', 'id'),
+    ('transformer', 'transformer_id'),
+    ('transformer_name', 'transformer__name'),
+    ('timestamp', 'timestamp'),
+    ('h2', 'h2'),
+    ('co', 'co'),
+    ('c2h2', 'c2h2'),
+    ('c2h4', 'c2h4'),
+    ('fdd', 'fdd'),
+    ('rul', 'rul'),
+    ('temperature', 'temperature'),
+]
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'csv.gz': ('application/gzip', 'csv.gz'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+EXPORT_LOOKUPS = [lookup for _, lookup in EXPORT_COLUMNS]
+
+
+def iter_row_chunks(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield lists of row tuples, reading the queryset with a server-side cursor."""
+    return chunked(queryset.values_list(*EXPORT_LOOKUPS).iterator(chunk_size=chunk_size), chunk_size)
+
+
+def chunked(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """Group any row iterator into lists of at most ``chunk_size`` rows."""
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def stream_csv(chunks):
+    """Encode row chunks as CSV, one output block per chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([header for header, _ in EXPORT_COLUMNS])
+    for chunk in chunks:
+        writer.writerows(
+            [row[:3] + (row[3].isoformat(),) + row[4:] for row in chunk]
+        )
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate(0)
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def stream_gzip(blocks):
+    """Gzip a stream of byte blocks without holding the whole file in memory."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip header
+    for block in blocks:
+        data = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+class _ParquetSink(io.RawIOBase):
+    """Write-only file object that hands written bytes back to the response as they arrive."""
+
+    def __init__(self):
+        self._blocks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._blocks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        # ParquetWriter records absolute offsets in the footer, so keep counting after drains
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._blocks)
+        self._blocks = []
+        return data
+
+
+def stream_parquet(chunks):
+    """Encode row chunks as Parquet, writing one row group per chunk."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires the 'pyarrow' package")
+    return _parquet_blocks(chunks, pa, pq)
+
+
+def _parquet_blocks(chunks, pa, pq):
+    schema = pa.schema([
+        ('id', pa.int64()),
+        ('transformer', pa.int64()),
+        ('transformer_name', pa.string()),
+        ('timestamp', pa.timestamp('us', tz='UTC')),
+        ('h2', pa.float64()),
+        ('co', pa.float64()),
+        ('c2h2', pa.float64()),
+        ('c2h4', pa.float64()),
+        ('fdd', pa.float64()),
+        ('rul', pa.float64()),
+        ('temperature', pa.float64()),
+    ])
+
+    sink = _ParquetSink()
+    writer = pq.ParquetWriter(sink, schema, compression='snappy')
+    try:
+        for chunk in chunks:
+            columns = list(zip(*chunk))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema
+            ))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export_measurements(queryset, export_format, chunk_size=EXPORT_CHUNK_SIZE, archived_rows=None, archived_first=False):
+    """
+    Return a byte-block generator for the given queryset and format.
+
+    Args:
+        queryset: TransformerMeasurement queryset, already filtered and ordered
+        export_format: One of EXPORT_FORMATS
+        chunk_size: Rows fetched and encoded per block
+        archived_rows: Optional iterator of archived rows (EXPORT_LOOKUPS order) to stitch in
+        archived_first: Emit archived rows before the hot ones (ascending time order)
+    """
+    chunks = iter_row_chunks(queryset, chunk_size)
+    if archived_rows is not None:
+        archived = chunked(archived_rows, chunk_size)
+        chunks = chain(archived, chunks) if archived_first else chain(chunks, archived)
+    if export_format == 'csv':
+        return stream_csv(chunks)
+    if export_format == 'csv.gz':
+        return stream_gzip(stream_csv(chunks))
+    if export_format == 'parquet':
+        return stream_parquet(chunks)
+    raise ValueError(f"Unknown export format: {export_format}")
@@ -0,0 +1,144 @@
+import logging
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from datetime import timedelta
+from django.db.models import Avg, Count, ExpressionWrapper, FloatField, Max, Min, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .archive import count_archived_rows
+from .models import MeasurementArchive, Transformer, TransformerMeasurement
+from .versions import get_change_version
+
+logger = logging.getLogger(__name__)
+
+FLEET_SUMMARY_KEY = 'fleet_summary:{user_id}:{version}'
+RUL_PERCENTILES = (10, 50, 90)
+CRITICAL_LIST_LIMIT = 10
+RUL_TREND_DAYS = 30
+
+
+def fleet_summary_key(user_id):
+    """Cache key tied to the user's change version, so any write invalidates it."""
+    version, _ = get_change_version(user_id)
+    return FLEET_SUMMARY_KEY.format(user_id=user_id, version=version)
+
+
+def latest_measurement_field(field):
+    """Subquery for ``field`` of a transformer's most recent measurement."""
+    return Subquery(
+        TransformerMeasurement.objects.filter(transformer=OuterRef('pk'))
+        .order_by('-timestamp', '-id')
+        .values(field)[:1]
+    )
+
+
+def annotate_transformer_stats(queryset, trend_days=RUL_TREND_DAYS):
+    """
+    Annotate a Transformer queryset with measurement statistics.
+
+    Everything is computed in the same SELECT (aggregates plus correlated
+    subqueries), so listing N transformers stays a single query.
+    """
+    window_start = timezone.now() - timedelta(days=trend_days)
+    window_first_rul = Subquery(
+        TransformerMeasurement.objects.filter(transformer=OuterRef('pk'), timestamp__gte=window_start)
+        .order_by('timestamp', 'id')
+        .values('rul')[:1]
+    )
+    archived = MeasurementArchive.objects.filter(transformer=OuterRef('pk')).order_by().values('transformer')
+    return queryset.annotate(
+        # Archived months are older than any hot row, so they decide first_timestamp when present
+        measurement_count=Count('measurements') + Coalesce(
+            Subquery(archived.annotate(total=Sum('row_count')).values('total')[:1]), 0
+        ),
+        first_timestamp=Coalesce(
+            Subquery(archived.annotate(first=Min('first_timestamp')).values('first')[:1]),
+            Min('measurements__timestamp')
+        ),
+        last_timestamp=Max('measurements__timestamp'),
+        latest_fdd=latest_measurement_field('fdd'),
+        latest_rul=latest_measurement_field('rul'),
+        # Change in RUL between the first reading of the window and the latest one
+        rul_trend=ExpressionWrapper(
+            latest_measurement_field('rul') - window_first_rul,
+            output_field=FloatField()
+        ),
+    )
+
+
+def compute_fleet_summary(user):
+    """Aggregate fleet status for one user, using each transformer's latest measurement."""
+    fleet_settings = settings.FLEET_SETTINGS
+    transformers = Transformer.objects.filter(user=user).annotate(
+        latest_fdd=latest_measurement_field('fdd'),
+        latest_rul=latest_measurement_field('rul'),
+    )
+
+    measurement_stats = TransformerMeasurement.objects.filter(transformer__user=user).aggregate(
+        count=Count('id'),
+        last_timestamp=Max('timestamp'),
+    )
+    # Counted like annotate_transformer_stats, so both endpoints agree once months are archived
+    measurement_stats['count'] += count_archived_rows(user)
+    if measurement_stats['last_timestamp'] is None:
+        # Every reading is archived
+        measurement_stats['last_timestamp'] = MeasurementArchive.objects.filter(
+            transformer__user=user
+        ).aggregate(last=Max('last_timestamp'))['last']
+
+    fdd_classes = {}
+    for row in transformers.order_by().values('latest_fdd').annotate(count=Count('id')):
+        key = 'unknown' if row['latest_fdd'] is None else str(int(row['latest_fdd']))
+        fdd_classes[key] = fdd_classes.get(key, 0) + row['count']
+
+    rul_stats = transformers.filter(latest_rul__isnull=False).aggregate(
+        min=Min('latest_rul'),
+        max=Max('latest_rul'),
+        avg=Avg('latest_rul'),
+    )
+    # One value per transformer, so the percentile input is bounded by fleet size
+    latest_ruls = np.fromiter(
+        transformers.filter(latest_rul__isnull=False).values_list('latest_rul', flat=True),
+        dtype=np.float64
+    )
+    for p in RUL_PERCENTILES:
+        rul_stats[f'p{p}'] = float(np.percentile(latest_ruls, p)) if latest_ruls.size else None
+
+    critical = transformers.filter(
+        Q(latest_fdd__in=fleet_settings['CRITICAL_FDD_CLASSES']) |
+        Q(latest_rul__lte=fleet_settings['CRITICAL_RUL'])
+    )
+    critical_list = [
+        {'id': pk, 'name': name, 'fdd': fdd, 'rul': rul}
+        for pk, name, fdd, rul in critical.order_by('latest_rul').values_list(
+            'id', 'name', 'latest_fdd', 'latest_rul'
+        )[:CRITICAL_LIST_LIMIT]
+    ]
+
+    return {
+        'transformer_count': transformers.count(),
+        'measurement_count': measurement_stats['count'],
+        'last_measurement_at': measurement_stats['last_timestamp'],
+        'fdd_classes': fdd_classes,
+        'rul': rul_stats,
+        'critical': {
+            'count': critical.count(),
+            'transformers': critical_list,
+        },
+        'generated_at': timezone.now(),
+    }
+
+
+def get_fleet_summary(user, fresh=False):
+    """Return the cached summary for ``user``, recomputing it on a miss or when ``fresh``."""
+    key = fleet_summary_key(user.id)
+    if not fresh:
+        summary = cache.get(key)
+        if summary is not None:
+            return summary
+
+    summary = compute_fleet_summary(user)
+    cache.set(key, summary, settings.FLEET_SETTINGS['SUMMARY_CACHE_TIMEOUT'])
+    logger.debug(f"Fleet summary recomputed for user {user.id}")
+    return summary
@@ -0,0 +1,408 @@
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+import torch
+import torch.nn.functional as F
+from transformers import DynamicCache
+
+logger = logging.getLogger(__name__)
+
+
+def _cache_layers(cache):
+    """Per-layer (keys, values) tensors of a cache, across transformers versions."""
+    if hasattr(cache, 'layers'):
+        return [(layer.keys, layer.values) for layer in cache.layers]
+    return list(zip(cache.key_cache, cache.value_cache))
+
+
+def _make_cache(layers):
+    cache = DynamicCache()
+    for layer_idx, (keys, values) in enumerate(layers):
+        cache.update(keys, values, layer_idx)
+    return cache
+
+
+def _common_prefix(a, b):
+    length = min(len(a), len(b))
+    for index in range(length):
+        if a[index] != b[index]:
+            return index
+    return length
+
+
+class PrefixCache:
+    """
+    Key/value tensors of earlier token sequences, reusable for any prompt that starts the same way.
+
+    Pinned entries (the system prompt) are never evicted; the others form an
+    LRU keyed by conversation and bounded by their total token count. Any
+    common prefix of an entry is usable, so a prompt that diverges halfway
+    through a cached sequence still skips the shared part. Only the scheduler
+    thread touches it.
+    """
+
+    def __init__(self, max_tokens):
+        self.max_tokens = max_tokens
+        self._pinned = {}
+        self._entries = OrderedDict()
+        self._tokens = 0
+        self.hits = 0
+        self.misses = 0
+
+    def pin(self, key, token_ids, layers):
+        self._pinned[key] = (tuple(token_ids), layers)
+
+    def store(self, key, token_ids, layers):
+        if key in self._entries:
+            self._tokens -= len(self._entries.pop(key)[0])
+        if len(token_ids) > self.max_tokens:
+            return
+        self._entries[key] = (tuple(token_ids), layers)
+        self._tokens += len(token_ids)
+        while self._tokens > self.max_tokens:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self._tokens -= len(evicted)
+
+    def lookup(self, token_ids, key=None):
+        """
+        Longest cached prefix of ``token_ids`` among the pinned entries and ``key``'s entry.
+
+        At least the last prompt token is left out, because its logits are
+        needed to sample the first new token. Returns (length, layers sliced
+        to that length) or (0, None).
+        """
+        candidates = list(self._pinned.values())
+        if key is not None and key in self._entries:
+            self._entries.move_to_end(key)
+            candidates.append(self._entries[key])
+        best, best_layers = 0, None
+        for cached_ids, layers in candidates:
+            length = min(_common_prefix(cached_ids, token_ids), len(token_ids) - 1)
+            if length > best:
+                best, best_layers = length, layers
+        if not best:
+            self.misses += 1
+            return 0, None
+        self.hits += 1
+        return best, [(keys[:, :, :best], values[:, :, :best]) for keys, values in best_layers]
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'tokens': self._tokens,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+class GenerationRequest:
+    """
+    One prompt in the scheduler.
+
+    ``on_token(token_id)`` and ``on_finish(error)`` run on the scheduler
+    thread and must not block; ``error`` is None on success.
+    """
+
+    def __init__(self, input_ids, max_new_tokens, temperature, top_p, on_token, on_finish,
+                 cancel_event=None, cache_key=None):
+        self.input_ids = list(input_ids)
+        self.cache_key = cache_key
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.on_token = on_token
+        self.on_finish = on_finish
+        self.cancel_event = cancel_event or threading.Event()
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.first_token_at = None
+        self.finished_at = None
+        self.output_ids = []
+        self.prefix_tokens = 0
+        self.done = False
+
+    @property
+    def generated(self):
+        return len(self.output_ids)
+
+    def metrics(self):
+        """Queue wait and time to first token (seconds), reused prefix, generated tokens and decode speed."""
+        now = time.monotonic()
+        started = self.started_at or self.finished_at or now
+        decode_time = (self.finished_at or now) - started
+        return {
+            'queue_wait': round(started - self.enqueued_at, 3),
+            'time_to_first_token': round(self.first_token_at - self.enqueued_at, 3) if self.first_token_at else None,
+            'prefix_tokens': self.prefix_tokens,
+            'tokens': self.generated,
+            'tokens_per_second': round(self.generated / decode_time, 1) if decode_time > 0 else None,
+        }
+
+
+class GenerationScheduler:
+    """
+    Continuous batching over one causal LM.
+
+    A single thread owns the model. Running sequences share one left-padded
+    KV cache and advance one token per forward pass; between passes, finished
+    or cancelled sequences leave the batch and queued prompts join it after a
+    batched prefill. Throughput therefore grows with the number of concurrent
+    requests instead of each one waiting for the previous to finish.
+    """
+
+    def __init__(self, model, eos_token_ids, pad_token_id=None, max_batch_size=8, batch_wait=0.01,
+                 prefix_cache_tokens=0, pinned_prefixes=None):
+        self.model = model
+        self.prefix_cache = PrefixCache(prefix_cache_tokens)
+        self.eos_token_ids = set(eos_token_ids)
+        self.pad_token_id = pad_token_id if pad_token_id is not None else min(self.eos_token_ids, default=0)
+        self.max_batch_size = max_batch_size
+        self.batch_wait = batch_wait
+        self._waiting = queue.Queue()
+        # Batch state, only touched by the scheduler thread
+        self._active = []
+        self._admitting = []
+        self._cache = None
+        self._mask = None
+        self._pending = None
+        self._completed = 0
+        self._total_tokens = 0
+        # Computed before the thread starts, so every request can reuse them
+        for key, token_ids in (pinned_prefixes or {}).items():
+            self.prefix_cache.pin(key, token_ids, self._encode_prefix(token_ids))
+        self._thread = threading.Thread(target=self._run, name='chat-generation', daemon=True)
+        self._thread.start()
+
+    def submit(self, input_ids, max_new_tokens, temperature, top_p, on_token, on_finish,
+               cancel_event=None, cache_key=None):
+        """Queue a prompt; ``cache_key`` (e.g. a conversation id) keeps its sequence in the prefix cache."""
+        request = GenerationRequest(
+            input_ids, max_new_tokens, temperature, top_p, on_token, on_finish, cancel_event, cache_key
+        )
+        self._waiting.put(request)
+        return request
+
+    def stats(self):
+        return {
+            'active': len(self._active),
+            'waiting': self._waiting.qsize(),
+            'completed': self._completed,
+            'generated_tokens': self._total_tokens,
+            'prefix_cache': self.prefix_cache.stats(),
+        }
+
+    def _encode_prefix(self, token_ids):
+        with torch.inference_mode():
+            output = self.model(
+                input_ids=torch.tensor([list(token_ids)], device=self._device()),
+                past_key_values=DynamicCache(),
+                use_cache=True,
+            )
+        return _cache_layers(output.past_key_values)
+
+    def _run(self):
+        while True:
+            try:
+                with torch.inference_mode():
+                    self._step()
+            except Exception as e:
+                logger.error(f"Generation batch failed: {str(e)}")
+                for request in self._active + self._admitting:
+                    self._finish(request, e)
+                self._admitting = []
+                self._set_batch([], None, None, None)
+
+    def _step(self):
+        newcomers = []
+        if not self._active:
+            newcomers.append(self._waiting.get())
+            # Let requests that arrive together share one prefill
+            time.sleep(self.batch_wait)
+        while len(self._active) + len(newcomers) < self.max_batch_size:
+            try:
+                newcomers.append(self._waiting.get_nowait())
+            except queue.Empty:
+                break
+
+        admitted = []
+        for request in newcomers:
+            if request.cancel_event.is_set():
+                self._finish(request)
+            else:
+                admitted.append(request)
+        if admitted:
+            self._admitting = admitted
+            self._admit(admitted)
+            self._admitting = []
+        if self._active:
+            self._decode()
+
+    def _device(self):
+        return next(self.model.parameters()).device
+
+    def _admit(self, requests):
+        """
+        Prefill the new prompts as one batch and merge them into the running batch.
+
+        Each row is laid out as [padding, cached prefix, padding, new suffix]:
+        the longest cached prefix of every prompt is copied in and only the
+        suffix goes through the model. The attention mask hides both padding
+        runs and position ids continue from the prefix.
+        """
+        device = self._device()
+        prefixes = [self.prefix_cache.lookup(request.input_ids, request.cache_key) for request in requests]
+        prefix_width = max(length for length, _ in prefixes)
+        suffix_width = max(len(request.input_ids) - length for request, (length, _) in zip(requests, prefixes))
+
+        input_ids = torch.full((len(requests), suffix_width), self.pad_token_id, dtype=torch.long)
+        mask = torch.zeros((len(requests), prefix_width + suffix_width), dtype=torch.long)
+        position_ids = torch.zeros((len(requests), suffix_width), dtype=torch.long)
+        for row, (request, (length, _)) in enumerate(zip(requests, prefixes)):
+            suffix = request.input_ids[length:]
+            input_ids[row, suffix_width - len(suffix):] = torch.tensor(suffix)
+            mask[row, prefix_width - length:prefix_width] = 1
+            mask[row, prefix_width + suffix_width - len(suffix):] = 1
+            position_ids[row, suffix_width - len(suffix):] = torch.arange(length, length + len(suffix))
+            request.prefix_tokens = length
+            request.started_at = time.monotonic()
+
+        cache = DynamicCache()
+        if prefix_width:
+            template = next(layers for _, layers in prefixes if layers is not None)
+            cache = _make_cache([
+                (
+                    torch.cat([
+                        self._pad(layers[layer_idx][0], prefix_width) if layers else
+                        keys.new_zeros(1, keys.shape[1], prefix_width, keys.shape[3])
+                        for _, layers in prefixes
+                    ]),
+                    torch.cat([
+                        self._pad(layers[layer_idx][1], prefix_width) if layers else
+                        values.new_zeros(1, values.shape[1], prefix_width, values.shape[3])
+                        for _, layers in prefixes
+                    ]),
+                )
+                for layer_idx, (keys, values) in enumerate(template)
+            ])
+
+        output = self.model(
+            input_ids=input_ids.to(device),
+            attention_mask=mask.to(device),
+            position_ids=position_ids.to(device),
+            past_key_values=cache,
+            use_cache=True,
+        )
+        tokens = self._sample(output.logits[:, -1, :], requests)
+
+        if self._active:
+            old_layers, new_layers = _cache_layers(self._cache), _cache_layers(output.past_key_values)
+            width = max(self._mask.shape[1], mask.shape[1])
+            layers = [
+                (
+                    torch.cat([self._pad(old_keys, width), self._pad(new_keys, width)]),
+                    torch.cat([self._pad(old_values, width), self._pad(new_values, width)]),
+                )
+                for (old_keys, old_values), (new_keys, new_values) in zip(old_layers, new_layers)
+            ]
+            mask = torch.cat([F.pad(self._mask, (width - self._mask.shape[1], 0)), F.pad(mask.to(device), (width - mask.shape[1], 0))])
+            pending = torch.cat([self._pending, tokens])
+            self._set_batch(self._active + requests, layers, mask, pending)
+        else:
+            self._set_batch(requests, _cache_layers(output.past_key_values), mask.to(device), tokens)
+        self._accept(requests, tokens)
+
+    @staticmethod
+    def _pad(tensor, width):
+        # (batch, heads, length, head_dim): left-pad the length axis
+        return F.pad(tensor, (0, 0, width - tensor.shape[2], 0))
+
+    def _decode(self):
+        """Feed every row's pending token through the model and sample the next one."""
+        positions = self._mask.sum(-1, keepdim=True)
+        self._mask = torch.cat([self._mask, torch.ones_like(self._mask[:, :1])], dim=1)
+        output = self.model(
+            input_ids=self._pending.unsqueeze(-1),
+            attention_mask=self._mask,
+            position_ids=positions,
+            past_key_values=self._cache,
+            use_cache=True,
+        )
+        self._cache = output.past_key_values
+        tokens = self._sample(output.logits[:, -1, :], self._active)
+        self._pending = tokens
+        self._accept(self._active, tokens)
+
+    def _sample(self, logits, requests):
+        """Greedy for temperature 0, otherwise temperature plus nucleus (top-p) sampling, per row."""
+        logits = logits.float()
+        temperature = torch.tensor([r.temperature for r in requests], device=logits.device).unsqueeze(-1)
+        top_p = torch.tensor([r.top_p for r in requests], device=logits.device).unsqueeze(-1)
+        greedy = logits.argmax(-1)
+
+        probs = torch.softmax(logits / temperature.clamp(min=1e-5), dim=-1)
+        sorted_probs, order = probs.sort(dim=-1, descending=True)
+        # Drop tokens once the probability mass before them exceeds top_p (the first is always kept)
+        sorted_probs = sorted_probs.masked_fill(sorted_probs.cumsum(-1) - sorted_probs > top_p, 0.0)
+        sampled = order.gather(-1, torch.multinomial(sorted_probs, 1)).squeeze(-1)
+        return torch.where(temperature.squeeze(-1) > 0, sampled, greedy)
+
+    def _accept(self, requests, tokens):
+        """Hand each request its new token, then evict the rows that are done."""
+        now = time.monotonic()
+        for request, token in zip(requests, tokens.tolist()):
+            if request.cancel_event.is_set() or token in self.eos_token_ids:
+                self._finish(request)
+                continue
+            request.output_ids.append(token)
+            request.first_token_at = request.first_token_at or now
+            self._total_tokens += 1
+            request.on_token(token)
+            if request.generated >= request.max_new_tokens:
+                self._finish(request)
+
+        keep = [row for row, request in enumerate(self._active) if not request.done]
+        if len(keep) < len(self._active):
+            for row, request in enumerate(self._active):
+                if request.done and request.cache_key is not None:
+                    self._remember(row, request)
+            index = torch.tensor(keep, dtype=torch.long, device=self._mask.device)
+            self._set_batch(
+                [self._active[row] for row in keep],
+                [(keys[index], values[index]) for keys, values in _cache_layers(self._cache)],
+                self._mask[index],
+                self._pending[index],
+            )
+
+    def _remember(self, row, request):
+        """Keep a finished row's keys/values so the conversation's next prompt can start from them."""
+        columns = self._mask[row].nonzero().squeeze(-1)
+        # The last sampled token was never fed back, so the cache holds one token less than prompt + output
+        token_ids = (request.input_ids + request.output_ids)[:len(columns)]
+        self.prefix_cache.store(request.cache_key, token_ids, [
+            (keys[row:row + 1, :, columns], values[row:row + 1, :, columns])
+            for keys, values in _cache_layers(self._cache)
+        ])
+
+    def _set_batch(self, requests, layers, mask, pending):
+        if not requests:
+            self._active, self._cache, self._mask, self._pending = [], None, None, None
+            return
+        # Columns that are padding in every remaining row are dead weight
+        start = int((mask.sum(0) > 0).nonzero()[0])
+        self._active = requests
+        self._cache = _make_cache([(keys[:, :, start:], values[:, :, start:]) for keys, values in layers])
+        self._mask = mask[:, start:]
+        self._pending = pending
+
+    def _finish(self, request, error=None):
+        if request.done:
+            return
+        request.done = True
+        request.finished_at = time.monotonic()
+        self._completed += 1
+        try:
+            request.on_finish(error)
+        except Exception as e:
+            logger.error(f"Error finishing generation request: {str(e)}")
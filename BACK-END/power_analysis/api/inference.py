@@ -0,0 +1,205 @@
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from .chat_model import ChatModel, ModelNotReady
+
+logger = logging.getLogger(__name__)
+
+# Messages are one JSON object per line in both directions:
+#   client -> worker: {"op": "status"} or {"op": "generate", ...}, then optionally {"op": "cancel"}
+#   worker -> client: {"status": ..., "scheduler": ...}, or {"token": ...}* followed by {"done": true, "metrics": ...}
+#                     or {"error": ..., "not_ready": bool}
+STATUS_TTL = 1.0  # seconds a status reply is reused by the web process
+STATUS_TIMEOUT = 2.0
+CANCEL_POLL = 0.1  # how often a waiting client checks its cancel event
+LINE_LIMIT = 1024 * 1024  # generate requests carry the conversation context
+
+UNREACHABLE = {'state': 'unreachable', 'ready': False, 'load_seconds': None}
+
+
+def _encode(message):
+    return json.dumps(message).encode() + b'\n'
+
+
+class InferenceClient:
+    """
+    Web-process side of the inference worker.
+
+    ``stream`` mirrors ChatModel.generate_tokens, so ChatModel.stream_response
+    (and the answer cache in front of it) works the same whichever process
+    holds the model. A request gives up with asyncio.TimeoutError when the
+    worker sends nothing for ``timeout`` seconds, and with ModelNotReady when
+    the worker is down or still loading.
+    """
+
+    def __init__(self, path, timeout=60):
+        self.path = path
+        self.timeout = timeout
+        self._status = None
+        self._status_at = 0.0
+        self._lock = threading.Lock()
+
+    def _query(self, request):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(STATUS_TIMEOUT)
+            sock.connect(self.path)
+            sock.sendall(_encode(request))
+            with sock.makefile('rb') as reply:
+                return json.loads(reply.readline())
+
+    def _worker_status(self, fresh=False):
+        with self._lock:
+            if fresh or self._status is None or time.monotonic() - self._status_at > STATUS_TTL:
+                try:
+                    self._status = self._query({'op': 'status'})
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Inference worker at {self.path} unreachable: {str(e)}")
+                    self._status = {'status': UNREACHABLE, 'scheduler': None}
+                self._status_at = time.monotonic()
+            return self._status
+
+    def status(self):
+        return self._worker_status()['status']
+
+    def scheduler_stats(self):
+        return self._worker_status(fresh=True)['scheduler']
+
+    async def stream(self, input_text, context, cancel_event, metrics, conversation_id=None):
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_unix_connection(self.path, limit=LINE_LIMIT), STATUS_TIMEOUT
+            )
+        except (OSError, asyncio.TimeoutError) as e:
+            raise ModelNotReady(f"Inference worker unreachable: {str(e)}")
+
+        loop = asyncio.get_running_loop()
+        pending = None
+        try:
+            writer.write(_encode({
+                'op': 'generate',
+                'input': input_text,
+                'context': context or [],
+                'conversation_id': conversation_id,
+            }))
+            await writer.drain()
+            cancel_sent = False
+            last_message = loop.time()
+            while True:
+                # Keep one read outstanding and wake up regularly to forward a cancel
+                if pending is None:
+                    pending = asyncio.ensure_future(reader.readline())
+                done, _ = await asyncio.wait({pending}, timeout=CANCEL_POLL)
+                if not done:
+                    if cancel_event.is_set() and not cancel_sent:
+                        writer.write(_encode({'op': 'cancel'}))
+                        await writer.drain()
+                        cancel_sent = True
+                    if loop.time() - last_message > self.timeout:
+                        raise asyncio.TimeoutError("Inference worker timed out")
+                    continue
+
+                line, pending = pending.result(), None
+                last_message = loop.time()
+                if not line:
+                    raise RuntimeError("Inference worker closed the connection")
+                message = json.loads(line)
+                if 'token' in message:
+                    yield message['token']
+                elif 'error' in message:
+                    if message.get('not_ready'):
+                        raise ModelNotReady(message['error'])
+                    raise RuntimeError(message['error'])
+                else:
+                    metrics.update(message['metrics'])
+                    return
+        finally:
+            if pending is not None:
+                pending.cancel()
+            # Closing the connection early cancels the generation in the worker
+            writer.close()
+            with contextlib.suppress(Exception):
+                await writer.wait_closed()
+
+
+async def _watch_client(reader, cancel_event):
+    """Cancel the generation on a cancel message or when the client goes away."""
+    while True:
+        line = await reader.readline()
+        if not line or b'"cancel"' in line:
+            cancel_event.set()
+            return
+
+
+async def _handle(reader, writer):
+    model = ChatModel()
+    watcher = None
+    try:
+        request = json.loads(await reader.readline() or b'{}')
+        if request.get('op') == 'status':
+            scheduler = ChatModel._scheduler
+            writer.write(_encode({
+                'status': ChatModel.local_status(),
+                'scheduler': scheduler.stats() if scheduler else None,
+            }))
+        elif request.get('op') == 'generate':
+            cancel_event = threading.Event()
+            watcher = asyncio.ensure_future(_watch_client(reader, cancel_event))
+            metrics = {}
+            tokens = model.generate_tokens(
+                request['input'], request['context'], cancel_event, metrics, request.get('conversation_id')
+            )
+            try:
+                async for chunk in tokens:
+                    writer.write(_encode({'token': chunk}))
+                    await writer.drain()
+                writer.write(_encode({'done': True, 'metrics': metrics}))
+            except ConnectionError:
+                raise
+            except ModelNotReady as e:
+                writer.write(_encode({'error': str(e), 'not_ready': True}))
+            except Exception as e:
+                logger.error(f"Inference worker generation error: {str(e)}")
+                writer.write(_encode({'error': str(e), 'not_ready': False}))
+            finally:
+                # Stops the generation if the client went away mid-stream
+                await tokens.aclose()
+        else:
+            writer.write(_encode({'error': f"Unknown op {request.get('op')!r}", 'not_ready': False}))
+        await writer.drain()
+    except (ConnectionError, ValueError) as e:
+        logger.info(f"Inference worker client dropped: {str(e)}")
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+        writer.close()
+        with contextlib.suppress(Exception):
+            await writer.wait_closed()
+
+
+async def serve(path, ready=None):
+    """
+    Serve generation requests on the Unix socket ``path`` until cancelled.
+
+    Every web process connects here instead of loading its own copy of the
+    model, and their requests share one continuous-batching scheduler and
+    one prefix cache. ``ready`` (an asyncio.Event) is set once listening.
+    """
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)
+    server = await asyncio.start_unix_server(_handle, path, limit=LINE_LIMIT)
+    # Only the owner and its group (the web workers' user) may connect
+    os.chmod(path, 0o660)
+    logger.info(f"Inference worker listening on {path}")
+    if ready is not None:
+        ready.set()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path)
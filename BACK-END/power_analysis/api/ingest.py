@@ -0,0 +1,80 @@
+from django.db import DatabaseError, transaction
+from .anomaly import observe_measurements
+from .dga import apply_dga
+from .models import TransformerMeasurement
+from .versions import bump_change_version
+
+
+INGEST_BATCH_SIZE = 500
+# Errors caused by the data of a row, as opposed to bugs
+INGEST_ERRORS = (DatabaseError, ValueError, TypeError)
+
+
+def ingest_measurements(measurements, user_id):
+    """
+    Insert new measurements of one user's transformers as one batch.
+
+    The bulk counterpart of TransformerMeasurement.save(), for imports:
+    the DGA rules run over the whole batch at once, the rows go in with one
+    INSERT, each transformer's anomaly state is updated once, and the user's
+    version is bumped once, last, reserving one change_seq per row. Imports
+    carry their own fdd/rul, so no remote prediction is made; rows without
+    them keep NULL there.
+
+    Returns the saved measurements.
+    """
+    measurements = apply_dga(measurements)
+    if not measurements:
+        return measurements
+
+    with transaction.atomic():
+        TransformerMeasurement.objects.bulk_create(measurements)
+        observe_measurements(measurements)
+        version = bump_change_version(user_id, count=len(measurements))
+        first = version - len(measurements) + 1
+        for offset, measurement in enumerate(measurements):
+            measurement.change_seq = first + offset
+        TransformerMeasurement.objects.bulk_update(measurements, ['change_seq'])
+    return measurements
+
+
+class MeasurementBatch:
+    """
+    Collect new measurements and ingest them ``batch_size`` at a time.
+
+    A row the database rejects fails its whole batch, so that batch is then
+    saved row by row: the good rows still go in, and ``on_error(source,
+    error)`` is called for each bad one with the ``source`` given to add()
+    (e.g. the CSV row). Returns of flush() and ``saved`` count stored rows.
+    """
+
+    def __init__(self, user_id, batch_size=INGEST_BATCH_SIZE, on_error=None):
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.on_error = on_error
+        self.pending = []
+        self.saved = 0
+        self.failed = 0
+
+    def add(self, measurement, source=None):
+        self.pending.append((measurement, source))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        # Taken off the queue first, so a failure is never retried with the next batch
+        batch, self.pending = self.pending, []
+        if not batch:
+            return self.saved
+        try:
+            self.saved += len(ingest_measurements([measurement for measurement, _ in batch], self.user_id))
+        except INGEST_ERRORS:
+            for measurement, source in batch:
+                try:
+                    self.saved += len(ingest_measurements([measurement], self.user_id))
+                except INGEST_ERRORS as e:
+                    self.failed += 1
+                    if self.on_error is None:
+                        raise
+                    self.on_error(source, e)
+        return self.saved
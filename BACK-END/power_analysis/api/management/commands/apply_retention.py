@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from api.retention import RETENTION_POLICIES, apply_retention
+
+
+class Command(BaseCommand):
+    help = 'Delete expired notifications and chat history in small primary-key batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--policy', choices=list(RETENTION_POLICIES), action='append',
+                            help='Only run this policy (repeatable, default: all)')
+        parser.add_argument('--days', type=int, help='Override the age of the selected policies')
+        parser.add_argument('--batch-size', type=int, help='Rows deleted per transaction')
+        parser.add_argument('--pause', type=float, help='Seconds to sleep between batches')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted')
+
+    def handle(self, *args, **options):
+        total = 0
+        for policy in options['policy'] or RETENTION_POLICIES:
+            count = apply_retention(
+                policy,
+                days=options['days'],
+                batch_size=options['batch_size'],
+                pause=options['pause'],
+                dry_run=options['dry_run'],
+            )
+            total += count
+            verb = 'would delete' if options['dry_run'] else 'deleted'
+            self.stdout.write(f'  {policy}: {verb} {count}')
+        if not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'Retention deleted {total} rows'))
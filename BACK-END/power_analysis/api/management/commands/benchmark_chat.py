@@ -0,0 +1,71 @@
+import asyncio
+import statistics
+import time
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from api.chat_model import ChatModel
+from api.generation import PrefixCache
+
+QUESTIONS = [
+    'What does a rising acetylene concentration indicate?',
+    'How often should dissolved gas analysis be repeated after that?',
+    'Which tests confirm a winding fault?',
+    'What maintenance would you schedule next?',
+]
+
+
+class Command(BaseCommand):
+    help = 'Measure chat time to first token and throughput, with and without the prefix key/value cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--conversations', type=int, default=4, help='Conversations running concurrently')
+        parser.add_argument('--turns', type=int, default=3, help='Questions asked in each conversation')
+        parser.add_argument('--max-tokens', type=int, default=64, help='Tokens generated per answer')
+
+    async def _conversation(self, model, conversation_id, turns, results):
+        history = []
+        for turn in range(turns):
+            question = QUESTIONS[turn % len(QUESTIONS)]
+            metrics = {}
+            answer = await model.generate_response(
+                question, history, metrics=metrics, conversation_id=conversation_id
+            )
+            history += [{'role': 'user', 'content': question}, {'role': 'assistant', 'content': answer}]
+            results.append(metrics)
+
+    def _run(self, model, label, conversations, turns, base_id):
+        results = []
+
+        async def run_all():
+            await asyncio.gather(*(
+                self._conversation(model, base_id + index, turns, results) for index in range(conversations)
+            ))
+
+        start = time.perf_counter()
+        async_to_sync(run_all)()
+        elapsed = time.perf_counter() - start
+        tokens = sum(result['tokens'] for result in results)
+        first_token = [r['time_to_first_token'] for r in results if r['time_to_first_token'] is not None]
+        self.stdout.write(
+            f'{label}: time to first token median {statistics.median(first_token):.3f}s, '
+            f'reused prefix {statistics.mean(r["prefix_tokens"] for r in results):.0f} tokens/request, '
+            f'{tokens / elapsed:.1f} tokens/s aggregate'
+        )
+
+    def handle(self, *args, **options):
+        model = ChatModel()
+        ChatModel.load()
+        scheduler = model._get_scheduler()
+        model_settings = dict(settings.AI_MODEL_SETTINGS, MAX_LENGTH=options['max_tokens'])
+        conversations, turns = options['conversations'], options['turns']
+
+        with override_settings(AI_MODEL_SETTINGS=model_settings):
+            cached = scheduler.prefix_cache
+            scheduler.prefix_cache = PrefixCache(0)
+            try:
+                self._run(model, 'without prefix cache', conversations, turns, base_id=-1000)
+            finally:
+                scheduler.prefix_cache = cached
+            self._run(model, 'with prefix cache', conversations, turns, base_id=-2000)
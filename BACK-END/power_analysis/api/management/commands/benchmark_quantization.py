@@ -0,0 +1,74 @@
+import time
+import torch
+from django.core.management.base import BaseCommand
+from transformers import AutoModelForCausalLM, AutoTokenizer
+from api.chat_model import ChatModel
+from api.management.commands.benchmark_chat import QUESTIONS
+from api.quantization import QUANTIZATION_MODES, load_quantized_model, model_footprint
+
+
+class Command(BaseCommand):
+    help = 'Compare float32 and quantized CPU chat models: tokens/sec, weight footprint and answer agreement'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', choices=QUANTIZATION_MODES, default='int8')
+        parser.add_argument('--max-tokens', type=int, default=64, help='Tokens generated per answer')
+        parser.add_argument('--threads', type=int, help='Intra-op CPU threads (default: torch default)')
+
+    def _generate(self, model, prompt_ids, max_tokens):
+        """Greedy answers to each prompt, and the aggregate tokens/sec."""
+        answers = []
+        generated = 0
+        start = time.perf_counter()
+        with torch.inference_mode():
+            for input_ids in prompt_ids:
+                output = model.generate(input_ids, max_new_tokens=max_tokens, do_sample=False)
+                answers.append(output[0, input_ids.shape[1]:])
+                generated += len(answers[-1])
+        return answers, generated / (time.perf_counter() - start)
+
+    def _agreement(self, model, prompt_ids, answers):
+        """Share of the reference answers' tokens the model also ranks first, given the same preceding text."""
+        matches = total = 0
+        with torch.inference_mode():
+            for input_ids, answer in zip(prompt_ids, answers):
+                sequence = torch.cat([input_ids[0], answer])[None, :]
+                logits = model(sequence).logits[0, input_ids.shape[1] - 1:-1]
+                matches += int((logits.argmax(-1) == answer).sum())
+                total += len(answer)
+        return matches / total if total else 1.0
+
+    def handle(self, *args, **options):
+        if options['threads']:
+            torch.set_num_threads(options['threads'])
+        model_name = ChatModel.MODEL_NAME
+        tokenizer = AutoTokenizer.from_pretrained(model_name, cache_dir='.model_cache')
+        chat_model = ChatModel()
+        prompt_ids = [tokenizer(chat_model._build_prompt(question), return_tensors='pt')['input_ids'] for question in QUESTIONS]
+
+        float_model = AutoModelForCausalLM.from_pretrained(
+            model_name, cache_dir='.model_cache', torch_dtype=torch.float32
+        ).eval()
+        start = time.perf_counter()
+        quantized_model = load_quantized_model(model_name, options['mode'], load_float=lambda: float_model)
+        self.stdout.write(f'{options["mode"]} model ready in {time.perf_counter() - start:.1f}s (rerun to time a cached load)')
+
+        reference, float_speed = self._generate(float_model, prompt_ids, options['max_tokens'])
+        answers, quantized_speed = self._generate(quantized_model, prompt_ids, options['max_tokens'])
+        for label, model, speed in (
+            ('float32', float_model, float_speed),
+            (options['mode'], quantized_model, quantized_speed),
+        ):
+            self.stdout.write(
+                f'{label}: {speed:.1f} tokens/s on {torch.get_num_threads()} threads, '
+                f'weights {model_footprint(model) / 2 ** 20:.0f} MiB'
+            )
+
+        identical = sum(torch.equal(a, b) for a, b in zip(reference, answers))
+        self.stdout.write(
+            f'Quality: {identical}/{len(QUESTIONS)} answers identical to float32, '
+            f'{self._agreement(quantized_model, prompt_ids, reference):.1%} top-1 agreement on the float32 answers'
+        )
+        self.stdout.write(f'  Q: {QUESTIONS[0]}')
+        self.stdout.write(f'  float32: {tokenizer.decode(reference[0], skip_special_tokens=True).strip()}')
+        self.stdout.write(f'  {options["mode"]}: {tokenizer.decode(answers[0], skip_special_tokens=True).strip()}')
@@ -0,0 +1,74 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from api.models import CustomUser, Transformer, TransformerMeasurement
+from api.renderers import FastJSONRenderer
+from api.serializers import TransformerMeasurementSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare measurement list serialization throughput (ModelSerializer + JSONRenderer vs values_list + FastJSONRenderer)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='Number of measurements to serialize')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per path, the best one is reported')
+
+    def _best_of(self, repeat, func):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            payload = func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, len(payload)
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        repeat = options['repeat']
+
+        # Everything is created inside a transaction that is rolled back at the end
+        with transaction.atomic():
+            user = CustomUser.objects.create_user(
+                username='benchmark_serialization', email='benchmark_serialization@example.com'
+            )
+            transformer = Transformer.objects.create(user=user, name='benchmark')
+            start = timezone.now() - timedelta(minutes=rows)
+            TransformerMeasurement.objects.bulk_create(
+                (
+                    TransformerMeasurement(
+                        transformer=transformer, h2=i % 97, co=i % 89, c2h2=i % 13, c2h4=i % 31,
+                        fdd=1 + i % 4, rul=1000 - i % 1000, timestamp=start + timedelta(minutes=i)
+                    )
+                    for i in range(rows)
+                ),
+                batch_size=5000
+            )
+            queryset = TransformerMeasurement.objects.filter(transformer=transformer).order_by('-timestamp')
+            fields = list(TransformerMeasurementSerializer.FAST_FIELDS)
+            columns = list(TransformerMeasurementSerializer.FAST_FIELDS.values())
+
+            def before():
+                data = TransformerMeasurementSerializer(queryset.all(), many=True).data
+                return JSONRenderer().render(data)
+
+            def after():
+                data = [dict(zip(fields, row)) for row in queryset.all().values_list(*columns)]
+                return FastJSONRenderer().render(data)
+
+            before_time, before_size = self._best_of(repeat, before)
+            after_time, after_size = self._best_of(repeat, after)
+            transaction.set_rollback(True)
+
+        self.stdout.write(f'Rows: {rows}')
+        self.stdout.write(
+            f'ModelSerializer + JSONRenderer:   {rows / before_time:>12,.0f} rows/sec '
+            f'({before_time:.2f}s, {before_size / 1e6:.1f} MB)'
+        )
+        self.stdout.write(
+            f'values_list + FastJSONRenderer:   {rows / after_time:>12,.0f} rows/sec '
+            f'({after_time:.2f}s, {after_size / 1e6:.1f} MB)'
+        )
+        self.stdout.write(self.style.SUCCESS(f'Speedup: {before_time / after_time:.1f}x'))
@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.db.models.functions import TruncMonth
+from api.archive import archive_cutoff, archive_transformer_month
+from api.models import TransformerMeasurement
+from api.versions import bump_change_version
+
+
+class Command(BaseCommand):
+    help = 'Move measurements older than the archive age into compressed per-transformer-month chunks'
+
+    def add_arguments(self, parser):
+        archive_settings = settings.ARCHIVE_SETTINGS
+        parser.add_argument('--age-days', type=int, default=archive_settings['AGE_DAYS'],
+                            help='Archive whole months older than this many days')
+        parser.add_argument('--batch-size', type=int, default=archive_settings['BATCH_SIZE'],
+                            help='Rows moved per transaction')
+        parser.add_argument('--max-chunks', type=int, default=archive_settings['MAX_CHUNKS'],
+                            help='Transformer-months processed in this run')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be archived')
+
+    def handle(self, *args, **options):
+        cutoff = archive_cutoff(options['age_days'])
+        pending = (
+            TransformerMeasurement.objects.filter(timestamp__lt=cutoff)
+            .annotate(month=TruncMonth('timestamp'))
+            .values('transformer_id', 'transformer__user_id', 'month')
+            .annotate(rows=Count('id'))
+            .order_by('month', 'transformer_id')[:options['max_chunks']]
+        )
+        pending = list(pending)
+        self.stdout.write(f'Archiving measurements before {cutoff:%Y-%m-%d}: {len(pending)} transformer-months pending')
+        if options['dry_run']:
+            for chunk in pending:
+                self.stdout.write(f'  transformer {chunk["transformer_id"]} {chunk["month"]:%Y-%m}: {chunk["rows"]} rows')
+            return
+
+        total_moved = 0
+        users = set()
+        for chunk in pending:
+            moved = archive_transformer_month(chunk['transformer_id'], chunk['month'].date(), options['batch_size'])
+            total_moved += moved
+            users.add(chunk['transformer__user_id'])
+            self.stdout.write(f'  transformer {chunk["transformer_id"]} {chunk["month"]:%Y-%m}: {moved} rows archived')
+
+        # The default (hot) lists changed, so cached ETags must not match any more
+        for user_id in users:
+            bump_change_version(user_id)
+
+        self.stdout.write(self.style.SUCCESS(f'Archived {total_moved} measurements in {len(pending)} chunks'))
@@ -4,6 +4,7 @@ import datetime
 from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth import get_user_model
 from api.models import Transformer, TransformerMeasurement
+from api.ingest import INGEST_BATCH_SIZE, MeasurementBatch
 
 User = get_user_model()
 
@@ -15,6 +16,11 @@ class Command(BaseCommand):
         parser.add_argument('--transformer_id', type=int, help='Transformer ID to associate with measurements')
         parser.add_argument('--transformer_name', type=str, help='Create or use transformer with this name')
         parser.add_argument('--username', type=str, help='Username of the owner of the transformer')
+        parser.add_argument('--batch-size', type=int, default=INGEST_BATCH_SIZE, help='Measurements inserted per transaction')
+
+    def report_row_error(self, row, error):
+        # Rows the database rejects are only found when their batch is saved
+        self.stdout.write(self.style.WARNING(f'Error creating measurement: {str(error)}\nRow data: {row}'))
 
     def handle(self, *args, **options):
         csv_file_path = options['csv_file']
@@ -51,6 +57,7 @@ class Command(BaseCommand):
                 raise CommandError('Either transformer_id or transformer_name is required')
 
             measurements_created = 0
+            batch = MeasurementBatch(user.id, options['batch_size'], on_error=self.report_row_error)
             with open(csv_file_path, 'r') as csvfile:
                 reader = csv.DictReader(csvfile)
                 for row in reader:
@@ -59,7 +66,7 @@ class Command(BaseCommand):
                         timestamp = datetime.datetime.strptime(row['timestamp'], '%m/%d/%Y %H:%M')
                         
                         # Create measurement
-                        measurement = TransformerMeasurement.objects.create(
+                        batch.add(TransformerMeasurement(
                             transformer=transformer,
                             co=float(row['co']),
                             h2=float(row['h2']),
@@ -69,8 +76,7 @@ class Command(BaseCommand):
                             rul=float(row['rul']),
                             timestamp=timestamp,
                             temperature=float(row['temperature']) if row['temperature'] else None
-                        )
-                        measurements_created += 1
+                        ), row)
 
                     except Exception as e:
                         self.stdout.write(
@@ -80,6 +86,8 @@ class Command(BaseCommand):
                         )
                         continue
 
+            measurements_created = batch.flush()
+
             self.stdout.write(
                 self.style.SUCCESS(
                     f'Successfully imported {measurements_created} measurements for transformer "{transformer.name}"'
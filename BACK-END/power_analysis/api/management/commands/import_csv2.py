@@ -5,6 +5,7 @@ import datetime
 from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth import get_user_model
 from api.models import Transformer, TransformerMeasurement
+from api.ingest import INGEST_BATCH_SIZE, MeasurementBatch
 
 User = get_user_model()
 
@@ -16,6 +17,7 @@ class Command(BaseCommand):
         parser.add_argument('--username', type=str, required=True, help='Username of the owner of the transformers')
         parser.add_argument('--fdd_labels', type=str, required=True, help='Path to FDD labels CSV file')
         parser.add_argument('--rul_labels', type=str, required=True, help='Path to RUL labels CSV file')
+        parser.add_argument('--batch-size', type=int, default=INGEST_BATCH_SIZE, help='Measurements inserted per transaction')
 
     def load_labels(self, label_file):
         labels = {}
@@ -30,6 +32,10 @@ class Command(BaseCommand):
                 labels[transformer_file] = value
         return labels
 
+    def report_row_error(self, row, error, transformer_name):
+        # Rows the database rejects are only found when their batch is saved
+        self.stdout.write(self.style.WARNING(f'Error creating measurement for {transformer_name}: {str(error)}\nRow data: {row}'))
+
     def handle(self, *args, **options):
         data_dir = options['data_dir']
         username = options['username']
@@ -85,6 +91,10 @@ class Command(BaseCommand):
                     total_transformers += 1
 
                 measurements_created = 0
+                batch = MeasurementBatch(
+                    user.id, options['batch_size'],
+                    on_error=lambda row, error, name=transformer_name: self.report_row_error(row, error, name)
+                )
                 try:
                     with open(csv_file_path, 'r') as csvfile:
                         reader = csv.DictReader(csvfile)
@@ -92,7 +102,7 @@ class Command(BaseCommand):
                             try:
                                 # Create measurement with FDD and RUL from labels
                                 
-                                measurement = TransformerMeasurement.objects.create(
+                                batch.add(TransformerMeasurement(
                                     transformer=transformer,
                                     co=float(row['CO']),
                                     h2=float(row['H2']),
@@ -102,8 +112,7 @@ class Command(BaseCommand):
                                     rul=rul_value,
                                     timestamp=datetime.datetime.now(),  # You may want to adjust this based on your needs
                                     temperature=None  # Add temperature if available in your data
-                                )
-                                measurements_created += 1
+                                ), row)
 
                             except Exception as e:
                                 self.stdout.write(
@@ -113,6 +122,7 @@ class Command(BaseCommand):
                                 )
                                 continue
 
+                    measurements_created = batch.flush()
                     total_measurements += measurements_created
                     self.stdout.write(
                         self.style.SUCCESS(
@@ -5,6 +5,7 @@ import random
 from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth import get_user_model
 from api.models import Transformer, TransformerMeasurement
+from api.ingest import INGEST_BATCH_SIZE, MeasurementBatch
 
 User = get_user_model()
 
@@ -16,6 +17,11 @@ class Command(BaseCommand):
         parser.add_argument('--transformer_id', type=int, help='Transformer ID to associate with measurements')
         parser.add_argument('--transformer_name', type=str, help='Create or use transformer with this name')
         parser.add_argument('--username', type=str, help='Username of the owner of the transformer')
+        parser.add_argument('--batch-size', type=int, default=INGEST_BATCH_SIZE, help='Measurements inserted per transaction')
+
+    def report_row_error(self, row, error):
+        # Rows the database rejects are only found when their batch is saved
+        self.stdout.write(self.style.WARNING(f'Error creating measurement: {str(error)}\nRow data: {row}'))
 
     def handle(self, *args, **options):
         csv_file_path = options['csv_file']
@@ -52,6 +58,7 @@ class Command(BaseCommand):
                 raise CommandError('Either transformer_id or transformer_name is required')
 
             measurements_created = 0
+            batch = MeasurementBatch(user.id, options['batch_size'], on_error=self.report_row_error)
             with open(csv_file_path, 'r') as csvfile:
                 reader = csv.DictReader(csvfile)
                 for row in reader:
@@ -72,7 +79,7 @@ class Command(BaseCommand):
                             rul = random.uniform(1000, 1200)
 
                         # Create measurement
-                        measurement = TransformerMeasurement.objects.create(
+                        batch.add(TransformerMeasurement(
                             transformer=transformer,
                             co=float(row['co']),
                             h2=float(row['h2']),
@@ -82,8 +89,7 @@ class Command(BaseCommand):
                             rul=rul,
                             timestamp=timestamp,
                             temperature=float(row['temperature']) if row['temperature'] else None
-                        )
-                        measurements_created += 1
+                        ), row)
 
                     except Exception as e:
                         self.stdout.write(
@@ -93,6 +99,8 @@ class Command(BaseCommand):
                         )
                         continue
 
+            measurements_created = batch.flush()
+
             self.stdout.write(
                 self.style.SUCCESS(
                     f'Successfully imported {measurements_created} measurements for transformer "{transformer.name}"'
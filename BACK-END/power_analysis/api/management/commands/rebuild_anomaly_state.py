@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from api.anomaly import rebuild_states
+from api.models import Transformer, TransformerMeasurement
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the streaming anomaly-detection state of transformers from their stored measurements'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transformer_id', type=int, action='append', help='Only rebuild this transformer (repeatable)')
+        parser.add_argument('--notify', action='store_true', help='Record anomalies found in the history and notify owners')
+
+    def handle(self, *args, **options):
+        transformers = Transformer.objects.all()
+        if options['transformer_id']:
+            transformers = transformers.filter(id__in=options['transformer_id'])
+        transformer_ids = list(transformers.values_list('id', flat=True))
+
+        # One streamed pass over the history, in the order the states are updated
+        measurements = (
+            TransformerMeasurement.objects.filter(transformer_id__in=transformer_ids)
+            .select_related('transformer__user')
+            .order_by('transformer_id', 'timestamp', 'id')
+            .iterator(chunk_size=2000)
+        )
+        found = rebuild_states(transformer_ids, measurements, notify=options['notify'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt anomaly state for {len(transformer_ids)} transformers ({found} anomalous measurements in history)'
+        ))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from api.notifications import repair_counters
+
+
+class Command(BaseCommand):
+    help = 'Reconcile the denormalized unread-notification counters with the notification rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user_id', type=int, action='append', help='Only repair this user (repeatable)')
+
+    def handle(self, *args, **options):
+        fixed = repair_counters(options['user_id'])
+        self.stdout.write(self.style.SUCCESS(f'Repaired {fixed} notification counters'))
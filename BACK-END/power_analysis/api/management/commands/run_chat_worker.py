@@ -0,0 +1,24 @@
+import asyncio
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from api.chat_model import ChatModel
+from api.inference import serve
+
+
+class Command(BaseCommand):
+    help = 'Hold the chat model in one process and serve generation to all web workers over a Unix socket'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', help='Socket path (default: AI_MODEL_SETTINGS["WORKER_SOCKET"])')
+
+    def handle(self, *args, **options):
+        path = options['socket'] or settings.AI_MODEL_SETTINGS['WORKER_SOCKET']
+        if not path:
+            raise CommandError('Set CHAT_WORKER_SOCKET or pass --socket')
+
+        ChatModel.load()
+        self.stdout.write(self.style.SUCCESS(f'Chat model loaded in {ChatModel.local_status()["load_seconds"]}s'))
+        try:
+            asyncio.run(serve(path))
+        except KeyboardInterrupt:
+            self.stdout.write('Inference worker stopped')
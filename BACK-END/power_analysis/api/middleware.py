@@ -1,6 +1,7 @@
 import time
 import logging
 from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
 
 logger = logging.getLogger(__name__)
 
@@ -25,4 +26,19 @@ class AIChatMiddleware:
             )
             
             return response
-        return self.get_response(request)
\ No newline at end of file
+        return self.get_response(request)
+
+class LargeResponseGZipMiddleware(GZipMiddleware):
+    """
+    Gzip responses only when the client accepts it and the body is large.
+
+    Small JSON bodies are not worth the CPU, and streamed exports already pick
+    their own encoding (csv.gz, parquet), so both are passed through untouched.
+    """
+
+    def process_response(self, request, response):
+        if response.streaming:
+            return response
+        if len(response.content) < settings.RESPONSE_COMPRESSION_MIN_BYTES:
+            return response
+        return super().process_response(request, response)
@@ -1,9 +1,10 @@
 import pandas as pd  
 from django.contrib.auth.models import AbstractUser, User
-from django.db import models
+from django.db import models, transaction
 import numpy as np
 from .ml_model import FDD_MODEL,RUL_MODEL , FDD_SCALER,RUL_SCALER , le # Import the globally loaded model
 import logging
+import requests
 from django.utils import timezone
 
 from tsfresh import extract_features
@@ -12,6 +13,9 @@ from tsfresh.feature_extraction import MinimalFCParameters
 
 logger = logging.getLogger(__name__)
 
+# What compute_fdd_rul raises when the predictor is down or answers with something unexpected
+PREDICTOR_ERRORS = (requests.RequestException, ValueError, KeyError, TypeError)
+
 class CustomUser(AbstractUser):
     email = models.EmailField(unique=True, blank=False, null=False)
     phone = models.CharField(max_length=50, blank=True, null=True,unique=True)
@@ -47,6 +51,11 @@ class TransformerMeasurement(models.Model):
     rul = models.FloatField(null=True, blank=True)
     temperature = models.FloatField(null=True, blank=True)
     timestamp = models.DateTimeField(auto_now_add=False, default=timezone.now)
+    # Owner's change version at the last write, used as the delta-sync cursor
+    change_seq = models.BigIntegerField(default=0)
+    # Rule-based diagnosis (see api.dga): IEEE C57.104 condition 1-4 and IEC 60599 fault code
+    dga_condition = models.IntegerField(null=True, blank=True)
+    dga_fault = models.CharField(max_length=4, blank=True, default='')
 
     # def compute_fdd_rul(self):
     #     try:
@@ -158,7 +167,6 @@ class TransformerMeasurement(models.Model):
     #     self.fdd = data['fdd']['predicted_class']
     #     self.rul = data['rul']['predicted_rul']
     def compute_fdd_rul(self):
-        import requests
         response = requests.post("https://full-mugs-wave.loca.lt/predict", json={
             "H2": self.h2,
             "CO": self.co,
@@ -171,13 +179,126 @@ class TransformerMeasurement(models.Model):
 
 
     def save(self, *args, **kwargs):
+        from .versions import bump_change_version
+        from .dga import apply_dga
+        apply_dga([self])
         # if self.co is not None and self.h2 is not None and self.c2h2 is not None and self.c2h4 is not None:
-        self.compute_fdd_rul()
-        super().save(*args, **kwargs)
+        try:
+            self.compute_fdd_rul()
+        except PREDICTOR_ERRORS:
+            # Keep the reading without a prediction: fdd/rul only ever hold model output,
+            # and values predicted from the previous gases would be stale.
+            # dga_condition/dga_fault still carry the rule-based diagnosis.
+            logger.exception("Error computing FDD/RUL, saving the measurement without a prediction")
+            self.fdd = self.rul = None
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'fdd', 'rul', 'dga_condition', 'dga_fault'}
+        # Write the row and take its sequence number in one transaction, so a
+        # delta-sync reader never sees a cursor whose row is not committed yet
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                from .anomaly import observe_measurement
+                # O(1) EWMA update of the transformer's state, flagging unusual readings
+                observe_measurement(self)
+            # Last, so the user's version row stays locked only until commit
+            self.change_seq = bump_change_version(self.transformer.user_id)
+            TransformerMeasurement.objects.filter(pk=self.pk).update(change_seq=self.change_seq)
 
     def __str__(self):
         return f"{self.transformer.name} - FDD: {self.fdd}, RUL: {self.rul} at {self.timestamp}"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['transformer', 'change_seq']),
+            models.Index(fields=['transformer', 'dga_condition']),
+        ]
+
+class ChangeVersion(models.Model):
+    """Per-user counter bumped on every write to the user's transformers or measurements."""
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True, related_name='change_version')
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.user.username} - version {self.version}"
+
+class MeasurementTombstone(models.Model):
+    """
+    Record of a deleted measurement (or, with no measurement_id, of a whole
+    deleted transformer) so delta-sync clients can drop their local copy.
+    """
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='measurement_tombstones')
+    transformer_id = models.BigIntegerField()
+    measurement_id = models.BigIntegerField(null=True, blank=True)
+    change_seq = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Deleted measurement {self.measurement_id} of transformer {self.transformer_id}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'change_seq']),
+        ]
+
+class MeasurementArchive(models.Model):
+    """
+    Cold-storage chunk holding one transformer-month of measurements.
+
+    Rows are stored column-wise as compressed numpy arrays (see api.archive);
+    first/last timestamps let range queries skip chunks without decompressing.
+    """
+    transformer = models.ForeignKey(Transformer, on_delete=models.CASCADE, related_name='archives')
+    month = models.DateField()
+    row_count = models.IntegerField(default=0)
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    data = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.transformer.name} - {self.month:%Y-%m} ({self.row_count} measurements)"
+
+    class Meta:
+        unique_together = ['transformer', 'month']
+
+class TransformerAnomalyState(models.Model):
+    """Streaming EWMA statistics per gas for one transformer (see api.anomaly)."""
+    transformer = models.OneToOneField(Transformer, on_delete=models.CASCADE, primary_key=True, related_name='anomaly_state')
+    state = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.transformer.name} - {self.state.get('count', 0)} measurements observed"
+
+class MeasurementAnomaly(models.Model):
+    """A measurement whose gas levels or rates of change left the transformer's usual range."""
+    transformer = models.ForeignKey(Transformer, on_delete=models.CASCADE, related_name='anomalies')
+    # Cleared when the measurement moves to the archive; timestamp keeps the reference
+    measurement = models.ForeignKey(TransformerMeasurement, on_delete=models.SET_NULL, related_name='anomalies', null=True, blank=True)
+    timestamp = models.DateTimeField()
+    flags = models.JSONField(default=list)  # [{gas, kind, value, expected, score}]
+    max_score = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        gases = ', '.join(sorted({flag['gas'] for flag in self.flags}))
+        return f"{self.transformer.name} - anomaly in {gases} at {self.timestamp}"
+
+    @property
+    def summary(self):
+        parts = [
+            f"{flag['gas'].upper()} {'level' if flag['kind'] == 'level' else 'rate of change'} "
+            f"{flag['value']:.2f} (expected {flag['expected']:.2f})"
+            for flag in self.flags
+        ]
+        return f"Unusual readings on {self.transformer.name}: " + '; '.join(parts)
+
+    class Meta:
+        ordering = ['-created_at']
+
 class SupportSession(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='support_sessions')
     title = models.CharField(max_length=255, blank=True, null=True)
@@ -188,6 +309,13 @@ class SupportSession(models.Model):
     def __str__(self):
         return f"Support request from {self.user.username} at {self.created_at}"
 
+    class Meta:
+        # updated_at is touched on every new message, so it orders sessions by activity
+        indexes = [
+            models.Index(fields=['-updated_at']),
+            models.Index(fields=['user', '-updated_at']),
+        ]
+
 class SupportMessage(models.Model):
     session = models.ForeignKey(SupportSession, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='sent_messages')
@@ -203,17 +331,33 @@ class SupportMessage(models.Model):
 
 class AdminNotification(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='notifications')
-    session = models.ForeignKey(SupportSession, on_delete=models.CASCADE, related_name='notifications')
-    message = models.ForeignKey(SupportMessage, on_delete=models.CASCADE, related_name='notifications')
+    session = models.ForeignKey(SupportSession, on_delete=models.CASCADE, related_name='notifications', null=True, blank=True)
+    message = models.ForeignKey(SupportMessage, on_delete=models.CASCADE, related_name='notifications', null=True, blank=True)
+    # Set instead of session/message for measurement anomaly alerts
+    anomaly = models.ForeignKey(MeasurementAnomaly, on_delete=models.CASCADE, related_name='notifications', null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
     is_for_admin = models.BooleanField(default=True)  # True if for admin, False if for regular user
 
     def __str__(self):
+        if self.anomaly_id:
+            return f"Notification for {self.user.username} about an anomaly on {self.anomaly.transformer.name}"
         return f"Notification for {self.user.username} about message from {self.message.sender.username}"
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'is_for_admin', 'is_read']),
+        ]
+
+class NotificationCounter(models.Model):
+    """Unread AdminNotification counts per user, kept in step by api.notifications."""
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True, related_name='notification_counter')
+    unread_admin = models.IntegerField(default=0)
+    unread_user = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user.username} - {self.unread_admin} admin / {self.unread_user} user unread"
 
 class AIConversation(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
@@ -0,0 +1,150 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, F, Value
+from django.db.models.functions import Greatest
+from .models import AdminNotification, CustomUser, NotificationCounter, SupportMessage
+from .push import publish_notifications, publish_notifications_read, publish_messages_read
+
+logger = logging.getLogger(__name__)
+
+# Large staff fan-outs run here, off the request thread
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='notification-fanout')
+
+
+def _counter_field(is_for_admin):
+    return 'unread_admin' if is_for_admin else 'unread_user'
+
+
+def adjust_unread(user_ids, is_for_admin, delta):
+    """Add ``delta`` to the unread counter of every user in ``user_ids`` (never below zero)."""
+    if not user_ids or not delta:
+        return
+    field = _counter_field(is_for_admin)
+    NotificationCounter.objects.bulk_create(
+        [NotificationCounter(user_id=user_id) for user_id in user_ids], ignore_conflicts=True
+    )
+    NotificationCounter.objects.filter(user_id__in=user_ids).update(
+        **{field: Greatest(F(field) + delta, Value(0))}
+    )
+
+
+def create_notifications(recipient_ids, is_for_admin, **fields):
+    """Insert one unread notification per recipient and bump their counters in the same transaction."""
+    batch_size = settings.NOTIFICATION_SETTINGS['BULK_BATCH_SIZE']
+    with transaction.atomic():
+        notifications = AdminNotification.objects.bulk_create(
+            [AdminNotification(user_id=user_id, is_for_admin=is_for_admin, **fields) for user_id in recipient_ids],
+            batch_size=batch_size
+        )
+        adjust_unread(recipient_ids, is_for_admin, 1)
+        publish_notifications(notifications)
+    return notifications
+
+
+def mark_notifications_read(user, is_for_admin, session=None, **filters):
+    """Mark the user's unread notifications (of ``session``, or matching ``filters``) as read; returns how many changed."""
+    if session is not None:
+        filters['session'] = session
+    with transaction.atomic():
+        count = AdminNotification.objects.filter(
+            user=user, is_for_admin=is_for_admin, is_read=False, **filters
+        ).update(is_read=True)
+        adjust_unread([user.id], is_for_admin, -count)
+        if count:
+            publish_notifications_read(
+                user, is_for_admin, unread_count(user, is_for_admin), session.id if session is not None else None
+            )
+    return count
+
+
+def unread_count(user, is_for_admin):
+    """Primary-key read of the user's unread counter."""
+    counts = NotificationCounter.objects.filter(pk=user.id).values_list(_counter_field(is_for_admin), flat=True)
+    return counts.first() or 0
+
+
+def repair_counters(user_ids=None):
+    """
+    Recompute counters from the notification rows.
+
+    Returns the number of counters that had drifted (e.g. after notifications
+    were removed by a cascading session delete).
+    """
+    users = CustomUser.objects.all()
+    if user_ids is not None:
+        users = users.filter(id__in=user_ids)
+    actual = {}
+    unread = AdminNotification.objects.filter(is_read=False, user__in=users)
+    for row in unread.values('user_id', 'is_for_admin').annotate(count=Count('id')).order_by():
+        actual.setdefault(row['user_id'], {})[_counter_field(row['is_for_admin'])] = row['count']
+
+    fixed = 0
+    with transaction.atomic():
+        stored = {
+            counter.user_id: counter
+            for counter in NotificationCounter.objects.select_for_update().filter(user__in=users)
+        }
+        for user_id in set(stored) | set(actual):
+            counts = actual.get(user_id, {})
+            counter = stored.get(user_id) or NotificationCounter(user_id=user_id)
+            expected = (counts.get('unread_admin', 0), counts.get('unread_user', 0))
+            if (counter.unread_admin, counter.unread_user) != expected or counter.user_id not in stored:
+                counter.unread_admin, counter.unread_user = expected
+                counter.save()
+                fixed += 1
+    return fixed
+
+
+def _background_fan_out(recipient_ids, session_id, message_id):
+    close_old_connections()
+    try:
+        create_notifications(recipient_ids, is_for_admin=True, session_id=session_id, message_id=message_id)
+        logger.info(f"Created {len(recipient_ids)} staff notifications for message {message_id}")
+    except Exception as e:
+        logger.error(f"Error fanning out notifications for message {message_id}: {str(e)}")
+    finally:
+        close_old_connections()
+
+
+def notify_staff(session, message):
+    """
+    Notify every active staff user about a customer message.
+
+    One SELECT for the recipient ids and one bulk INSERT, whatever the team
+    size. Above NOTIFICATION_SETTINGS['BACKGROUND_THRESHOLD'] recipients the
+    INSERT is handed to a background worker once the message is committed.
+    """
+    recipient_ids = list(CustomUser.objects.filter(is_staff=True, is_active=True).values_list('id', flat=True))
+    if len(recipient_ids) > settings.NOTIFICATION_SETTINGS['BACKGROUND_THRESHOLD']:
+        transaction.on_commit(
+            lambda: _executor.submit(_background_fan_out, recipient_ids, session.id, message.id)
+        )
+        return
+    create_notifications(recipient_ids, is_for_admin=True, session_id=session.id, message_id=message.id)
+
+
+def notify_session_user(session, message):
+    """Notify the session owner about a staff reply."""
+    create_notifications([session.user_id], is_for_admin=False, session_id=session.id, message_id=message.id)
+
+
+def mark_session_read_by(session, reader):
+    """
+    Mark a session's notifications and the other side's messages as read for ``reader``.
+
+    Staff read the customer's messages and their admin notifications; the
+    customer reads staff messages and their user notifications.
+    """
+    mark_notifications_read(reader, reader.is_staff, session=session)
+
+    messages = SupportMessage.objects.filter(session=session, is_read=False)
+    if reader.is_staff:
+        # Only mark user's messages as read
+        messages = messages.filter(sender=session.user)
+    else:
+        # Only mark admin's messages as read
+        messages = messages.filter(sender__is_staff=True)
+    if messages.update(is_read=True):
+        publish_messages_read(session, reader)
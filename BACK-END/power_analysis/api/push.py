@@ -0,0 +1,76 @@
+import logging
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+STAFF_GROUP = 'staff'
+
+
+def user_group(user_id):
+    return f'user_{user_id}'
+
+
+def _send(groups, event):
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    try:
+        for group in groups:
+            async_to_sync(layer.group_send)(group, {'type': 'push.event', 'event': event})
+    except Exception as e:
+        # Push is best effort; clients still catch up through the REST endpoints
+        logger.error(f"Error pushing {event['type']} event: {str(e)}")
+
+
+def publish(groups, event):
+    """Send ``event`` to the WebSocket groups once the current transaction commits."""
+    groups = list(groups)
+    transaction.on_commit(lambda: _send(groups, event))
+
+
+def publish_message(message):
+    """A new support message goes to the session owner and to every staff socket."""
+    publish([user_group(message.session.user_id), STAFF_GROUP], {
+        'type': 'support_message.created',
+        'message': {
+            'id': message.id,
+            'session': message.session_id,
+            'sender': message.sender_id,
+            'sender_name': message.sender.username,
+            'content': message.content,
+            'timestamp': message.timestamp.isoformat(),
+            'is_read': message.is_read,
+        },
+    })
+
+
+def publish_notifications(notifications):
+    """One event per recipient; the client bumps its unread badge by one."""
+    for notification in notifications:
+        publish([user_group(notification.user_id)], {
+            'type': 'notification.created',
+            'notification': {
+                'id': notification.id,
+                'session': notification.session_id,
+                'message': notification.message_id,
+                'anomaly': notification.anomaly_id,
+                'is_for_admin': notification.is_for_admin,
+            },
+        })
+
+
+def publish_notifications_read(user, is_for_admin, unread_count, session_id=None):
+    publish([user_group(user.id)], {
+        'type': 'notifications.read',
+        'is_for_admin': is_for_admin,
+        'session': session_id,
+        'unread_count': unread_count,
+    })
+
+
+def publish_messages_read(session, reader):
+    """Tell the other side of a session that its messages were read."""
+    groups = [user_group(session.user_id)] if reader.is_staff else [STAFF_GROUP]
+    publish(groups, {'type': 'support_messages.read', 'session': session.id, 'reader': reader.id})
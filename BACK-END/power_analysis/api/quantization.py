@@ -0,0 +1,105 @@
+import copyreg
+import io
+import logging
+import os
+import pickle
+import re
+import types
+import torch
+import transformers
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATION_MODES = ('int8',)
+QUANTIZED_CACHE_DIR = os.path.join(settings.BASE_DIR, '.model_cache', 'quantized')
+
+
+def _qscheme(name):
+    # Allowed when the cache is loaded with weights_only=True, so only ever returns a qscheme
+    scheme = getattr(torch, name, None)
+    if not isinstance(scheme, torch.qscheme):
+        raise ValueError(f"Unknown quantization scheme {name!r}")
+    return scheme
+
+
+class _Pickler(pickle.Pickler):
+    # Quantization schemes have no __module__, so pickle would probe every loaded
+    # module for them, and probing transformers' lazy aliases imports optional packages
+    dispatch_table = {
+        **copyreg.dispatch_table,
+        torch.qscheme: lambda scheme: (_qscheme, (str(scheme).rsplit('.', 1)[-1],)),
+    }
+
+
+# torch.save takes the pickler from a module
+_pickle_module = types.ModuleType('quantized_pickle')
+_pickle_module.Pickler = _Pickler
+
+
+def quantize_int8(model):
+    """
+    Dynamic int8 quantization of every Linear layer, for CPU inference.
+
+    Weights are stored as int8 with a per-tensor scale; activations are
+    quantized on the fly, so no calibration data is needed. Embeddings and
+    norms stay in float32. Returns a quantized copy; ``model`` is untouched.
+    """
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def quantized_path(model_name, mode, cache_dir=QUANTIZED_CACHE_DIR):
+    # Quantized layers' packed weights are only guaranteed to load into the versions that wrote them
+    name = re.sub(r'[^\w.-]', '_', model_name)
+    return os.path.join(
+        cache_dir, f'{name}-{mode}-torch{torch.__version__}-transformers{transformers.__version__}.pt'
+    )
+
+
+def load_quantized_model(model_name, mode='int8', cache_dir=QUANTIZED_CACHE_DIR, load_float=None):
+    """
+    The quantized model, converted on first use and cached on disk.
+
+    The cache holds the model's config and quantized state_dict, read back
+    with ``weights_only=True``: later starts build the quantized model from
+    the config and load the weights into it, without downloading the
+    float32 checkpoint. ``load_float`` returns the float32 model to convert (defaults to
+    downloading ``model_name``).
+    """
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization mode {mode!r}, expected one of {', '.join(QUANTIZATION_MODES)}")
+
+    path = quantized_path(model_name, mode, cache_dir)
+    if os.path.exists(path):
+        logger.info(f"Loading {mode} model from {path}")
+        with torch.serialization.safe_globals([_qscheme]):
+            checkpoint = torch.load(path, weights_only=True)
+        config = transformers.AutoConfig.for_model(**checkpoint['config'])
+        model = quantize_int8(transformers.AutoModelForCausalLM.from_config(config, torch_dtype=torch.float32).eval())
+        model.load_state_dict(checkpoint['state_dict'])
+        return model
+
+    logger.info(f"Quantizing {model_name} to {mode}, cached at {path}")
+    if load_float is None:
+        float_model = transformers.AutoModelForCausalLM.from_pretrained(
+            model_name, cache_dir='.model_cache', torch_dtype=torch.float32
+        )
+    else:
+        float_model = load_float()
+    model = quantize_int8(float_model.eval())
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write then rename, so a concurrent or interrupted start never reads half a file
+    temporary = f'{path}.{os.getpid()}.tmp'
+    torch.save(
+        {'config': model.config.to_dict(), 'state_dict': model.state_dict()}, temporary, pickle_module=_pickle_module
+    )
+    os.replace(temporary, path)
+    return model
+
+
+def model_footprint(model):
+    """Bytes of the model's weights as stored; quantized layers keep theirs outside parameters()."""
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer, pickle_module=_pickle_module)
+    return buffer.tell()
@@ -0,0 +1,132 @@
+import logging
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.utils import timezone
+from .models import AdminNotification, AIConversation, AIMessage, SupportMessage
+from .notifications import adjust_unread
+
+logger = logging.getLogger(__name__)
+
+
+def retention_cutoff(days):
+    return timezone.now() - timedelta(days=days)
+
+
+def delete_in_batches(queryset, batch_size, pause=0.0, before_delete=None):
+    """
+    Delete the rows of ``queryset`` in ascending primary-key batches.
+
+    Each batch is one short transaction: the ids are read first, then the
+    batch is deleted through the same filter, so rows that stopped matching
+    in the meantime are left alone. ``pause`` seconds between batches give
+    writers room when the job runs during business hours.
+
+    Returns the number of rows deleted.
+    """
+    deleted = 0
+    last_pk = 0
+    while True:
+        ids = list(
+            queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        last_pk = ids[-1]
+        with transaction.atomic():
+            if before_delete:
+                before_delete(ids)
+            _, per_model = queryset.filter(pk__in=ids).delete()
+            deleted += per_model.get(queryset.model._meta.label, 0)
+        if pause:
+            time.sleep(pause)
+
+
+def expired_notifications(days):
+    """Read notifications older than ``days``; unread ones are kept whatever their age."""
+    return AdminNotification.objects.filter(is_read=True, created_at__lt=retention_cutoff(days))
+
+
+def collapsible_messages(days):
+    """
+    Messages of resolved sessions inactive for ``days``, except each session's first and last.
+
+    The session keeps its opening question and its final answer, so it still
+    shows up in the list with a preview; the back-and-forth in between goes.
+    """
+    in_session = SupportMessage.objects.filter(session=OuterRef('session'))
+    return (
+        SupportMessage.objects.filter(session__is_resolved=True, session__updated_at__lt=retention_cutoff(days))
+        .exclude(id=Subquery(in_session.order_by('id').values('id')[:1]))
+        .exclude(id=Subquery(in_session.order_by('-id').values('id')[:1]))
+    )
+
+
+def expired_conversations(days):
+    return AIConversation.objects.filter(updated_at__lt=retention_cutoff(days))
+
+
+def _release_message_notifications(message_ids):
+    """Delete notifications of messages about to go, taking unread ones off the counters."""
+    notifications = AdminNotification.objects.filter(message_id__in=message_ids)
+    unread = notifications.filter(is_read=False).values('user_id', 'is_for_admin').annotate(count=Count('id')).order_by()
+    for row in unread:
+        adjust_unread([row['user_id']], row['is_for_admin'], -row['count'])
+    notifications.delete()
+
+
+def _purge_notifications(days, batch_size, pause):
+    return delete_in_batches(expired_notifications(days), batch_size, pause)
+
+
+def _collapse_sessions(days, batch_size, pause):
+    return delete_in_batches(
+        collapsible_messages(days), batch_size, pause, before_delete=_release_message_notifications
+    )
+
+
+def _purge_conversations(days, batch_size, pause):
+    # Messages first, in bounded batches, so no single conversation delete cascades over its whole history
+    conversations = expired_conversations(days)
+    messages = delete_in_batches(AIMessage.objects.filter(conversation__in=conversations), batch_size, pause)
+    logger.info(f"Deleted {messages} messages of expired assistant conversations")
+    return delete_in_batches(conversations, batch_size, pause)
+
+
+# Policy name -> (RETENTION_SETTINGS key with its age in days, rows it removes, apply function)
+# Counts are notifications, support messages and assistant conversations respectively
+RETENTION_POLICIES = {
+    'notifications': ('READ_NOTIFICATION_DAYS', expired_notifications, _purge_notifications),
+    'support_sessions': ('RESOLVED_SESSION_DAYS', collapsible_messages, _collapse_sessions),
+    'ai_conversations': ('AI_CONVERSATION_DAYS', expired_conversations, _purge_conversations),
+}
+
+
+def apply_retention(policy, days=None, batch_size=None, pause=None, dry_run=False):
+    """
+    Run one retention policy.
+
+    Args:
+        policy: Key of RETENTION_POLICIES
+        days: Age in days, defaults to the policy's RETENTION_SETTINGS entry
+        batch_size: Rows per transaction, defaults to RETENTION_SETTINGS['BATCH_SIZE']
+        pause: Seconds between batches, defaults to RETENTION_SETTINGS['PAUSE']
+        dry_run: Only count the rows that would be removed
+    Returns:
+        Number of policy rows deleted (or that would be)
+    """
+    retention_settings = settings.RETENTION_SETTINGS
+    setting, candidates, apply = RETENTION_POLICIES[policy]
+    days = retention_settings[setting] if days is None else days
+    if dry_run:
+        return candidates(days).count()
+
+    deleted = apply(
+        days,
+        batch_size or retention_settings['BATCH_SIZE'],
+        retention_settings['PAUSE'] if pause is None else pause,
+    )
+    logger.info(f"Retention policy {policy} ({days} days) deleted {deleted} rows")
+    return deleted
@@ -0,0 +1,298 @@
+import logging
+import sqlite3
+from django.db import connections, DEFAULT_DB_ALIAS, DatabaseError
+from django.db.models.expressions import RawSQL
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'api_transformer_fts'
+TRIGRAM_INDEX = 'api_transformer_name_trgm'
+# Trigram indexes cannot answer queries shorter than one trigram
+MIN_TRIGRAM_LENGTH = 3
+AUTOCOMPLETE_LIMIT = 10
+
+MESSAGE_FTS_TABLE = 'api_supportmessage_fts'
+SESSION_FTS_TABLE = 'api_supportsession_fts'
+MESSAGE_TSV_INDEX = 'api_supportmessage_content_tsv'
+SESSION_TSV_INDEX = 'api_supportsession_title_tsv'
+
+# External-content FTS5 table over api_transformer.name, kept in sync by triggers
+SQLITE_FTS_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, content='api_transformer', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON api_transformer BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name) VALUES (new.id, new.name);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON api_transformer BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name) VALUES ('delete', old.id, old.name);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF name ON api_transformer BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name) VALUES ('delete', old.id, old.name);
+        INSERT INTO {FTS_TABLE}(rowid, name) VALUES (new.id, new.name);
+    END""",
+]
+
+
+def _word_fts_sql(table, source, column):
+    """External-content, word-tokenized FTS5 table over ``source.column`` with sync triggers."""
+    return [
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(
+            {column}, content='{source}', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+        )""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_ai AFTER INSERT ON {source} BEGIN
+            INSERT INTO {table}(rowid, {column}) VALUES (new.id, new.{column});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_ad AFTER DELETE ON {source} BEGIN
+            INSERT INTO {table}({table}, rowid, {column}) VALUES ('delete', old.id, old.{column});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_au AFTER UPDATE OF {column} ON {source} BEGIN
+            INSERT INTO {table}({table}, rowid, {column}) VALUES ('delete', old.id, old.{column});
+            INSERT INTO {table}(rowid, {column}) VALUES (new.id, new.{column});
+        END""",
+    ]
+
+
+# (table, statements, minimum SQLite version)
+SQLITE_FTS_TABLES = [
+    (FTS_TABLE, SQLITE_FTS_SQL, (3, 34, 0)),
+    (MESSAGE_FTS_TABLE, _word_fts_sql(MESSAGE_FTS_TABLE, 'api_supportmessage', 'content'), None),
+    (SESSION_FTS_TABLE, _word_fts_sql(SESSION_FTS_TABLE, 'api_supportsession', 'title'), None),
+]
+
+POSTGRES_TRIGRAM_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS {TRIGRAM_INDEX} ON api_transformer USING gin (name gin_trgm_ops)",
+    # Expression indexes matching the to_tsvector() calls in search_support
+    f"CREATE INDEX IF NOT EXISTS {MESSAGE_TSV_INDEX} ON api_supportmessage USING gin (to_tsvector('simple', content))",
+    f"CREATE INDEX IF NOT EXISTS {SESSION_TSV_INDEX} ON api_supportsession USING gin (to_tsvector('simple', coalesce(title, '')))",
+]
+
+# Database alias -> set of FTS5 tables that can be queried
+_fts_ready = {}
+
+
+def ensure_search_index(sender=None, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    Create the transformer name and support text indexes for the current backend.
+
+    Connected to post_migrate, so it runs after every migrate and when the
+    test database is created. SQLite gets FTS5 tables (trigram for transformer
+    names, word tokens for support messages and titles), PostgreSQL a pg_trgm
+    GIN index and tsvector GIN indexes; other backends fall back to LIKE.
+    """
+    connection = connections[using]
+    ready = _fts_ready[using] = set()
+    try:
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                existing = set(connection.introspection.table_names(cursor))
+                for table, statements, min_version in SQLITE_FTS_TABLES:
+                    if min_version and sqlite3.sqlite_version_info < min_version:
+                        logger.warning(f"SQLite {sqlite3.sqlite_version} cannot build {table}, its search will use LIKE")
+                        continue
+                    for statement in statements:
+                        cursor.execute(statement)
+                    if table not in existing:
+                        # Index rows that were created before the table existed
+                        cursor.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+                    ready.add(table)
+        elif connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                for statement in POSTGRES_TRIGRAM_SQL:
+                    cursor.execute(statement)
+    except DatabaseError as e:
+        logger.error(f"Error creating search indexes: {str(e)}")
+
+
+def _use_fts(using, table=FTS_TABLE):
+    if using not in _fts_ready:
+        connection = connections[using]
+        if connection.vendor != 'sqlite':
+            _fts_ready[using] = set()
+        else:
+            with connection.cursor() as cursor:
+                names = set(connection.introspection.table_names(cursor))
+            _fts_ready[using] = {name for name, _, _ in SQLITE_FTS_TABLES if name in names}
+    return table in _fts_ready[using]
+
+
+def _fts_phrase(term):
+    """Quote a search term as a single FTS5 phrase so operators in it are ignored."""
+    return '"' + term.replace('"', '""') + '"'
+
+
+def filter_transformers_by_name(queryset, term):
+    """
+    Restrict a Transformer queryset to names containing ``term``.
+
+    Names are stored lower-cased, so matching the lower-cased term keeps the
+    old case-insensitive behaviour while letting the index do the work.
+    """
+    term = term.lower().strip()
+    if not term:
+        return queryset
+
+    if len(term) >= MIN_TRIGRAM_LENGTH and _use_fts(queryset.db):
+        return queryset.filter(id__in=RawSQL(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+            [_fts_phrase(term)]
+        ))
+    # PostgreSQL answers this from the trigram index; elsewhere it scans only the user's transformers
+    return queryset.filter(name__contains=term)
+
+
+def matching_transformer_ids(user, term):
+    """Resolve a name search to the list of matching transformer ids for the user."""
+    from .models import Transformer
+    queryset = filter_transformers_by_name(Transformer.objects.filter(user=user), term)
+    return list(queryset.values_list('id', flat=True))
+
+
+def autocomplete_transformers(user, term, limit=AUTOCOMPLETE_LIMIT):
+    """Return up to ``limit`` (id, name) pairs, prefix matches first."""
+    from .models import Transformer
+    term = term.lower().strip()
+    if not term:
+        return []
+
+    owned = Transformer.objects.filter(user=user)
+    # Prefix matches are a range scan on the (user, name) unique index
+    results = list(
+        owned.filter(name__gte=term, name__lt=term + '\U0010ffff')
+        .order_by('name')
+        .values_list('id', 'name')[:limit]
+    )
+    if len(results) < limit:
+        seen = [pk for pk, _ in results]
+        results += list(
+            filter_transformers_by_name(owned, term)
+            .exclude(id__in=seen)
+            .order_by('name')
+            .values_list('id', 'name')[:limit - len(results)]
+        )
+    return results
+
+
+def _fts_query(term):
+    """Every word of ``term`` must match; the last one also matches as a prefix (search-as-you-type)."""
+    words = term.split()
+    if not words:
+        return ''
+    return ' '.join(_fts_phrase(word) for word in words[:-1]) + f' {_fts_phrase(words[-1])}*'
+
+
+def filter_support_messages(queryset, term):
+    """Restrict a SupportMessage queryset to bodies matching ``term`` (used by the admin changelist)."""
+    term = term.strip()
+    if not term:
+        return queryset
+    if _use_fts(queryset.db, MESSAGE_FTS_TABLE):
+        return queryset.filter(id__in=RawSQL(
+            f"SELECT rowid FROM {MESSAGE_FTS_TABLE} WHERE {MESSAGE_FTS_TABLE} MATCH %s",
+            [_fts_query(term)]
+        ))
+    if connections[queryset.db].vendor == 'postgresql':
+        return queryset.extra(
+            where=["to_tsvector('simple', content) @@ plainto_tsquery('simple', %s)"], params=[term]
+        )
+    return queryset.filter(content__icontains=term)
+
+
+def filter_support_sessions(queryset, term):
+    """Restrict a SupportSession queryset to titles matching ``term``."""
+    term = term.strip()
+    if not term:
+        return queryset
+    if _use_fts(queryset.db, SESSION_FTS_TABLE):
+        return queryset.filter(id__in=RawSQL(
+            f"SELECT rowid FROM {SESSION_FTS_TABLE} WHERE {SESSION_FTS_TABLE} MATCH %s",
+            [_fts_query(term)]
+        ))
+    if connections[queryset.db].vendor == 'postgresql':
+        return queryset.extra(
+            where=["to_tsvector('simple', coalesce(title, '')) @@ plainto_tsquery('simple', %s)"], params=[term]
+        )
+    return queryset.filter(title__icontains=term)
+
+
+def search_support(term, limit, offset=0, using=DEFAULT_DB_ALIAS):
+    """
+    Ranked hits over message bodies and session titles.
+
+    Returns (total, [(kind, id, rank)]) with kind 'message' or 'session' and
+    rows ordered best first. SQLite ranks with FTS5 bm25 (lower is better,
+    negated here), PostgreSQL with ts_rank; other backends fall back to
+    unranked LIKE matching, newest first.
+    """
+    term = term.strip()
+    if not term:
+        return 0, []
+    connection = connections[using]
+
+    if _use_fts(using, MESSAGE_FTS_TABLE) and _use_fts(using, SESSION_FTS_TABLE):
+        query = _fts_query(term)
+        hits_sql = (
+            f"SELECT 'message' AS kind, rowid AS id, -bm25({MESSAGE_FTS_TABLE}) AS rank "
+            f"FROM {MESSAGE_FTS_TABLE} WHERE {MESSAGE_FTS_TABLE} MATCH %s "
+            f"UNION ALL SELECT 'session', rowid, -bm25({SESSION_FTS_TABLE}) "
+            f"FROM {SESSION_FTS_TABLE} WHERE {SESSION_FTS_TABLE} MATCH %s"
+        )
+        params = [query, query]
+    elif connection.vendor == 'postgresql':
+        hits_sql = (
+            "SELECT 'message' AS kind, id, ts_rank(to_tsvector('simple', content), q) AS rank "
+            "FROM api_supportmessage, plainto_tsquery('simple', %s) q WHERE to_tsvector('simple', content) @@ q "
+            "UNION ALL SELECT 'session', id, ts_rank(to_tsvector('simple', coalesce(title, '')), q) "
+            "FROM api_supportsession, plainto_tsquery('simple', %s) q "
+            "WHERE to_tsvector('simple', coalesce(title, '')) @@ q"
+        )
+        params = [term, term]
+    else:
+        hits_sql = (
+            "SELECT 'message' AS kind, id, 0 AS rank FROM api_supportmessage WHERE content LIKE %s "
+            "UNION ALL SELECT 'session', id, 0 FROM api_supportsession WHERE title LIKE %s"
+        )
+        pattern = f"%{term}%"
+        params = [pattern, pattern]
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*) FROM ({hits_sql}) hits", params)
+        total = cursor.fetchone()[0]
+        if not limit or offset >= total:
+            return total, []
+        cursor.execute(
+            f"SELECT kind, id, rank FROM ({hits_sql}) hits ORDER BY rank DESC, id DESC LIMIT %s OFFSET %s",
+            params + [limit, offset]
+        )
+        return total, cursor.fetchall()
+
+
+class SupportSearchResults:
+    """
+    Lazy sequence over search_support hits for Django's Paginator.
+
+    The paginator only asks for ``count()`` and one slice, so a page costs
+    a COUNT and a LIMIT/OFFSET query over the index, never the whole result set.
+    """
+
+    def __init__(self, term, using=DEFAULT_DB_ALIAS):
+        self.term = term
+        self.using = using
+        self._total = None
+
+    def count(self):
+        if self._total is None:
+            self._total, _ = search_support(self.term, limit=0, using=self.using)
+        return self._total
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            raise TypeError('SupportSearchResults only supports slicing')
+        start = index.start or 0
+        stop = index.stop if index.stop is not None else self.count()
+        self._total, hits = search_support(self.term, limit=max(stop - start, 0), offset=start, using=self.using)
+        return hits
@@ -43,10 +43,55 @@ class TransformerSerializer(serializers.ModelSerializer):
         model = Transformer
         fields = ['id', 'name', 'user']
     
-class TransformerMeasurementSerializer(serializers.ModelSerializer):
+class TransformerStatsSerializer(TransformerSerializer):
+    """Transformer with the measurement statistics added by fleet.annotate_transformer_stats."""
+    measurement_count = serializers.IntegerField(read_only=True)
+    first_timestamp = serializers.DateTimeField(read_only=True)
+    last_timestamp = serializers.DateTimeField(read_only=True)
+    latest_fdd = serializers.FloatField(read_only=True)
+    latest_rul = serializers.FloatField(read_only=True)
+    rul_trend = serializers.FloatField(read_only=True)
+
+    class Meta(TransformerSerializer.Meta):
+        fields = TransformerSerializer.Meta.fields + [
+            'measurement_count', 'first_timestamp', 'last_timestamp', 'latest_fdd', 'latest_rul', 'rul_trend'
+        ]
+
+class SparseFieldsetMixin:
+    """Drop every field not listed in the request's ``?fields=`` parameter."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return
+        requested = [f for f in request.query_params.get('fields', '').split(',') if f]
+        if requested:
+            for name in set(self.fields) - set(requested):
+                self.fields.pop(name)
+
+class TransformerMeasurementSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    # Serializer field name -> column, in output order; used by the values_list() fast path
+    FAST_FIELDS = {
+        'id': 'id',
+        'co': 'co',
+        'h2': 'h2',
+        'c2h2': 'c2h2',
+        'c2h4': 'c2h4',
+        'fdd': 'fdd',
+        'rul': 'rul',
+        'temperature': 'temperature',
+        'timestamp': 'timestamp',
+        'change_seq': 'change_seq',
+        'dga_condition': 'dga_condition',
+        'dga_fault': 'dga_fault',
+        'transformer': 'transformer_id',
+    }
+
     class Meta:
         model = TransformerMeasurement
         fields = '__all__'
+        read_only_fields = ['change_seq', 'dga_condition', 'dga_fault']
 
 class SupportMessageSerializer(serializers.ModelSerializer):
     sender_name = serializers.SerializerMethodField()
@@ -79,24 +124,74 @@ class SupportSessionSerializer(serializers.ModelSerializer):
     def get_user_name(self, obj):
         return obj.user.username
 
+class SupportSessionSummarySerializer(serializers.ModelSerializer):
+    """Session list row: last message preview and unread count instead of the whole thread."""
+    PREVIEW_LENGTH = 120
+
+    user_name = serializers.CharField(source='user.username', read_only=True)
+    last_message = serializers.SerializerMethodField()
+    unread_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = SupportSession
+        fields = ['id', 'user', 'user_name', 'title', 'created_at', 'updated_at', 'is_resolved', 'last_message', 'unread_count']
+        read_only_fields = fields
+
+    def get_last_message(self, obj):
+        if obj.last_message_id is None:
+            return None
+        content = obj.last_message_content
+        return {
+            'id': obj.last_message_id,
+            'sender': obj.last_message_sender,
+            'content': content[:self.PREVIEW_LENGTH] + "..." if len(content) > self.PREVIEW_LENGTH else content,
+            'timestamp': serializers.DateTimeField().to_representation(obj.last_message_timestamp),
+        }
+
 class AdminNotificationSerializer(serializers.ModelSerializer):
     sender_name = serializers.SerializerMethodField()
     message_content = serializers.SerializerMethodField()
     session_title = serializers.SerializerMethodField()
+    # 'anomaly' notifications link to a transformer's measurement instead of a support session
+    notification_type = serializers.SerializerMethodField()
+    transformer = serializers.SerializerMethodField()
+    measurement = serializers.SerializerMethodField()
+    anomaly_timestamp = serializers.SerializerMethodField()
     
     class Meta:
         model = AdminNotification
-        fields = ['id', 'user', 'session', 'message', 'created_at', 'is_read', 
-                 'sender_name', 'message_content', 'session_title']
-        read_only_fields = ['id', 'created_at', 'sender_name', 'message_content', 'session_title']
+        fields = ['id', 'user', 'session', 'message', 'anomaly', 'created_at', 'is_read', 
+                 'sender_name', 'message_content', 'session_title',
+                 'notification_type', 'transformer', 'measurement', 'anomaly_timestamp']
+        read_only_fields = ['id', 'created_at', 'anomaly', 'sender_name', 'message_content', 'session_title',
+                            'notification_type', 'transformer', 'measurement', 'anomaly_timestamp']
+    
+    def get_notification_type(self, obj):
+        return 'anomaly' if obj.anomaly_id else 'support_message'
+    
+    def get_transformer(self, obj):
+        return obj.anomaly.transformer_id if obj.anomaly_id else None
+    
+    def get_measurement(self, obj):
+        # None once the measurement has been archived
+        return obj.anomaly.measurement_id if obj.anomaly_id else None
+    
+    def get_anomaly_timestamp(self, obj):
+        return obj.anomaly.timestamp.isoformat() if obj.anomaly_id else None
     
     def get_sender_name(self, obj):
+        if obj.anomaly_id:
+            return 'system'
         return obj.message.sender.username
     
     def get_message_content(self, obj):
+        if obj.anomaly_id:
+            return obj.anomaly.summary
         return obj.message.content
     
     def get_session_title(self, obj):
+        if obj.anomaly_id:
+            return f"Anomaly on {obj.anomaly.transformer.name}"
         return obj.session.title or f"Support request from {obj.session.user.username}"
 
 class AIMessageSerializer(serializers.ModelSerializer):
@@ -0,0 +1,59 @@
+import logging
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import CustomUser, Transformer, TransformerMeasurement, MeasurementTombstone
+from .versions import bump_change_version
+
+logger = logging.getLogger(__name__)
+
+
+def _deleted_via(origin, model):
+    """True if a delete was started on ``model`` (an instance or a queryset of it)."""
+    if isinstance(origin, QuerySet):
+        return origin.model is model
+    return isinstance(origin, model)
+
+
+def _owner_id(measurement):
+    """Return the user id owning a measurement's transformer, or None if it is already gone."""
+    try:
+        return measurement.transformer.user_id
+    except Transformer.DoesNotExist:
+        return None
+
+
+# Measurement saves bump the version themselves (TransformerMeasurement.save),
+# because the new version is also stored on the row as its change_seq.
+
+@receiver(post_delete, sender=TransformerMeasurement)
+def measurement_deleted(sender, instance, origin=None, **kwargs):
+    # Cascades from a transformer or user delete are recorded once by the parent
+    if not _deleted_via(origin, TransformerMeasurement):
+        return
+    user_id = _owner_id(instance)
+    if user_id is not None:
+        MeasurementTombstone.objects.create(
+            user_id=user_id,
+            transformer_id=instance.transformer_id,
+            measurement_id=instance.id,
+            change_seq=bump_change_version(user_id)
+        )
+
+
+@receiver(post_save, sender=Transformer)
+def transformer_saved(sender, instance, **kwargs):
+    bump_change_version(instance.user_id)
+
+
+@receiver(post_delete, sender=Transformer)
+def transformer_deleted(sender, instance, origin=None, **kwargs):
+    # The user's version row is deleted along with the user
+    if _deleted_via(origin, CustomUser):
+        return
+    # One tombstone without measurement_id covers every measurement of the transformer
+    MeasurementTombstone.objects.create(
+        user_id=instance.user_id,
+        transformer_id=instance.id,
+        change_seq=bump_change_version(instance.user_id)
+    )
@@ -1,6 +1,80 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import importlib
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from unittest.mock import AsyncMock, patch
+
+import numpy as np
+import requests
+import torch
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.auth import AuthMiddlewareStack
+from channels.routing import URLRouter
+from channels.security.websocket import AllowedHostsOriginValidator
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.admin.sites import site
 from django.contrib.auth.models import User
-from .models import Transformer, TransformerMeasurement
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from power_analysis import wsgi
+from transformers import Qwen2Config, Qwen2ForCausalLM
+
+from . import notifications
+from .answer_cache import AnswerCache
+from .chat_model import ChatModel, _IncrementalText, cancel_stream, close_stream, open_stream
+from .dga import evaluate_dga
+from .generation import GenerationScheduler
+from .inference import serve
+from .ingest import MeasurementBatch
+from .models import (
+    AIConversation, AIMessage, AdminNotification, ChangeVersion, CustomUser, MeasurementAnomaly,
+    MeasurementArchive, MeasurementTombstone, NotificationCounter, SupportMessage, SupportSession,
+    Transformer, TransformerAnomalyState, TransformerMeasurement,
+)
+from .notifications import create_notifications, notify_staff, unread_count
+from .quantization import load_quantized_model, model_footprint, quantized_path
+from .routing import websocket_urlpatterns
+from .serializers import TransformerMeasurementSerializer
+from .views import ChatViewSet
+
+
+def create_user(username, **extra):
+    return CustomUser.objects.create_user(username=username, email=f'{username}@example.com', password='12345', **extra)
+
+
+def authenticated_client(user):
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client
+
+
+class APITestCase(TestCase):
+    """
+    A user named ``username`` with an API client logged in as them.
+
+    Subclasses that set ``transformer_name`` also get ``self.transformer``,
+    owned by that user. Extend setUp() by calling super().setUp() first.
+    """
+    username = 'apiuser'
+    transformer_name = None
+
+    def setUp(self):
+        self.user = create_user(self.username)
+        if self.transformer_name:
+            self.transformer = Transformer.objects.create(user=self.user, name=self.transformer_name)
+        self.client = authenticated_client(self.user)
+
 
 class TransformerMeasurementTests(TestCase):
     def setUp(self):
@@ -80,3 +154,1250 @@ class TransformerMeasurementTests(TestCase):
 
 
 
+
+class MeasurementSeriesTests(APITestCase):
+    username = 'seriesuser'
+    transformer_name = 'series_transformer'
+
+    def setUp(self):
+        super().setUp()
+        start = timezone.now() - timedelta(days=30)
+
+        # bulk_create skips save(), so no FDD/RUL prediction is requested
+        measurements = [
+            TransformerMeasurement(
+                transformer=self.transformer,
+                h2=10 + (i % 7),
+                co=20 + (i % 5),
+                c2h2=500 if i == 1234 else 1,
+                c2h4=3,
+                timestamp=start + timedelta(minutes=i)
+            )
+            for i in range(5000)
+        ]
+        TransformerMeasurement.objects.bulk_create(measurements)
+
+
+    def test_series_is_bounded_and_keeps_spikes(self):
+        for method in ('lttb', 'minmax'):
+            response = self.client.get('/api/measurements/series/', {
+                'transformer': self.transformer.id,
+                'points': 200,
+                'method': method
+            })
+            self.assertEqual(response.status_code, 200)
+            results = response.data['results']
+            self.assertEqual(response.data['total'], 5000)
+            self.assertLessEqual(len(results), 200)
+            self.assertIn(500, [row['c2h2'] for row in results])
+            timestamps = [row['timestamp'] for row in results]
+            self.assertEqual(timestamps, sorted(timestamps))
+
+    def test_series_requires_transformer(self):
+        response = self.client.get('/api/measurements/series/')
+        self.assertEqual(response.status_code, 400)
+
+class MeasurementExportTests(APITestCase):
+    username = 'exportuser'
+    transformer_name = 'export_transformer'
+
+    def setUp(self):
+        super().setUp()
+        TransformerMeasurement.objects.bulk_create([
+            TransformerMeasurement(transformer=self.transformer, h2=i, co=1, c2h2=2, c2h4=3)
+            for i in range(2500)
+        ])
+
+    def test_csv_and_gzip_exports_stream_every_row(self):
+        response = self.client.get('/api/measurements/export/', {'type': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'transformer', 'transformer_name'])
+        self.assertEqual(len(lines), 2501)
+
+        response = self.client.get('/api/measurements/export/', {'type': 'csv.gz'})
+        self.assertEqual(response.status_code, 200)
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(len(lines), 2501)
+
+    def test_export_rejects_unknown_type(self):
+        response = self.client.get('/api/measurements/export/', {'type': 'xlsx'})
+        self.assertEqual(response.status_code, 400)
+
+class TransformerSearchTests(APITestCase):
+    username = 'searchuser'
+
+    def setUp(self):
+        super().setUp()
+        other = create_user('otheruser')
+        self.north = Transformer.objects.create(user=self.user, name='North Substation T1')
+        self.south = Transformer.objects.create(user=self.user, name='South Substation T2')
+        Transformer.objects.create(user=other, name='North Substation T9')
+        TransformerMeasurement.objects.bulk_create([
+            TransformerMeasurement(transformer=self.north, h2=1, co=1, c2h2=1, c2h4=1),
+            TransformerMeasurement(transformer=self.south, h2=1, co=1, c2h2=1, c2h4=1),
+        ])
+
+    def test_autocomplete_ranks_prefix_matches_first(self):
+        response = self.client.get('/api/transformers/search/', {'q': 'SOUTH'})
+        self.assertEqual([row['name'] for row in response.data], ['south substation t2'])
+
+        response = self.client.get('/api/transformers/search/', {'q': 'substation'})
+        self.assertEqual(len(response.data), 2)
+
+    def test_measurement_search_filters_by_matching_ids(self):
+        response = self.client.get('/api/measurements/', {'search': 'rth sub'})
+        self.assertEqual([row['transformer'] for row in response.data], [self.north.id])
+
+        # Short terms fall back to a substring match
+        response = self.client.get('/api/measurements/', {'search': 't2'})
+        self.assertEqual([row['transformer'] for row in response.data], [self.south.id])
+
+class FleetSummaryTests(APITestCase):
+    username = 'fleetuser'
+
+    def setUp(self):
+        cache.clear()
+        super().setUp()
+        self.healthy = Transformer.objects.create(user=self.user, name='healthy')
+        self.failing = Transformer.objects.create(user=self.user, name='failing')
+        now = timezone.now()
+        TransformerMeasurement.objects.bulk_create([
+            TransformerMeasurement(transformer=self.healthy, h2=1, co=1, c2h2=1, c2h4=1, fdd=4, rul=10, timestamp=now - timedelta(days=2)),
+            TransformerMeasurement(transformer=self.healthy, h2=1, co=1, c2h2=1, c2h4=1, fdd=1, rul=900, timestamp=now),
+            TransformerMeasurement(transformer=self.failing, h2=1, co=1, c2h2=1, c2h4=1, fdd=4, rul=5, timestamp=now),
+        ])
+
+    def test_summary_uses_latest_measurement_per_transformer(self):
+        response = self.client.get('/api/fleet/summary/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['transformer_count'], 2)
+        self.assertEqual(response.data['measurement_count'], 3)
+        self.assertEqual(response.data['fdd_classes'], {'1': 1, '4': 1})
+        self.assertEqual(response.data['critical']['count'], 1)
+        self.assertEqual(response.data['critical']['transformers'][0]['id'], self.failing.id)
+
+    def test_measurement_write_invalidates_cached_summary(self):
+        self.client.get('/api/fleet/summary/')
+        TransformerMeasurement.objects.filter(transformer=self.failing).update(fdd=1, rul=500)
+        # update() bypasses signals, so the cached summary is still served
+        self.assertEqual(self.client.get('/api/fleet/summary/').data['critical']['count'], 1)
+
+        measurement = TransformerMeasurement.objects.get(transformer=self.failing)
+        measurement.save()
+        self.assertEqual(self.client.get('/api/fleet/summary/').data['critical']['count'], 0)
+
+class ConditionalListTests(APITestCase):
+    username = 'etaguser'
+    transformer_name = 'etag_transformer'
+
+    def test_unchanged_list_returns_304_without_querying(self):
+        for url in ('/api/transformers/', '/api/measurements/'):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etag = response['ETag']
+
+            # Only the version lookup (plus session/auth overhead) runs, never the list query
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+
+    def test_write_changes_etag(self):
+        etag = self.client.get('/api/transformers/')['ETag']
+        Transformer.objects.create(user=self.user, name='second')
+        response = self.client.get('/api/transformers/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 2)
+        self.assertNotEqual(response['ETag'], etag)
+
+class SparseFieldsetTests(APITestCase):
+    username = 'fieldsuser'
+    transformer_name = 'fields_transformer'
+
+    def setUp(self):
+        super().setUp()
+        TransformerMeasurement.objects.bulk_create([
+            TransformerMeasurement(transformer=self.transformer, h2=1.5, co=2, c2h2=3, c2h4=4, fdd=1, rul=50)
+        ])
+
+    def test_fast_list_matches_serializer_output(self):
+        response = self.client.get('/api/measurements/')
+        expected = TransformerMeasurementSerializer(TransformerMeasurement.objects.all(), many=True).data
+        self.assertEqual(response.json(), [dict(row) for row in expected])
+
+    def test_fields_parameter_limits_columns(self):
+        response = self.client.get('/api/measurements/', {'fields': 'timestamp,h2'})
+        self.assertEqual(list(response.json()[0]), ['h2', 'timestamp'])
+
+        measurement_id = TransformerMeasurement.objects.get().id
+        response = self.client.get(f'/api/measurements/{measurement_id}/', {'fields': 'id,rul'})
+        self.assertEqual(response.json(), {'id': measurement_id, 'rul': 50.0})
+
+        response = self.client.get('/api/measurements/', {'fields': 'password'})
+        self.assertEqual(response.status_code, 400)
+
+class DeltaSyncTests(APITestCase):
+    username = 'syncuser'
+    transformer_name = 'sync_transformer'
+
+    def _measure(self, transformer=None, **values):
+        # save() assigns change_seq; fdd/rul are preset so no prediction is needed
+        measurement = TransformerMeasurement(
+            transformer=transformer or self.transformer, h2=1, co=1, c2h2=1, c2h4=1, fdd=1, rul=10, **values
+        )
+        measurement.save()
+        return measurement
+
+    def test_changes_since_cursor(self):
+        first = self._measure()
+        snapshot = self.client.get('/api/measurements/changes/', {'since': 0}).data
+        self.assertEqual([row['id'] for row in snapshot['changed']], [first.id])
+
+        second = self._measure()
+        first.h2 = 99
+        first.save()
+        delta = self.client.get('/api/measurements/changes/', {'since': snapshot['cursor']}).data
+        self.assertEqual([row['id'] for row in delta['changed']], [second.id, first.id])
+        self.assertEqual(delta['deleted'], [])
+
+        second_id = second.id
+        second.delete()
+        delta = self.client.get('/api/measurements/changes/', {'since': delta['cursor']}).data
+        self.assertEqual(delta['changed'], [])
+        self.assertEqual(delta['deleted'], [second_id])
+
+    def test_deleted_transformer_is_one_tombstone(self):
+        other = Transformer.objects.create(user=self.user, name='other')
+        for _ in range(3):
+            self._measure(transformer=other)
+        cursor = self.client.get('/api/measurements/changes/').data['cursor']
+
+        other_id = other.id
+        other.delete()
+        delta = self.client.get('/api/measurements/changes/', {'since': cursor}).data
+        self.assertEqual(delta['deleted'], [])
+        self.assertEqual(delta['deleted_transformers'], [other_id])
+        self.assertEqual(MeasurementTombstone.objects.count(), 1)
+
+    def test_changes_are_paged(self):
+        cursor = self.client.get('/api/measurements/changes/').data['cursor']
+        created = [self._measure().id for _ in range(3)]
+        page = self.client.get('/api/measurements/changes/', {'since': cursor, 'limit': 2}).data
+        self.assertTrue(page['has_more'])
+        rest = self.client.get('/api/measurements/changes/', {'since': page['cursor'], 'limit': 2}).data
+        self.assertFalse(rest['has_more'])
+        self.assertEqual([row['id'] for row in page['changed'] + rest['changed']], created)
+
+    def test_version_is_bumped_last_with_one_update(self):
+        self._measure()
+        with CaptureQueriesContext(connection) as queries:
+            measurement = self._measure()
+        statements = [q['sql'] for q in queries.captured_queries if 'SAVEPOINT' not in q['sql']]
+        version = [sql for sql in statements if 'api_changeversion' in sql]
+        self.assertEqual([sql.split()[0] for sql in version], ['UPDATE', 'SELECT'])
+        # Only the row's own change_seq is written after the version is taken
+        self.assertEqual(statements.index(version[0]), len(statements) - 3)
+        self.assertEqual(measurement.change_seq, TransformerMeasurement.objects.get(pk=measurement.pk).change_seq)
+
+class TransformerStatsTests(APITestCase):
+    username = 'statsuser'
+
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        for i in range(5):
+            transformer = Transformer.objects.create(user=self.user, name=f'stats_{i}')
+            TransformerMeasurement.objects.bulk_create([
+                TransformerMeasurement(transformer=transformer, h2=1, co=1, c2h2=1, c2h4=1, fdd=1, rul=900, timestamp=now - timedelta(days=60)),
+                TransformerMeasurement(transformer=transformer, h2=1, co=1, c2h2=1, c2h4=1, fdd=2, rul=500, timestamp=now - timedelta(days=20)),
+                TransformerMeasurement(transformer=transformer, h2=1, co=1, c2h2=1, c2h4=1, fdd=3, rul=400 - i, timestamp=now),
+            ])
+
+    def test_stats_are_annotated_in_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/transformers/', {'include': 'stats'})
+        self.assertEqual(response.status_code, 200)
+        list_queries = [q for q in queries.captured_queries if 'api_transformermeasurement' in q['sql']]
+        self.assertEqual(len(list_queries), 1)
+
+        row = response.data[0]
+        self.assertEqual(row['name'], 'stats_0')
+        self.assertEqual(row['measurement_count'], 3)
+        self.assertEqual(row['latest_fdd'], 3)
+        self.assertEqual(row['latest_rul'], 400)
+        self.assertEqual(row['rul_trend'], -100)
+
+    def test_plain_list_is_unchanged(self):
+        response = self.client.get('/api/transformers/')
+        self.assertEqual(set(response.data[0]), {'id', 'name', 'user'})
+
+
+class MeasurementArchiveTests(APITestCase):
+    username = 'archiveuser'
+    transformer_name = 'archive_transformer'
+
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        # Two readings two years ago, one recent
+        TransformerMeasurement.objects.bulk_create([
+            TransformerMeasurement(transformer=self.transformer, h2=i, co=1, c2h2=1, c2h4=1, fdd=1, rul=100 - i,
+                                   timestamp=now - timedelta(days=730) + timedelta(hours=i))
+            for i in range(1, 3)
+        ] + [
+            TransformerMeasurement(transformer=self.transformer, h2=3, co=1, c2h2=1, c2h4=1, fdd=1, rul=50, timestamp=now),
+        ])
+
+    def _compact(self):
+        call_command('compact_measurements', stdout=StringIO())
+
+    def test_old_months_move_to_archive(self):
+        self._compact()
+        self.assertEqual(TransformerMeasurement.objects.count(), 1)
+        archive = MeasurementArchive.objects.get()
+        self.assertEqual(archive.row_count, 2)
+
+        # A second run has nothing left to move
+        self._compact()
+        self.assertEqual(MeasurementArchive.objects.get().row_count, 2)
+
+    def test_archived_rows_are_not_tombstoned(self):
+        cursor = self.client.get('/api/measurements/changes/').data['cursor']
+        self._compact()
+        self.assertFalse(MeasurementTombstone.objects.exists())
+        self.assertEqual(self.client.get('/api/measurements/changes/', {'since': cursor}).data['deleted'], [])
+
+    def test_reads_include_archived_rows(self):
+        self._compact()
+        response = self.client.get('/api/measurements/export/', {'ordering': 'timestamp'})
+        lines = b''.join(response.streaming_content).decode().strip().splitlines()
+        self.assertEqual([line.split(',')[4] for line in lines[1:]], ['1.0', '2.0', '3.0'])
+
+        response = self.client.get('/api/measurements/series/', {'transformer': self.transformer.id})
+        self.assertEqual(response.data['total'], 3)
+        self.assertEqual([point['h2'] for point in response.data['results']], [1.0, 2.0, 3.0])
+
+        start = (timezone.now() - timedelta(days=800)).date()
+        response = self.client.get('/api/measurements/', {'start_date': start.isoformat()})
+        self.assertEqual([row['h2'] for row in response.data], [3.0, 2.0, 1.0])
+        # Archived rows are listed whatever the filters
+        self.assertEqual([row['h2'] for row in self.client.get('/api/measurements/').data], [3.0, 2.0, 1.0])
+        end = (timezone.now() - timedelta(days=400)).date()
+        response = self.client.get('/api/measurements/', {'end_date': end.isoformat(), 'ordering': 'timestamp'})
+        self.assertEqual([row['h2'] for row in response.data], [1.0, 2.0])
+
+    def test_fleet_summary_counts_archived_rows(self):
+        self._compact()
+        summary = self.client.get('/api/fleet/summary/').data
+        stats = self.client.get('/api/transformers/', {'include': 'stats'}).data
+        self.assertEqual(summary['measurement_count'], 3)
+        self.assertEqual(summary['measurement_count'], sum(row['measurement_count'] for row in stats))
+
+
+class AnomalyDetectionTests(APITestCase):
+    username = 'anomalyuser'
+    transformer_name = 'anomaly_transformer'
+
+    def _measure(self, hour, h2):
+        measurement = TransformerMeasurement(
+            transformer=self.transformer, h2=h2, co=5, c2h2=1, c2h4=2, fdd=1, rul=10,
+            timestamp=datetime(2024, 1, 1, tzinfo=dt_timezone.utc) + timedelta(hours=hour)
+        )
+        measurement.save()
+        return measurement
+
+    def test_spike_is_flagged_and_notified(self):
+        for hour in range(12):
+            self._measure(hour, 10 + hour % 2)
+        self.assertFalse(MeasurementAnomaly.objects.exists())
+
+        spike = self._measure(12, 500)
+        anomaly = MeasurementAnomaly.objects.get()
+        self.assertEqual(anomaly.measurement, spike)
+        self.assertEqual({(flag['gas'], flag['kind']) for flag in anomaly.flags}, {('h2', 'level'), ('h2', 'rate')})
+
+        listed = self.client.get('/api/admin-notifications/').data
+        self.assertEqual(len(listed), 1)
+        self.assertEqual(listed[0]['sender_name'], 'system')
+        self.assertIn('anomaly_transformer', listed[0]['message_content'])
+        # Linked to the measurement, not to a support session
+        self.assertEqual(listed[0]['notification_type'], 'anomaly')
+        self.assertIsNone(listed[0]['session'])
+        self.assertEqual(listed[0]['transformer'], self.transformer.id)
+        self.assertEqual(listed[0]['measurement'], spike.id)
+
+    def test_rebuild_matches_streaming_state(self):
+        for hour in range(15):
+            self._measure(hour, 10 + hour % 3)
+        streamed = TransformerAnomalyState.objects.get(transformer=self.transformer).state
+
+        TransformerAnomalyState.objects.all().delete()
+        call_command('rebuild_anomaly_state', stdout=StringIO())
+        rebuilt = TransformerAnomalyState.objects.get(transformer=self.transformer).state
+        self.assertEqual(rebuilt['count'], 15)
+        for gas, stats in streamed['gases'].items():
+            self.assertAlmostEqual(rebuilt['gases'][gas]['level']['mean'], stats['level']['mean'])
+            self.assertAlmostEqual(rebuilt['gases'][gas]['rate']['var'], stats['rate']['var'])
+
+    def test_batch_ingest_matches_per_row_saves(self):
+        for hour in range(12):
+            self._measure(hour, 10 + hour % 2)
+        streamed = TransformerAnomalyState.objects.get(transformer=self.transformer).state
+
+        other = Transformer.objects.create(user=self.user, name='anomaly_import')
+        version = ChangeVersion.objects.get(user=self.user).version
+        batch = MeasurementBatch(self.user.id, batch_size=5)
+        for hour in range(13):
+            batch.add(TransformerMeasurement(
+                transformer=other, h2=500 if hour == 12 else 10 + hour % 2, co=5, c2h2=1, c2h4=2, rul=10,
+                timestamp=datetime(2024, 1, 1, tzinfo=dt_timezone.utc) + timedelta(hours=hour)
+            ))
+            if hour == 11:
+                # Same readings as the per-row saves, split across three batches
+                batch.flush()
+                batched = TransformerAnomalyState.objects.get(transformer=other).state
+                self.assertEqual(batched['count'], streamed['count'])
+                for gas, stats in streamed['gases'].items():
+                    self.assertAlmostEqual(batched['gases'][gas]['level']['mean'], stats['level']['mean'])
+                self.assertFalse(MeasurementAnomaly.objects.exists())
+        self.assertEqual(batch.flush(), 13)
+
+        imported = list(TransformerMeasurement.objects.filter(transformer=other).order_by('timestamp'))
+        self.assertEqual([m.change_seq for m in imported], list(range(version + 1, version + 14)))
+        self.assertEqual(ChangeVersion.objects.get(user=self.user).version, version + 13)
+        self.assertTrue(all(m.dga_condition is not None and m.fdd is None for m in imported))
+        self.assertEqual(MeasurementAnomaly.objects.get().measurement, imported[-1])
+
+
+    def test_bad_row_does_not_poison_later_batches(self):
+        errors = []
+        batch = MeasurementBatch(self.user.id, batch_size=4, on_error=lambda source, error: errors.append(source))
+        for row in range(10):
+            # co is NOT NULL, so row 5 fails the INSERT of the second batch
+            batch.add(TransformerMeasurement(
+                transformer=self.transformer, h2=10, co=None if row == 5 else 5, c2h2=1, c2h4=2, rul=10,
+                timestamp=datetime(2024, 1, 1, tzinfo=dt_timezone.utc) + timedelta(hours=row)
+            ), row)
+        self.assertEqual(batch.flush(), 9)
+        self.assertEqual((errors, batch.failed, batch.pending), ([5], 1, []))
+        self.assertEqual(TransformerMeasurement.objects.count(), 9)
+        change_seqs = TransformerMeasurement.objects.values_list('change_seq', flat=True)
+        self.assertEqual(len(set(change_seqs)), 9)
+        self.assertEqual(TransformerAnomalyState.objects.get(transformer=self.transformer).state['count'], 9)
+
+    def test_import_command_skips_only_the_bad_rows(self):
+        path = os.path.join(tempfile.mkdtemp(), 'readings.csv')
+        with open(path, 'w') as csvfile:
+            csvfile.write('timestamp,co,h2,c2h2,c2h4,fdd,rul,temperature\n')
+            for row in range(6):
+                co = 'x' if row == 2 else '5'
+                csvfile.write(f'1/{row + 1}/2024 10:00,{co},10,1,2,1,100,\n')
+        out = StringIO()
+        call_command('import_csv', path, transformer_id=self.transformer.id, username=self.user.username, batch_size=4, stdout=out)
+        self.assertEqual(TransformerMeasurement.objects.filter(transformer=self.transformer).count(), 5)
+        self.assertIn("Row data: {'timestamp': '1/3/2024 10:00'", out.getvalue())
+        self.assertIn('Successfully imported 5 measurements', out.getvalue())
+
+
+class DGARuleTests(APITestCase):
+    username = 'dgauser'
+    transformer_name = 'dga_transformer'
+
+    def test_rules_are_evaluated_per_column(self):
+        conditions, faults = evaluate_dga({
+            'h2': [50, 900, 50, 50, 50, 50],
+            'co': [100, 100, 100, 100, 800, None],
+            'c2h2': [0, 0, 30, 5, 0, 0],
+            'c2h4': [10, 10, 5, 300, 10, 10],
+        })
+        self.assertEqual(conditions.tolist(), [1, 3, 3, 4, 3, 1])
+        self.assertEqual(faults.tolist(), ['N', 'PD', 'D1', 'T', 'C', 'N'])
+
+    def test_discharge_boundary_is_iec_60599_ratio(self):
+        # D1 needs C2H2/C2H4 > 1; from 1 down to 0.6 it is D2, below that a mixed fault
+        _, faults = evaluate_dga({
+            'h2': [50] * 4, 'co': [100] * 4, 'c2h2': [12, 10, 6, 5], 'c2h4': [10, 10, 10, 10],
+        })
+        self.assertEqual(faults.tolist(), ['D1', 'D2', 'D2', 'DT'])
+
+    def test_ingest_persists_codes_without_predictor(self):
+        with patch.object(TransformerMeasurement, 'compute_fdd_rul', side_effect=requests.ConnectionError('predictor down')):
+            measurement = TransformerMeasurement(transformer=self.transformer, h2=900, co=100, c2h2=0, c2h4=10)
+            measurement.save()
+        measurement.refresh_from_db()
+        self.assertEqual((measurement.dga_condition, measurement.dga_fault), (3, 'PD'))
+        # The rule-based guess is never passed off as a model prediction
+        self.assertEqual((measurement.fdd, measurement.rul), (None, None))
+
+        # A prediction made from the old gases is not kept when the predictor fails on update
+        measurement.fdd, measurement.rul, measurement.h2 = 2, 300, 50
+        with patch.object(TransformerMeasurement, 'compute_fdd_rul', side_effect=KeyError('fdd')):
+            measurement.save(update_fields=['h2'])
+        measurement.refresh_from_db()
+        self.assertEqual((measurement.fdd, measurement.rul, measurement.dga_fault), (None, None, 'N'))
+
+    def test_unexpected_predictor_errors_propagate(self):
+        with patch.object(TransformerMeasurement, 'compute_fdd_rul', side_effect=AttributeError('bug')):
+            with self.assertRaises(AttributeError):
+                TransformerMeasurement(transformer=self.transformer, h2=1, co=1, c2h2=1, c2h4=1).save()
+        self.assertFalse(TransformerMeasurement.objects.exists())
+
+    def test_backfill_command(self):
+        TransformerMeasurement.objects.bulk_create([
+            TransformerMeasurement(transformer=self.transformer, h2=50, co=100, c2h2=30, c2h4=5, fdd=1, rul=10),
+            TransformerMeasurement(transformer=self.transformer, h2=50, co=100, c2h2=0, c2h4=10, fdd=1, rul=10),
+        ])
+        call_command('evaluate_dga', stdout=StringIO())
+        self.assertEqual(
+            list(TransformerMeasurement.objects.order_by('id').values_list('dga_condition', 'dga_fault')),
+            [(3, 'D1'), (1, 'N')]
+        )
+
+
+class NotificationFanOutTests(APITestCase):
+    username = 'customer'
+
+    def setUp(self):
+        super().setUp()
+        self.session = SupportSession.objects.create(user=self.user, title='Help')
+
+    def _add_staff(self, count):
+        start = CustomUser.objects.filter(is_staff=True).count()
+        for i in range(start, start + count):
+            create_user(f'staff{i}', is_staff=True)
+
+    def _post_message(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/support-messages/', {'session': self.session.id, 'content': 'Hello'})
+        self.assertEqual(response.status_code, 201)
+        return len(queries.captured_queries)
+
+    def test_query_count_is_independent_of_staff_size(self):
+        self._add_staff(2)
+        small = self._post_message()
+        self._add_staff(20)
+        large = self._post_message()
+        self.assertEqual(small, large)
+        self.assertEqual(AdminNotification.objects.filter(is_for_admin=True).count(), 2 + 22)
+
+    def test_large_fan_out_runs_after_commit(self):
+        self._add_staff(3)
+        # Run the worker inline on the test connection
+        inline = patch.object(notifications._executor, 'submit', side_effect=lambda fn, *args: fn(*args))
+        keep_connection = patch.object(notifications, 'close_old_connections')
+        with override_settings(NOTIFICATION_SETTINGS={'BULK_BATCH_SIZE': 2, 'BACKGROUND_THRESHOLD': 2}), inline, keep_connection:
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                self._post_message()
+            self.assertFalse(AdminNotification.objects.exists())
+            for callback in callbacks:
+                callback()
+        self.assertEqual(AdminNotification.objects.filter(is_for_admin=True).count(), 3)
+
+
+class NotificationCounterTests(TestCase):
+    def setUp(self):
+        self.user = create_user('counted')
+        self.staff = create_user('agent', is_staff=True)
+        self.session = SupportSession.objects.create(user=self.user, title='Counter')
+        self.user_client = authenticated_client(self.user)
+        self.staff_client = authenticated_client(self.staff)
+
+    def _unread(self, client):
+        return client.get('/api/unread-notifications-count/').data['unread_count']
+
+    def test_counters_follow_create_and_read(self):
+        for _ in range(3):
+            self.user_client.post('/api/support-messages/', {'session': self.session.id, 'content': 'Hi'})
+        self.assertEqual(self._unread(self.staff_client), 3)
+
+        # Replying marks the staff member's notifications for the session as read
+        self.staff_client.post('/api/support-messages/', {'session': self.session.id, 'content': 'Hello'})
+        self.assertEqual(self._unread(self.staff_client), 0)
+        self.assertEqual(self._unread(self.user_client), 1)
+
+        self.user_client.post('/api/admin-notifications/mark_all_as_read/')
+        self.assertEqual(self._unread(self.user_client), 0)
+
+    def test_count_is_a_single_query(self):
+        self.user_client.post('/api/support-messages/', {'session': self.session.id, 'content': 'Hi'})
+        with self.assertNumQueries(1):
+            self.assertEqual(self._unread(self.staff_client), 1)
+
+    def test_repair_command(self):
+        self.user_client.post('/api/support-messages/', {'session': self.session.id, 'content': 'Hi'})
+        NotificationCounter.objects.filter(user=self.staff).update(unread_admin=7)
+        call_command('repair_notification_counters', stdout=StringIO())
+        self.assertEqual(self._unread(self.staff_client), 1)
+
+
+class PushEventTests(APITestCase):
+    username = 'pushuser'
+
+    def setUp(self):
+        super().setUp()
+        self.staff = create_user('pushstaff', is_staff=True)
+        self.session = SupportSession.objects.create(user=self.user, title='Push')
+        staff_client = Client()
+        staff_client.force_login(self.staff)
+        self.staff_cookie = f'{settings.SESSION_COOKIE_NAME}={staff_client.cookies[settings.SESSION_COOKIE_NAME].value}'
+
+    def _post_message(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/support-messages/', {'session': self.session.id, 'content': 'Pushed'})
+
+    def _application(self):
+        # The WebSocket stack alone; the project's ASGI app also starts the chat model
+        return AllowedHostsOriginValidator(AuthMiddlewareStack(URLRouter(websocket_urlpatterns)))
+
+    def _communicator(self, cookie=None, origin=b'http://localhost:5173'):
+        headers = [(b'origin', origin)]
+        if cookie:
+            headers.append((b'cookie', cookie.encode()))
+        return WebsocketCommunicator(self._application(), '/ws/events/', headers=headers)
+
+    async def test_staff_socket_receives_message_and_notification(self):
+        communicator = self._communicator(self.staff_cookie)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+
+        await sync_to_async(self._post_message)()
+        events = [await communicator.receive_json_from(timeout=2) for _ in range(2)]
+        self.assertEqual({event['type'] for event in events}, {'support_message.created', 'notification.created'})
+        message = next(event for event in events if event['type'] == 'support_message.created')['message']
+        self.assertEqual(message['content'], 'Pushed')
+        await communicator.disconnect()
+
+    async def test_socket_without_session_is_rejected(self):
+        connected, code = await self._communicator().connect()
+        self.assertFalse(connected)
+        self.assertEqual(code, 4401)
+
+    @override_settings(ALLOWED_HOSTS=['transformers.example.com'])
+    async def test_socket_from_another_origin_is_rejected(self):
+        connected, _ = await self._communicator(self.staff_cookie, origin=b'https://attacker.example.com').connect()
+        self.assertFalse(connected)
+
+    async def test_asgi_import_does_not_load_chat_model(self):
+        import power_analysis.asgi
+
+        with patch.object(ChatModel, 'start_loading') as start_loading:
+            asgi = importlib.reload(power_analysis.asgi)
+            self.assertEqual(ChatModel._load_state, 'idle')
+            start_loading.assert_not_called()
+
+            receive = AsyncMock(side_effect=[{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+            send = AsyncMock()
+            await asgi.application({'type': 'lifespan'}, receive, send)
+            start_loading.assert_called_once_with()
+        self.assertEqual([c.args[0]['type'] for c in send.call_args_list],
+                         ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+
+
+class SupportQueryCountTests(TestCase):
+    def setUp(self):
+        self.staff = create_user('querystaff', is_staff=True)
+        self.client = authenticated_client(self.staff)
+        self.customers = 0
+
+    def _add_conversations(self, count):
+        for _ in range(count):
+            self.customers += 1
+            customer = create_user(f'querycustomer{self.customers}')
+            session = SupportSession.objects.create(user=customer, title=None)
+            for sender in (customer, self.staff, customer):
+                message = SupportMessage.objects.create(session=session, sender=sender, content='Hi')
+            notify_staff(session, message)
+
+    def _count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries.captured_queries)
+
+    def test_list_query_counts_do_not_grow_with_rows(self):
+        urls = ['/api/support-sessions/', '/api/support-messages/', '/api/admin-notifications/']
+        self._add_conversations(2)
+        small = [self._count_queries(url) for url in urls]
+        self._add_conversations(10)
+        large = [self._count_queries(url) for url in urls]
+        self.assertEqual(small, large)
+
+        listed = self.client.get('/api/admin-notifications/').data
+        self.assertEqual(len(listed), 12)
+        self.assertTrue(listed[0]['session_title'].startswith('Support request from querycustomer'))
+        self.assertEqual({notification['notification_type'] for notification in listed}, {'support_message'})
+
+
+class SupportSessionListTests(TestCase):
+    def setUp(self):
+        self.user = create_user('listuser')
+        self.staff = create_user('liststaff', is_staff=True)
+        self.quiet = SupportSession.objects.create(user=self.user, title='Quiet')
+        self.busy = SupportSession.objects.create(user=self.user, title='Busy')
+        self.user_client = authenticated_client(self.user)
+        self.staff_client = authenticated_client(self.staff)
+
+    def _post(self, client, session, content):
+        return client.post('/api/support-messages/', {'session': session.id, 'content': content}).data
+
+    def test_list_returns_summaries_by_activity(self):
+        self._post(self.user_client, self.quiet, 'first')
+        self._post(self.user_client, self.busy, 'second')
+        self._post(self.user_client, self.busy, 'x' * 300)
+
+        data = self.staff_client.get('/api/support-sessions/').data
+        self.assertEqual(data['count'], 2)
+        busy, quiet = data['results']
+        self.assertEqual((busy['id'], quiet['id']), (self.busy.id, self.quiet.id))
+        self.assertNotIn('messages', busy)
+        self.assertEqual(busy['unread_count'], 2)
+        self.assertTrue(busy['last_message']['content'].endswith('...'))
+
+        # Activity moves a session to the top
+        self._post(self.staff_client, self.quiet, 'reply')
+        data = self.user_client.get('/api/support-sessions/', {'is_resolved': 'false'}).data
+        self.assertEqual(data['results'][0]['id'], self.quiet.id)
+        self.assertEqual(data['results'][0]['unread_count'], 1)
+
+    def test_message_thread_pagination(self):
+        ids = [self._post(self.user_client, self.busy, f'message {i}')['id'] for i in range(5)]
+
+        page = self.user_client.get(f'/api/support-sessions/{self.busy.id}/messages/', {'page_size': 2}).data
+        self.assertEqual([m['id'] for m in page['results']], [ids[4], ids[3]])
+        older = self.user_client.get(page['next']).data
+        self.assertEqual([m['id'] for m in older['results']], [ids[2], ids[1]])
+
+        newer = self.user_client.get(f'/api/support-sessions/{self.busy.id}/messages/', {'after': ids[2]}).data
+        self.assertEqual([m['id'] for m in newer], [ids[3], ids[4]])
+
+
+class SupportSearchTests(TestCase):
+    def setUp(self):
+        self.user = create_user('searchuser')
+        self.staff = create_user('searchstaff', is_staff=True)
+        self.breaker = SupportSession.objects.create(user=self.user, title='Breaker tripped')
+        self.oil = SupportSession.objects.create(user=self.user, title='Oil sample')
+        self.hit = SupportMessage.objects.create(session=self.oil, sender=self.user, content='The breaker tripped twice, breaker is hot')
+        SupportMessage.objects.create(session=self.oil, sender=self.user, content='Nothing relevant here')
+        self.client = authenticated_client(self.staff)
+
+    def test_search_ranks_messages_and_titles(self):
+        data = self.client.get('/api/support-sessions/search/', {'q': 'breaker trip'}).data
+        self.assertEqual(data['count'], 2)
+        kinds = {(hit['type'], hit['session']['id']) for hit in data['results']}
+        self.assertEqual(kinds, {('message', self.oil.id), ('session', self.breaker.id)})
+        message_hit = next(hit for hit in data['results'] if hit['type'] == 'message')
+        self.assertEqual(message_hit['message']['id'], self.hit.id)
+
+    def test_index_follows_writes(self):
+        self.hit.content = 'Replaced the gasket'
+        self.hit.save()
+        self.breaker.delete()
+        self.assertEqual(self.client.get('/api/support-sessions/search/', {'q': 'breaker'}).data['count'], 0)
+        self.assertEqual(self.client.get('/api/support-sessions/search/', {'q': 'gask'}).data['count'], 1)
+
+    def test_search_is_staff_only(self):
+        client = authenticated_client(self.user)
+        self.assertEqual(client.get('/api/support-sessions/search/', {'q': 'breaker'}).status_code, 403)
+        self.assertEqual(self.client.get('/api/support-sessions/search/').status_code, 400)
+
+    def test_admin_search_uses_index(self):
+        admin = site._registry[SupportMessage]
+        results, _ = admin.get_search_results(None, SupportMessage.objects.all(), 'breaker')
+        self.assertEqual(list(results), [self.hit])
+
+
+class RetentionTests(TestCase):
+    def setUp(self):
+        self.user = create_user('retained')
+        self.staff = create_user('retainer', is_staff=True)
+        self.old = timezone.now() - timedelta(days=400)
+        self.session = SupportSession.objects.create(user=self.user, title='Old', is_resolved=True)
+
+    def _run(self, *args):
+        call_command('apply_retention', '--pause', '0', '--batch-size', '2', *args, stdout=StringIO())
+
+    def test_read_notifications_expire(self):
+        read, unread, recent = create_notifications([self.staff.id] * 3, is_for_admin=True, session_id=self.session.id)
+        AdminNotification.objects.filter(id__in=[read.id, unread.id]).update(created_at=self.old)
+        AdminNotification.objects.filter(id__in=[read.id, recent.id]).update(is_read=True)
+
+        self._run('--policy', 'notifications', '--days', '30')
+        self.assertEqual(set(AdminNotification.objects.values_list('id', flat=True)), {unread.id, recent.id})
+
+    def test_resolved_sessions_keep_first_and_last_message(self):
+        messages = [
+            SupportMessage.objects.create(session=self.session, sender=self.user, content=f'message {i}')
+            for i in range(5)
+        ]
+        notify_staff(self.session, messages[2])
+        SupportSession.objects.filter(id=self.session.id).update(updated_at=self.old)
+        active = SupportSession.objects.create(user=self.user, title='Active', is_resolved=True)
+        for i in range(3):
+            SupportMessage.objects.create(session=active, sender=self.user, content=f'active {i}')
+
+        self._run('--policy', 'support_sessions')
+        self.assertEqual(
+            list(self.session.messages.values_list('id', flat=True)), [messages[0].id, messages[4].id]
+        )
+        self.assertEqual(active.messages.count(), 3)
+        # The notification for a removed message went with it, and off the counter
+        self.assertEqual(unread_count(self.staff, True), 0)
+
+    def test_ai_conversations_expire_in_batches(self):
+        old = AIConversation.objects.create(user=self.user)
+        fresh = AIConversation.objects.create(user=self.user)
+        for conversation in (old, fresh):
+            for i in range(3):
+                AIMessage.objects.create(conversation=conversation, role='user', content=f'question {i}')
+        AIConversation.objects.filter(id=old.id).update(updated_at=self.old)
+
+        self._run('--policy', 'ai_conversations', '--dry-run')
+        self.assertTrue(AIConversation.objects.filter(id=old.id).exists())
+        self._run('--policy', 'ai_conversations')
+        self.assertEqual(list(AIConversation.objects.values_list('id', flat=True)), [fresh.id])
+        self.assertEqual(AIMessage.objects.count(), 3)
+
+
+class ChatStreamTests(APITestCase):
+    username = 'streamer'
+
+    def setUp(self):
+        super().setUp()
+        # Views only accept chat requests once a model is loaded
+        loaded = patch.object(ChatModel, '_pipeline', object())
+        loaded.start()
+        self.addCleanup(loaded.stop)
+
+    def _events(self, response):
+        events = []
+        for block in b''.join(response).decode().strip().split('\n\n'):
+            name, data = block.split('\n')
+            events.append((name[len('event: '):], json.loads(data[len('data: '):])))
+        return events
+
+    def test_stream_emits_tokens_and_saves_reply(self):
+        async def fake_stream(input_text, context=None, cancel_event=None, metrics=None, conversation_id=None):
+            for chunk in ['Check ', 'the ', 'oil.']:
+                yield chunk
+
+        with patch.object(ChatViewSet.chat_model, 'stream_response', fake_stream):
+            response = self.client.post('/api/chat/stream/', {'message': 'Why is H2 high?'})
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            events = self._events(response)
+
+        self.assertEqual([name for name, _ in events], ['start', 'token', 'token', 'token', 'done'])
+        done = events[-1][1]
+        self.assertFalse(done['cancelled'])
+        self.assertEqual(done['message']['content'], 'Check the oil.')
+        self.assertEqual(
+            list(AIMessage.objects.filter(conversation_id=done['conversation_id']).values_list('role', flat=True)),
+            ['user', 'assistant']
+        )
+
+    def test_history_window_keeps_a_stable_prefix(self):
+        window = settings.AI_MODEL_SETTINGS['CONTEXT_WINDOW']
+        conversation = AIConversation.objects.create(user=self.user)
+        messages = [
+            AIMessage.objects.create(conversation=conversation, role=('user', 'assistant')[i % 2], content=f'm{i}')
+            for i in range(2 * window + 2)
+        ]
+        view = ChatViewSet()
+        history = view.get_history(conversation, messages[2 * window])
+        self.assertEqual(history[0]['content'], f'm{window}')
+        self.assertEqual(history[-1]['content'], f'm{2 * window - 1}')
+        # One exchange later the context still starts at the same message
+        self.assertEqual(view.get_history(conversation, messages[2 * window + 1])[0], history[0])
+
+    def test_cancel_stops_generation(self):
+        class FakeTokenizer:
+            eos_token_id = 63
+            pad_token_id = 0
+
+            def __call__(self, prompt):
+                return {'input_ids': [1, 2, 3]}
+
+            def decode(self, token_ids, skip_special_tokens=True):
+                return ''.join(f'{token_id} ' for token_id in token_ids)
+
+        class FakePipeline:
+            model = tiny_causal_lm()
+            tokenizer = FakeTokenizer()
+
+        user_id = self.user.id
+        stream_id, cancel_event = open_stream(user_id)
+        self.assertFalse(cancel_stream(user_id + 1, stream_id))
+
+        model = ChatModel()
+        original = ChatModel._pipeline, ChatModel._scheduler
+        ChatModel._pipeline, ChatModel._scheduler = FakePipeline(), None
+        settings_override = dict(settings.AI_MODEL_SETTINGS, MAX_LENGTH=200, TEMPERATURE=0)
+        metrics = {}
+        try:
+            async def collect():
+                chunks = []
+                async for chunk in model.stream_response('Hi', cancel_event=cancel_event, metrics=metrics):
+                    chunks.append(chunk)
+                    cancel_stream(user_id, stream_id)
+                return chunks
+            with override_settings(AI_MODEL_SETTINGS=settings_override):
+                chunks = async_to_sync(collect)()
+        finally:
+            ChatModel._pipeline, ChatModel._scheduler = original
+            close_stream(stream_id)
+
+        self.assertLess(len(chunks), 5)
+        self.assertEqual(metrics['tokens'], len(chunks))
+        self.assertEqual(self.client.post('/api/chat/cancel/', {'stream_id': stream_id}).status_code, 404)
+
+
+def tiny_causal_lm():
+    """Randomly initialised two-layer Qwen2, small enough to run in tests without a download."""
+    torch.manual_seed(0)
+    config = Qwen2Config(
+        vocab_size=64, hidden_size=32, num_hidden_layers=2, num_attention_heads=4,
+        num_key_value_heads=2, intermediate_size=64,
+    )
+    return Qwen2ForCausalLM(config).double().eval()
+
+
+class ByteTokenizer:
+    """One token per UTF-8 byte; records the length of every decode."""
+
+    def __init__(self):
+        self.decoded = []
+
+    def decode(self, token_ids, skip_special_tokens=False):
+        self.decoded.append(len(token_ids))
+        return bytes(token_ids).decode('utf-8', errors='replace')
+
+
+class IncrementalTextTests(TestCase):
+    def test_chunks_add_up_to_the_text_and_decode_a_bounded_window(self):
+        reply = 'Трансформатор ✓ ' * 50
+        tokenizer = ByteTokenizer()
+        text = _IncrementalText(tokenizer)
+        chunks = [text.push(byte) for byte in reply.encode('utf-8')]
+        self.assertEqual(''.join(chunks), reply)
+        self.assertNotIn('\ufffd', ''.join(chunks))
+        # A window spans at most the last character plus the one before it
+        self.assertLessEqual(max(tokenizer.decoded), 6)
+
+
+class GenerationSchedulerTests(TestCase):
+    EOS = 5
+
+    def setUp(self):
+        self.model = tiny_causal_lm()
+        self.scheduler = GenerationScheduler(self.model, eos_token_ids=[self.EOS], max_batch_size=4)
+
+    def _reference(self, prompt, max_new_tokens):
+        """Greedy decoding one sequence at a time, without a cache."""
+        token_ids, generated = list(prompt), []
+        with torch.no_grad():
+            for _ in range(max_new_tokens):
+                token = int(self.model(torch.tensor([token_ids])).logits[0, -1].argmax())
+                if token == self.EOS:
+                    break
+                generated.append(token)
+                token_ids.append(token)
+        return generated
+
+    def _submit(self, prompt, max_new_tokens, on_token=None, cancel_event=None, cache_key=None):
+        tokens, finished = [], threading.Event()
+
+        def collect(token):
+            tokens.append(token)
+            if on_token:
+                on_token(tokens)
+
+        request = self.scheduler.submit(
+            prompt, max_new_tokens, 0, 1.0, collect, lambda error: finished.set(), cancel_event, cache_key
+        )
+        return request, tokens, finished
+
+    def test_batched_output_matches_sequential_decoding(self):
+        # The first two prompts are decoding when the rest arrive; the fifth waits for a free slot
+        running = threading.Event()
+        prompts = [[1, 2, 3], [7, 8, 9, 10, 11, 12, 13], [20, 21], [30, 31, 32, 33], [40]]
+        submitted = [self._submit(prompts[0], 12, on_token=lambda t: len(t) == 3 and running.set())]
+        submitted.append(self._submit(prompts[1], 13))
+        self.assertTrue(running.wait(10))
+        submitted += [self._submit(prompt, 10) for prompt in prompts[2:]]
+
+        for prompt, (request, tokens, finished) in zip(prompts, submitted):
+            self.assertTrue(finished.wait(10))
+            self.assertEqual(tokens, self._reference(prompt, request.max_new_tokens))
+            self.assertEqual(request.metrics()['tokens'], len(tokens))
+        self.assertEqual(self.scheduler.stats()['completed'], 5)
+
+    def test_prefix_cache_reuses_system_prompt_and_conversation(self):
+        system = [10, 11, 12, 13, 14, 15]
+        self.scheduler = GenerationScheduler(
+            self.model, eos_token_ids=[self.EOS], prefix_cache_tokens=100, pinned_prefixes={'system': system}
+        )
+        first = system + [1, 2, 3]
+        request, tokens, finished = self._submit(first, 6, cache_key='conversation')
+        fresh, fresh_tokens, fresh_finished = self._submit([7, 8, 9], 6)
+        self.assertTrue(finished.wait(10) and fresh_finished.wait(10))
+        self.assertEqual(request.prefix_tokens, len(system))
+        self.assertEqual(fresh.prefix_tokens, 0)
+        self.assertEqual(tokens, self._reference(first, 6))
+        self.assertEqual(fresh_tokens, self._reference([7, 8, 9], 6))
+
+        # The next turn starts with the whole previous exchange (its last token was never fed back)
+        second = first + tokens + [30, 31]
+        request, tokens, finished = self._submit(second, 6, cache_key='conversation')
+        self.assertTrue(finished.wait(10))
+        self.assertEqual(request.prefix_tokens, len(first) + 5)
+        self.assertEqual(tokens, self._reference(second, 6))
+        self.assertIsNotNone(request.metrics()['time_to_first_token'])
+
+    def test_cancelled_sequence_leaves_the_batch(self):
+        cancel_event = threading.Event()
+        request, tokens, finished = self._submit(
+            [1, 2, 3], 200, on_token=lambda t: len(t) == 2 and cancel_event.set(), cancel_event=cancel_event
+        )
+        other, other_tokens, other_finished = self._submit([20, 21], 8)
+        self.assertTrue(finished.wait(10))
+        self.assertTrue(other_finished.wait(10))
+        self.assertEqual(len(tokens), 2)
+        self.assertEqual(other_tokens, self._reference([20, 21], 8))
+        self.assertIsNotNone(request.metrics()['tokens_per_second'])
+
+
+class AnswerCacheTests(TestCase):
+    def setUp(self):
+        caches['chat_answers'].clear()
+        self.cache = AnswerCache('test')
+
+    def test_exact_tier_normalizes_questions(self):
+        self.assertEqual(self.cache.lookup('What does high C2H2 mean?'), (None, None))
+        self.cache.store('What does high C2H2 mean?', 'Arcing.')
+        self.assertEqual(self.cache.lookup('  what does HIGH c2h2 mean '), ('Arcing.', 'exact'))
+        self.assertEqual(self.cache.lookup('What does high C2H4 mean?'), (None, None))
+
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['stores']), (1, 2, 1))
+        self.assertEqual(stats['hit_rate'], 0.333)
+
+    def test_only_context_free_short_questions_are_eligible(self):
+        self.assertTrue(self.cache.eligible('What is DGA?', []))
+        self.assertFalse(self.cache.eligible('What is DGA?', [{'role': 'user', 'content': 'Hi'}]))
+        self.assertFalse(self.cache.eligible('x' * 1000, []))
+
+    def test_similarity_tier_catches_paraphrases(self):
+        vocabulary = ['high', 'c2h2', 'mean', 'acetylene', 'level', 'winding']
+
+        def embed(texts):
+            vectors = np.array([[text.split().count(word) for word in vocabulary] for text in texts], dtype=float)
+            return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+
+        self.cache.embedder = embed
+        chat_settings = dict(settings.CHAT_CACHE_SETTINGS, EMBEDDING_MODEL='local', SIMILARITY_THRESHOLD=0.8)
+        with override_settings(CHAT_CACHE_SETTINGS=chat_settings):
+            self.cache.store('What does high C2H2 mean?', 'Arcing.')
+            self.assertEqual(self.cache.lookup('high c2h2, what does it mean'), ('Arcing.', 'similar'))
+            self.assertEqual(self.cache.lookup('winding level'), (None, None))
+
+    def test_chat_model_answers_first_turns_from_cache(self):
+        model = ChatModel()
+        model.get_answer_cache().store('What does high C2H2 mean?', 'Arcing.')
+        metrics = {}
+        # No pipeline is loaded in tests, so only the cache can answer
+        answer = async_to_sync(model.generate_response)('what does high c2h2 mean', [], metrics=metrics)
+        self.assertEqual(answer, 'Arcing.')
+        self.assertEqual(metrics['cache'], 'exact')
+
+
+class ChatModelLoadingTests(APITestCase):
+    username = 'early'
+
+    def setUp(self):
+        caches['chat_answers'].clear()
+        super().setUp()
+
+    def test_chat_before_ready_gets_503(self):
+        response = self.client.get('/api/chat/ready/')
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.data['ready'])
+
+        response = self.client.post('/api/chat/chat/', {'message': 'Why is H2 high?'})
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        response = self.client.post('/api/chat/stream/', {'message': 'Why is H2 high?'})
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(AIMessage.objects.exists())
+
+    def test_cached_first_questions_are_answered_before_ready(self):
+        ChatModel().get_answer_cache().store('What does high C2H2 mean?', 'Arcing.')
+        response = self.client.post('/api/chat/chat/', {'message': 'what does high c2h2 mean'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['message']['content'], 'Arcing.')
+
+    def test_start_loading_runs_in_background(self):
+        def fake_load(cls):
+            cls._pipeline = object()
+
+        self.addCleanup(setattr, ChatModel, '_pipeline', None)
+        self.addCleanup(setattr, ChatModel, '_load_state', 'idle')
+        with override_settings(AI_MODEL_SETTINGS=dict(settings.AI_MODEL_SETTINGS, LOAD_ON_STARTUP=False)):
+            self.assertIsNone(ChatModel.start_loading())
+        self.assertEqual(ChatModel.load_state(), 'disabled')
+
+        with patch.object(ChatModel, '_load_model', classmethod(fake_load)):
+            thread = ChatModel.start_loading()
+            thread.join(5)
+        self.assertEqual(ChatModel.load_state(), 'ready')
+        response = self.client.get('/api/chat/ready/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['ready'])
+
+
+class WSGIEntryPointTests(TestCase):
+    def test_first_request_starts_loading_and_warns_about_buffered_streams(self):
+        self.addCleanup(setattr, wsgi, '_started', wsgi._started)
+        wsgi._started = False
+        environ = RequestFactory().get('/api/chat/ready/').environ
+        with patch.object(ChatModel, 'start_loading') as start_loading:
+            with self.assertLogs('power_analysis.wsgi', 'WARNING') as logs:
+                wsgi.application(environ, lambda status, headers: None)
+            wsgi.application(environ, lambda status, headers: None)
+        start_loading.assert_called_once_with()
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('buffered', logs.output[0])
+
+
+class InferenceWorkerTests(TestCase):
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'chat.sock')
+        loop = asyncio.new_event_loop()
+        started = threading.Event()
+        task = loop.create_task(serve(self.path, ready := asyncio.Event()))
+
+        def run():
+            loop.run_until_complete(ready.wait())
+            started.set()
+            try:
+                loop.run_until_complete(task)
+            except asyncio.CancelledError:
+                pass
+            loop.close()
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        started.wait(5)
+
+        def stop():
+            loop.call_soon_threadsafe(task.cancel)
+            thread.join(5)
+        self.addCleanup(stop)
+
+    def _settings(self, **overrides):
+        # Fresh client, so no status is carried over between settings
+        ChatModel._worker = None
+        return override_settings(
+            AI_MODEL_SETTINGS=dict(settings.AI_MODEL_SETTINGS, **{'MAX_LENGTH': 12, 'TEMPERATURE': 0, **overrides}),
+            CHAT_CACHE_SETTINGS=dict(settings.CHAT_CACHE_SETTINGS, ENABLED=False),
+        )
+
+    def _load_fake_pipeline(self):
+        class FakeTokenizer:
+            eos_token_id = 63
+            pad_token_id = 0
+
+            def __call__(self, prompt):
+                return {'input_ids': [ord(char) % 60 + 1 for char in prompt[-8:]]}
+
+            def decode(self, token_ids, skip_special_tokens=True):
+                return ''.join(f'{token_id} ' for token_id in token_ids)
+
+        class FakePipeline:
+            model = tiny_causal_lm()
+            tokenizer = FakeTokenizer()
+
+        original = ChatModel._pipeline, ChatModel._scheduler
+        ChatModel._pipeline, ChatModel._scheduler = FakePipeline(), None
+        self.addCleanup(setattr, ChatModel, '_pipeline', original[0])
+        self.addCleanup(setattr, ChatModel, '_scheduler', original[1])
+
+    def test_worker_generates_what_the_local_model_would(self):
+        self._load_fake_pipeline()
+        model = ChatModel()
+        with self._settings():
+            local = async_to_sync(model.generate_response)('Hi', [])
+        metrics = {}
+        with self._settings(WORKER_SOCKET=self.path):
+            self.assertTrue(ChatModel.is_ready())
+            remote = async_to_sync(model.generate_response)('Hi', [], metrics=metrics)
+            self.assertIn('generated_tokens', ChatModel.scheduler_stats())
+        self.assertEqual(remote, local)
+        self.assertGreater(metrics['tokens'], 0)
+
+    def test_cancel_reaches_the_worker(self):
+        self._load_fake_pipeline()
+        cancel_event = threading.Event()
+
+        async def collect():
+            chunks = []
+            async for chunk in ChatModel().stream_response('Hi', cancel_event=cancel_event):
+                chunks.append(chunk)
+                cancel_event.set()
+            return chunks
+
+        with self._settings(WORKER_SOCKET=self.path, MAX_LENGTH=200):
+            chunks = async_to_sync(collect)()
+        self.assertLess(len(chunks), 10)
+
+    def test_web_process_reports_worker_state(self):
+        client = authenticated_client(create_user('w'))
+        # Worker up but its model not loaded yet
+        with self._settings(WORKER_SOCKET=self.path):
+            self.assertEqual(client.get('/api/chat/ready/').data['state'], 'idle')
+            self.assertEqual(client.post('/api/chat/chat/', {'message': 'Why is H2 high?'}).status_code, 503)
+        with self._settings(WORKER_SOCKET=self.path + '.missing'):
+            response = client.get('/api/chat/ready/')
+            self.assertEqual((response.status_code, response.data['state']), (503, 'unreachable'))
+
+
+class QuantizationTests(TestCase):
+    def test_quantized_model_is_converted_once_and_cached(self):
+        cache_dir = tempfile.mkdtemp()
+        float_model = tiny_causal_lm().float()
+        conversions = []
+
+        def load_float():
+            conversions.append(1)
+            return float_model
+
+        quantized = load_quantized_model('tiny/model', cache_dir=cache_dir, load_float=load_float)
+        self.assertTrue(os.path.exists(quantized_path('tiny/model', 'int8', cache_dir)))
+        self.assertNotIsInstance(quantized.model.layers[0].mlp.up_proj, torch.nn.Linear)
+        self.assertLess(model_footprint(quantized), model_footprint(float_model))
+
+        reloaded = load_quantized_model('tiny/model', cache_dir=cache_dir, load_float=load_float)
+        self.assertEqual(len(conversions), 1)
+        self.assertNotIsInstance(reloaded.model.layers[0].mlp.up_proj, torch.nn.Linear)
+        input_ids = torch.tensor([[1, 2, 3, 4]])
+        with torch.inference_mode():
+            self.assertTrue(torch.equal(quantized(input_ids).logits, reloaded(input_ids).logits))
+            # Close enough to float32 that greedy decoding picks the same next tokens
+            self.assertTrue(torch.equal(
+                quantized(input_ids).logits.argmax(-1), float_model(input_ids).logits.argmax(-1)
+            ))
+
+    def test_unknown_mode_is_rejected(self):
+        with self.assertRaises(ValueError):
+            load_quantized_model('tiny/model', mode='int4')
+
+    def test_cache_is_anchored_at_the_project_and_loaded_without_unpickling_code(self):
+        self.assertEqual(
+            os.path.dirname(quantized_path('tiny/model', 'int8')),
+            os.path.join(settings.BASE_DIR, '.model_cache', 'quantized'),
+        )
+        cache_dir = tempfile.mkdtemp()
+        load_quantized_model('tiny/model', cache_dir=cache_dir, load_float=lambda: tiny_causal_lm().float())
+        with patch('api.quantization.torch.load', wraps=torch.load) as load:
+            load_quantized_model('tiny/model', cache_dir=cache_dir)
+        self.assertIs(load.call_args.kwargs['weights_only'], True)
@@ -18,6 +18,7 @@ urlpatterns = [
     path('profile/', views.profile, name='profile'),
     path('change-password/', views.change_password, name='change-password'),
     path('delete-account/', views.delete_account, name='delete-account'),
+    path('fleet/summary/', views.fleet_summary, name='fleet-summary'),
     path('unread-notifications-count/', views.unread_notifications_count, name='unread-notifications-count'),
     path('transformers/email_report/', views.TransformerViewSet.as_view({'post': 'email_report'}), name='transformer-email-report'),
 ]
\ No newline at end of file
@@ -0,0 +1,71 @@
+import hashlib
+import logging
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from .models import ChangeVersion
+
+logger = logging.getLogger(__name__)
+
+
+def bump_change_version(user_id, count=1):
+    """
+    Record a write to the user's transformers or measurements and return the new version.
+
+    Bulk writers pass ``count`` to reserve the versions
+    ``result - count + 1 .. result``, one per row.
+
+    The UPDATE locks the version row until the surrounding transaction
+    commits, so writers for the same user are serialized and versions commit
+    in order. Call it as late as possible in the transaction to keep that
+    lock short.
+    """
+    now = timezone.now()
+    versions = ChangeVersion.objects.filter(user_id=user_id)
+    with transaction.atomic():
+        if not versions.update(version=F('version') + count, updated_at=now):
+            # First write recorded for this user
+            _, created = ChangeVersion.objects.get_or_create(
+                user_id=user_id, defaults={'version': count, 'updated_at': now}
+            )
+            if created:
+                return count
+            # Created concurrently by another writer
+            versions.update(version=F('version') + count, updated_at=now)
+        # Reads our own locked row
+        return versions.values_list('version', flat=True).get()
+
+
+def get_change_version(user_id):
+    """Return (version, updated_at) for the user, a primary-key read."""
+    row = ChangeVersion.objects.filter(user_id=user_id).values_list('version', 'updated_at').first()
+    if row is None:
+        # No writes recorded yet; start the clock so Last-Modified is stable
+        obj, _ = ChangeVersion.objects.get_or_create(user_id=user_id)
+        row = (obj.version, obj.updated_at)
+    return row
+
+
+def _request_version(request):
+    """Read the version once per request; both ETag and Last-Modified need it."""
+    if not hasattr(request, '_change_version'):
+        request._change_version = get_change_version(request.user.id)
+    return request._change_version
+
+
+def list_etag(request, *args, **kwargs):
+    version, _ = _request_version(request)
+    # Different filters on the same list must not share a validator
+    query = hashlib.md5(request.META.get('QUERY_STRING', '').encode()).hexdigest()[:12]
+    return f"{request.user.id}-{version}-{query}"
+
+
+def list_last_modified(request, *args, **kwargs):
+    _, updated_at = _request_version(request)
+    return updated_at
+
+
+# Answers If-None-Match / If-Modified-Since with 304 before the queryset is built
+conditional_list = method_decorator(condition(etag_func=list_etag, last_modified_func=list_last_modified))
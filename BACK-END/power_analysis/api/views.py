@@ -1,18 +1,27 @@
-from asgiref.sync import async_to_sync
+from asgiref.sync import async_to_sync, sync_to_async
 import asyncio
+import json
 from django.conf import settings
 from rest_framework import viewsets, status
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
-from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, OuterRef, Prefetch, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.utils.dateparse import parse_date
-from .models import Transformer, TransformerMeasurement, CustomUser, SupportSession, SupportMessage, AdminNotification, AIConversation, AIMessage
+from django.utils import timezone
+from django.http import StreamingHttpResponse
+from django.utils.cache import patch_cache_control
+from .models import Transformer, TransformerMeasurement, MeasurementTombstone, CustomUser, SupportSession, SupportMessage, AdminNotification, AIConversation, AIMessage
 from .serializers import (
     TransformerSerializer, 
+    TransformerStatsSerializer,
     TransformerMeasurementSerializer, 
     UserSerializer,
     UserSignupSerializer,
     SupportSessionSerializer,
+    SupportSessionSummarySerializer,
     SupportMessageSerializer,
     AdminNotificationSerializer,
     AIConversationSerializer,
@@ -22,18 +31,51 @@ import logging
 from django.contrib.auth import update_session_auth_hash
 from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework_simplejwt.tokens import RefreshToken
-from .chat_model import ChatModel
+from .chat_model import ChatModel, ModelNotReady, open_stream, cancel_stream, close_stream
 from .throttles import ChatRateThrottle
+from .push import publish_message
+from .pagination import SupportSessionPagination, SupportMessageCursorPagination
+from .notifications import (
+    notify_staff, notify_session_user, mark_session_read_by,
+    mark_notifications_read, adjust_unread, unread_count
+)
+from .fleet import get_fleet_summary, annotate_transformer_stats
+from .versions import conditional_list, get_change_version
+from .search import matching_transformer_ids, autocomplete_transformers, AUTOCOMPLETE_LIMIT, SupportSearchResults
+from .exports import export_measurements, EXPORT_FORMATS, EXPORT_LOOKUPS
+from .archive import iter_archived_rows, count_archived_rows
+from .downsampling import downsample_measurements, DOWNSAMPLING_METHODS, DEFAULT_POINTS, VALUE_FIELDS, GAS_FIELDS, SERIES_FIELDS
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of changed measurements returned per delta-sync page
+DELTA_SYNC_LIMIT = 5000
+
 class TransformerViewSet(viewsets.ModelViewSet):
     serializer_class = TransformerSerializer
     permission_classes = [IsAuthenticated]
 
+    def include_stats(self):
+        return self.action in ('list', 'retrieve') and self.request.query_params.get('include') == 'stats'
+
     def get_queryset(self):
         """Only return the transformers that belong to the current user."""
-        return Transformer.objects.filter(user=self.request.user)
+        queryset = Transformer.objects.filter(user=self.request.user)
+        if self.include_stats():
+            queryset = annotate_transformer_stats(queryset).order_by('name')
+        return queryset
+
+    def get_serializer_class(self):
+        if self.include_stats():
+            return TransformerStatsSerializer
+        return super().get_serializer_class()
+
+    @conditional_list
+    def list(self, request, *args, **kwargs):
+        """List transformers, answering 304 while the user's data is unchanged."""
+        response = super().list(request, *args, **kwargs)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
 
     def create(self, request, *args, **kwargs):
         """Create a new transformer with form data."""
@@ -59,6 +101,18 @@ class TransformerViewSet(viewsets.ModelViewSet):
         """Automatically associate the transformer with the current user."""
         serializer.save(user=self.request.user)
 
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """Autocomplete transformer names, prefix matches first."""
+        term = request.query_params.get('q', '')
+        try:
+            limit = min(int(request.query_params.get('limit', AUTOCOMPLETE_LIMIT)), 50)
+        except ValueError:
+            limit = AUTOCOMPLETE_LIMIT
+
+        results = autocomplete_transformers(request.user, term, limit=limit)
+        return Response([{'id': pk, 'name': name} for pk, name in results])
+
     @action(detail=False, methods=['post'])
     def email_report(self, request):
         """Handle HTML report email sending."""
@@ -117,9 +171,9 @@ class TransformerMeasurementViewSet(viewsets.ModelViewSet):
         queryset = TransformerMeasurement.objects.filter(transformer__user=self.request.user)
 
         # Search by transformer name
-        search = self.request.query_params.get('search', '')
-        if search:
-            queryset = queryset.filter(transformer__name__icontains=search)
+        transformer_ids = self.get_search_ids()
+        if transformer_ids is not None:
+            queryset = queryset.filter(transformer_id__in=transformer_ids)
 
         # Date range filtering
         start_date = self.request.query_params.get('start_date')
@@ -149,6 +203,65 @@ class TransformerMeasurementViewSet(viewsets.ModelViewSet):
 
         return queryset
 
+    def get_search_ids(self):
+        """Resolve ``?search=`` against the transformer name index once per request."""
+        if not hasattr(self, '_search_ids'):
+            search = self.request.query_params.get('search', '')
+            # Resolve names against the transformer index first, then filter by id
+            self._search_ids = matching_transformer_ids(self.request.user, search) if search else None
+        return self._search_ids
+
+    def get_archive_filters(self):
+        """The list filters in the form api.archive.iter_archived_rows expects."""
+        params = self.request.query_params
+        return {
+            'transformer_ids': self.get_search_ids(),
+            'start_date': parse_date(params.get('start_date') or ''),
+            'end_date': parse_date(params.get('end_date') or ''),
+            'gases': [gas for gas in params.get('gases', '').split(',') if gas],
+        }
+
+    def get_sparse_fields(self):
+        """Validate ``?fields=`` against the serializer, returning the requested names in output order."""
+        requested = [f for f in self.request.query_params.get('fields', '').split(',') if f]
+        available = TransformerMeasurementSerializer.FAST_FIELDS
+        invalid = [f for f in requested if f not in available]
+        if invalid:
+            raise ValidationError({'fields': f'Invalid fields: {", ".join(invalid)}'})
+        return [f for f in available if not requested or f in requested]
+
+    @conditional_list
+    def list(self, request, *args, **kwargs):
+        """List measurements, answering 304 while the user's data is unchanged."""
+        fields = self.get_sparse_fields()
+        if self.paginator is not None:
+            response = super().list(request, *args, **kwargs)
+        else:
+            # Fast read path: plain tuples from the database, no per-row serializer
+            columns = [TransformerMeasurementSerializer.FAST_FIELDS[f] for f in fields]
+            queryset = self.filter_queryset(self.get_queryset())
+            rows = list(queryset.values_list(*columns))
+            # Archived months are part of the list too; only chunks overlapping the filters are read
+            rows = self.stitch_archived(rows, columns)
+            response = Response([dict(zip(fields, row)) for row in rows])
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def stitch_archived(self, rows, columns):
+        """Add matching archived rows to ``rows`` and restore the requested ordering."""
+        archived = list(iter_archived_rows(self.request.user, columns, **self.get_archive_filters()))
+        if not archived:
+            return rows
+        rows = rows + archived
+        ordering = self.request.query_params.get('ordering', '-timestamp')
+        field = ordering.lstrip('-')
+        if field in columns:
+            index = columns.index(field)
+            # None sorts last, as in the database
+            rows.sort(key=lambda row: (row[index] is None, row[index] if row[index] is not None else 0),
+                      reverse=ordering.startswith('-'))
+        return rows
+
     def create(self, request, *args, **kwargs):
         """Create a new measurement with additional error handling."""
         try:
@@ -186,6 +299,146 @@ class TransformerMeasurementViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['get'])
+    def series(self, request):
+        """Return a downsampled, time-ordered measurement series for one transformer."""
+        transformer_id = request.query_params.get('transformer')
+        if not transformer_id:
+            return Response(
+                {'error': 'Transformer ID is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            points = int(request.query_params.get('points', DEFAULT_POINTS))
+        except ValueError:
+            return Response(
+                {'error': 'points must be an integer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        method = request.query_params.get('method', 'lttb')
+        if method not in DOWNSAMPLING_METHODS:
+            return Response(
+                {'error': f'method must be one of: {", ".join(DOWNSAMPLING_METHODS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        fields = [f for f in request.query_params.get('fields', '').split(',') if f] or GAS_FIELDS
+        invalid = [f for f in fields if f not in VALUE_FIELDS]
+        if invalid:
+            return Response(
+                {'error': f'Invalid fields: {", ".join(invalid)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            transformer = Transformer.objects.get(id=transformer_id, user=request.user)
+        except (Transformer.DoesNotExist, ValueError):
+            return Response(
+                {'error': 'Transformer not found or access denied'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        # Same filters as the list endpoint, but always in ascending time order
+        queryset = self.get_queryset().filter(transformer=transformer).order_by('timestamp', 'id')
+        archive_filters = dict(self.get_archive_filters(), transformer_ids=[transformer.id])
+        total = queryset.count() + count_archived_rows(request.user, **archive_filters)
+        # Archived months are always older than the hot rows, so they simply come first
+        archived_rows = iter_archived_rows(request.user, SERIES_FIELDS, **archive_filters)
+        results = downsample_measurements(
+            queryset, total, points=points, method=method, fields=fields, archived_rows=archived_rows
+        )
+
+        return Response({
+            'transformer': transformer.id,
+            'method': method,
+            'total': total,
+            'count': len(results),
+            'results': results,
+        })
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """Measurements created, updated or deleted after the ``since`` cursor."""
+        try:
+            since = int(request.query_params.get('since', 0))
+            limit = min(int(request.query_params.get('limit', DELTA_SYNC_LIMIT)), DELTA_SYNC_LIMIT)
+        except ValueError:
+            return Response(
+                {'error': 'since and limit must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Everything up to the current version is committed (see TransformerMeasurement.save)
+        cursor, _ = get_change_version(request.user.id)
+        changed = TransformerMeasurement.objects.filter(
+            transformer__user=request.user,
+            change_seq__lte=cursor
+        )
+        if since > 0:
+            changed = changed.filter(change_seq__gt=since)
+
+        fields = self.get_sparse_fields()
+        columns = [TransformerMeasurementSerializer.FAST_FIELDS[f] for f in fields] + ['change_seq']
+        changed = changed.order_by('change_seq', 'id').values_list(*columns)
+        if since > 0:
+            rows = list(changed[:limit + 1])
+        else:
+            # The initial snapshot includes rows written before change tracking (change_seq 0),
+            # which cannot be paged by sequence, so it is returned whole like the list endpoint
+            rows = list(changed)
+        has_more = len(rows) > limit and since > 0
+        if has_more:
+            rows = rows[:limit]
+            cursor = rows[-1][-1]
+
+        tombstones = MeasurementTombstone.objects.filter(
+            user=request.user,
+            change_seq__gt=since,
+            change_seq__lte=cursor
+        ).values_list('measurement_id', 'transformer_id')
+
+        return Response({
+            'cursor': cursor,
+            'has_more': has_more,
+            'changed': [dict(zip(fields, row)) for row in rows],
+            'deleted': [m for m, _ in tombstones if m is not None],
+            'deleted_transformers': [t for m, t in tombstones if m is None],
+        })
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """Stream the filtered measurements as CSV, gzip-compressed CSV or Parquet."""
+        export_format = request.query_params.get('type', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {'error': f'type must be one of: {", ".join(EXPORT_FORMATS)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        ordering = request.query_params.get('ordering', '-timestamp')
+        archived_rows = iter_archived_rows(
+            request.user, EXPORT_LOOKUPS, descending=ordering != 'timestamp', **self.get_archive_filters()
+        )
+        try:
+            blocks = export_measurements(
+                self.get_queryset(), export_format,
+                archived_rows=archived_rows, archived_first=ordering == 'timestamp'
+            )
+        except RuntimeError as e:
+            logger.error(f"Export unavailable: {str(e)}")
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_501_NOT_IMPLEMENTED
+            )
+
+        content_type, extension = EXPORT_FORMATS[export_format]
+        filename = f'measurements_{timezone.now().strftime("%Y%m%d_%H%M%S")}.{extension}'
+        response = StreamingHttpResponse(blocks, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
 
 # authentication (login,signup)
 
@@ -320,12 +573,50 @@ def delete_account(request):
 class SupportSessionViewSet(viewsets.ModelViewSet):
     serializer_class = SupportSessionSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = SupportSessionPagination
     
     def get_queryset(self):
         user = self.request.user
-        if user.is_staff:
-            return SupportSession.objects.all()
-        return SupportSession.objects.filter(user=user)
+        queryset = SupportSession.objects.select_related('user')
+        if not user.is_staff:
+            queryset = queryset.filter(user=user)
+
+        if self.action == 'list':
+            is_resolved = self.request.query_params.get('is_resolved')
+            if is_resolved in ('true', 'false'):
+                queryset = queryset.filter(is_resolved=is_resolved == 'true')
+            return self.annotate_summary(queryset).order_by('-updated_at', '-id')
+        if self.action == 'retrieve':
+            # Owner names and every nested message's sender come from two extra queries, not one per row
+            return queryset.prefetch_related(
+                Prefetch('messages', queryset=SupportMessage.objects.select_related('sender'))
+            )
+        return queryset
+
+    def annotate_summary(self, queryset):
+        """Last message and the reader's unread count, as subqueries of the session SELECT."""
+        latest = SupportMessage.objects.filter(session=OuterRef('pk')).order_by('-timestamp', '-id')
+        unread = SupportMessage.objects.filter(session=OuterRef('pk'), is_read=False)
+        if self.request.user.is_staff:
+            # Staff read the customer's messages
+            unread = unread.filter(sender=OuterRef('user'))
+        else:
+            # Customers read staff messages
+            unread = unread.filter(sender__is_staff=True)
+        return queryset.annotate(
+            last_message_id=Subquery(latest.values('id')[:1]),
+            last_message_sender=Subquery(latest.values('sender')[:1]),
+            last_message_content=Subquery(latest.values('content')[:1]),
+            last_message_timestamp=Subquery(latest.values('timestamp')[:1]),
+            unread_count=Coalesce(
+                Subquery(unread.order_by().values('session').annotate(count=Count('id')).values('count')[:1]), 0
+            ),
+        )
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return SupportSessionSummarySerializer
+        return SupportSessionSerializer
     
     def create(self, request, *args, **kwargs):
         """Override create to automatically set the user field."""
@@ -357,6 +648,81 @@ class SupportSessionViewSet(viewsets.ModelViewSet):
         session.save()
         return Response({'status': 'Support session reopened'})
 
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Staff full-text search over message bodies and session titles.
+
+        ``?q=`` is matched word by word (the last word as a prefix) against the
+        search index; hits are ranked best first and page-number paginated.
+        """
+        if not request.user.is_staff:
+            return Response({'error': 'Only staff can search support sessions'}, status=status.HTTP_403_FORBIDDEN)
+        term = request.query_params.get('q', '').strip()
+        if not term:
+            return Response({'error': 'q is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        paginator = SupportSessionPagination()
+        hits = paginator.paginate_queryset(SupportSearchResults(term), request, view=self)
+
+        # Two queries for the whole page, whatever the mix of message and title hits
+        messages = SupportMessage.objects.select_related('sender', 'session__user').in_bulk(
+            [pk for kind, pk, _ in hits if kind == 'message']
+        )
+        sessions = SupportSession.objects.select_related('user').in_bulk(
+            [pk for kind, pk, _ in hits if kind == 'session']
+        )
+        results = []
+        for kind, pk, rank in hits:
+            message = messages.get(pk) if kind == 'message' else None
+            session = message.session if message else sessions.get(pk)
+            if session is None:
+                # Deleted between the index query and this one
+                continue
+            results.append({
+                'type': kind,
+                'rank': rank,
+                'session': {
+                    'id': session.id,
+                    'title': session.title,
+                    'user': session.user_id,
+                    'user_name': session.user.username,
+                    'is_resolved': session.is_resolved,
+                },
+                'message': {
+                    'id': message.id,
+                    'sender_name': message.sender.username,
+                    'content': message.content,
+                    'timestamp': message.timestamp,
+                } if message else None,
+            })
+        return paginator.get_paginated_response(results)
+
+    @action(detail=True, methods=['get'])
+    def messages(self, request, pk=None):
+        """
+        Messages of one session.
+
+        ``?after=<id>`` returns messages newer than ``id`` in chronological order
+        (what a client that already has the thread needs); otherwise the thread
+        is cursor-paginated from the newest message backwards.
+        """
+        session = self.get_object()
+        messages = SupportMessage.objects.filter(session=session).select_related('sender')
+
+        after = request.query_params.get('after')
+        if after is not None:
+            try:
+                after = int(after)
+            except ValueError:
+                return Response({'error': 'after must be a message id'}, status=status.HTTP_400_BAD_REQUEST)
+            newer = messages.filter(id__gt=after).order_by('id')[:SupportMessageCursorPagination.max_page_size]
+            return Response(SupportMessageSerializer(newer, many=True).data)
+
+        paginator = SupportMessageCursorPagination()
+        page = paginator.paginate_queryset(messages, request, view=self)
+        return paginator.get_paginated_response(SupportMessageSerializer(page, many=True).data)
+
 class SupportMessageViewSet(viewsets.ModelViewSet):
     serializer_class = SupportMessageSerializer
     permission_classes = [IsAuthenticated]
@@ -364,7 +730,7 @@ class SupportMessageViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return SupportMessage.objects.filter(
             Q(session__user=self.request.user) | Q(sender=self.request.user)
-        ).distinct()
+        ).distinct().select_related('sender')
     
     def create(self, request, *args, **kwargs):
         """Override create to automatically set the sender field."""
@@ -382,66 +748,20 @@ class SupportMessageViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         message = serializer.save(sender=self.request.user)
         session = message.session
+        # Session lists are ordered by activity
+        SupportSession.objects.filter(pk=session.pk).update(updated_at=message.timestamp)
+        publish_message(message)
         
         # Create notifications based on sender type
         if self.request.user.is_staff:
             # If admin sends a message, create notification for the user
-            AdminNotification.objects.create(
-                user=session.user,
-                session=session,
-                message=message,
-                is_for_admin=False  # This is for regular user, not admin
-            )
+            notify_session_user(session, message)
         else:
             # If user sends a message, create notifications for all admins
-            admins = CustomUser.objects.filter(is_staff=True, is_active=True)
-            for admin in admins:
-                AdminNotification.objects.create(
-                    user=admin,
-                    session=session,
-                    message=message,
-                    is_for_admin=True  # This is for admin
-                )
+            notify_staff(session, message)
         
-        # Mark notifications as read for the sender
-        if self.request.user.is_staff:
-            # If the sender is an admin, mark all admin notifications as read
-            AdminNotification.objects.filter(
-                session=session,
-                user=self.request.user,
-                is_read=False,
-                is_for_admin=True
-            ).update(is_read=True)
-            
-            # Mark all previous notifications for this session as read
-            AdminNotification.objects.filter(
-                session=session,
-                user=self.request.user,
-                is_read=False,
-                is_for_admin=True
-            ).update(is_read=True)
-            
-            # Also mark all messages in this session as read by the admin
-            SupportMessage.objects.filter(
-                session=session,
-                is_read=False, 
-                sender=session.user  # Only mark user's messages as read
-            ).update(is_read=True)
-        else:
-            # If the sender is a user, mark all user notifications as read
-            AdminNotification.objects.filter(
-                session=session,
-                user=self.request.user,
-                is_read=False,
-                is_for_admin=False
-            ).update(is_read=True)
-            
-            # Also mark all messages in this session as read by the user
-            SupportMessage.objects.filter(
-                session=session,
-                is_read=False, 
-                sender__is_staff=True  # Only mark admin's messages as read
-            ).update(is_read=True)
+        # The sender has seen everything in the session up to their own message
+        mark_session_read_by(session, self.request.user)
     
     @action(detail=False, methods=['post'])
     def mark_session_read(self, request):
@@ -453,38 +773,7 @@ class SupportMessageViewSet(viewsets.ModelViewSet):
         try:
             # Get the session
             session = SupportSession.objects.get(pk=session_id)
-            
-            # If user is admin, mark all messages from the user as read
-            if request.user.is_staff:
-                # Only mark user's messages as read
-                SupportMessage.objects.filter(
-                    session=session,
-                    is_read=False,
-                    sender=session.user
-                ).update(is_read=True)
-                
-                # Mark all notifications for this session as read
-                AdminNotification.objects.filter(
-                    session=session,
-                    user=request.user,
-                    is_read=False,
-                    is_for_admin=True
-                ).update(is_read=True)
-            else:
-                # If user is not admin, mark all admin messages as read
-                SupportMessage.objects.filter(
-                    session=session,
-                    is_read=False,
-                    sender__is_staff=True
-                ).update(is_read=True)
-                
-                # Mark all user notifications for this session as read
-                AdminNotification.objects.filter(
-                    session=session,
-                    user=request.user,
-                    is_read=False,
-                    is_for_admin=False
-                ).update(is_read=True)
+            mark_session_read_by(session, request.user)
                 
             return Response({'status': 'Messages marked as read'})
         except SupportSession.DoesNotExist:
@@ -496,46 +785,51 @@ class AdminNotificationViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         # Admin users see admin notifications, regular users see user notifications
-        if self.request.user.is_staff:
-            return AdminNotification.objects.filter(user=self.request.user, is_for_admin=True)
-        else:
-            return AdminNotification.objects.filter(user=self.request.user, is_for_admin=False)
+        return AdminNotification.objects.filter(
+            user=self.request.user, is_for_admin=self.request.user.is_staff
+        ).select_related('message__sender', 'session__user', 'anomaly__transformer')
+    
+    def perform_update(self, serializer):
+        was_read = serializer.instance.is_read
+        notification = serializer.save()
+        # Keep the unread counter in step with edits made through the API
+        if notification.is_read != was_read:
+            adjust_unread([notification.user_id], notification.is_for_admin, -1 if notification.is_read else 1)
+    
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            if not instance.is_read:
+                adjust_unread([instance.user_id], instance.is_for_admin, -1)
     
     @action(detail=True, methods=['post'])
     def mark_as_read(self, request, pk=None):
         notification = self.get_object()
-        notification.is_read = True
-        notification.save()
+        mark_notifications_read(request.user, notification.is_for_admin, pk=notification.pk)
         return Response({'status': 'Notification marked as read'})
     
     @action(detail=False, methods=['post'])
     def mark_all_as_read(self, request):
         # Admin users mark admin notifications as read, regular users mark user notifications as read
-        if request.user.is_staff:
-            AdminNotification.objects.filter(user=request.user, is_read=False, is_for_admin=True).update(is_read=True)
-        else:
-            AdminNotification.objects.filter(user=request.user, is_read=False, is_for_admin=False).update(is_read=True)
+        mark_notifications_read(request.user, request.user.is_staff)
         return Response({'status': 'All notifications marked as read'})
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def unread_notifications_count(request):
     # Admin users get count of admin notifications, regular users get count of user notifications
-    if request.user.is_staff:
-        count = AdminNotification.objects.filter(
-            user=request.user,
-            is_read=False,
-            is_for_admin=True
-        ).count()
-    else:
-        count = AdminNotification.objects.filter(
-            user=request.user,
-            is_read=False,
-            is_for_admin=False
-        ).count()
+    count = unread_count(request.user, request.user.is_staff)
     
     return Response({'unread_count': count})
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def fleet_summary(request):
+    """Fleet status counts and RUL statistics, cached per user."""
+    # Only staff may bypass the cache
+    fresh = request.user.is_staff and request.query_params.get('fresh') == '1'
+    return Response(get_fleet_summary(request.user, fresh=fresh))
+
 class ChatViewSet(viewsets.ModelViewSet):
     serializer_class = AIConversationSerializer
     permission_classes = [IsAuthenticated]
@@ -545,6 +839,157 @@ class ChatViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return AIConversation.objects.filter(user=self.request.user)
 
+    def get_history(self, conversation, before):
+        """
+        Messages preceding ``before``, oldest first, as model context.
+
+        The window starts on a multiple of CONTEXT_WINDOW, so it holds between
+        CONTEXT_WINDOW and 2 * CONTEXT_WINDOW - 1 messages and stays put for
+        several turns: consecutive prompts then share a prefix whose
+        key/value cache the model reuses instead of encoding it again.
+        """
+        window = settings.AI_MODEL_SETTINGS['CONTEXT_WINDOW']
+        previous = conversation.messages.filter(id__lt=before.id).order_by('timestamp', 'id')
+        start = max(0, (previous.count() - window) // window * window)
+        return [{'role': msg.role, 'content': msg.content} for msg in previous[start:]]
+
+    def model_unavailable(self, message, conversation_id):
+        """503 while the model is not loaded, unless the answer cache can reply to this first question."""
+        if ChatModel.is_ready() or (not conversation_id and self.chat_model.has_cached_answer(message)):
+            return None
+        return self.not_ready_response()
+
+    def not_ready_response(self):
+        return Response(
+            {
+                'error': 'The assistant is not available yet. Please try again shortly.',
+                'state': ChatModel.load_state(),
+            },
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={'Retry-After': '10'}
+        )
+
+    @action(detail=False, methods=['get'], permission_classes=[AllowAny], throttle_classes=[])
+    def ready(self, request):
+        """Model load state for health checks: 200 once the model is loaded, 503 before."""
+        model_status = ChatModel.status()
+        return Response(
+            model_status,
+            status=status.HTTP_200_OK if model_status['ready'] else status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+
+    @action(detail=False, methods=['post'])
+    def stream(self, request):
+        """
+        Streaming variant of chat, as server-sent events.
+
+        Emits ``start`` (conversation and stream ids), one ``token`` per decoded
+        chunk, then ``done`` with the saved assistant message (``cancelled`` is
+        true when the client stopped it early) and the request's queue wait and
+        tokens/sec, or ``error``. The reply is stored
+        as an AIMessage once generation ends. Events only stream under ASGI;
+        a WSGI server sends them all at once when generation ends.
+        """
+        user_message = request.data.get('message')
+        conversation_id = request.data.get('conversation_id')
+
+        if not user_message:
+            return Response({'error': 'Message is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+        unavailable = self.model_unavailable(user_message, conversation_id)
+        if unavailable:
+            return unavailable
+
+        if conversation_id:
+            try:
+                conversation = AIConversation.objects.get(id=conversation_id, user=request.user)
+            except AIConversation.DoesNotExist:
+                return Response({'error': 'Conversation not found'}, status=status.HTTP_404_NOT_FOUND)
+        else:
+            conversation = AIConversation.objects.create(user=request.user)
+
+        user_msg = AIMessage.objects.create(conversation=conversation, role='user', content=user_message)
+        history = self.get_history(conversation, user_msg)
+        stream_id, cancel_event = open_stream(request.user.id)
+
+        response = StreamingHttpResponse(
+            self.stream_events(conversation, user_msg, history, stream_id, cancel_event),
+            content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        # Keep nginx from buffering the whole stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def stream_events(self, conversation, user_msg, history, stream_id, cancel_event):
+        def event(name, data):
+            return f"event: {name}\ndata: {json.dumps(data)}\n\n"
+
+        yield event('start', {
+            'conversation_id': conversation.id,
+            'stream_id': stream_id,
+            'message': AIMessageSerializer(user_msg).data,
+        })
+        parts = []
+        metrics = {}
+        try:
+            async for chunk in self.chat_model.stream_response(
+                user_msg.content, history, cancel_event, metrics=metrics, conversation_id=conversation.id
+            ):
+                parts.append(chunk)
+                yield event('token', {'text': chunk})
+        except Exception as e:
+            logger.error(f"Model streaming error: {str(e)}")
+            await sync_to_async(user_msg.delete)()
+            yield event('error', {
+                'error': 'Failed to generate response. Please try again.',
+                'detail': str(e) if settings.DEBUG else 'An unexpected error occurred.'
+            })
+            return
+        finally:
+            close_stream(stream_id)
+
+        content = self.chat_model._clean_response(''.join(parts))
+        if not content:
+            if cancel_event.is_set():
+                # Stopped before anything was said: drop the question as a failed chat would
+                await sync_to_async(user_msg.delete)()
+                yield event('done', {'conversation_id': conversation.id, 'message': None, 'cancelled': True})
+                return
+            content = "I apologize, but I couldn't generate a proper response. Please try again."
+
+        @sync_to_async
+        def save_reply():
+            ai_message = AIMessage.objects.create(conversation=conversation, role='assistant', content=content)
+            # Update conversation timestamp
+            conversation.save()
+            return AIMessageSerializer(ai_message).data
+
+        yield event('done', {
+            'conversation_id': conversation.id,
+            'message': await save_reply(),
+            'cancelled': cancel_event.is_set(),
+            'metrics': metrics,
+        })
+
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        """Answer cache hit rates and generation scheduler load (staff only)."""
+        if not request.user.is_staff:
+            return Response({'error': 'Only staff can view chat statistics'}, status=status.HTTP_403_FORBIDDEN)
+        return Response({
+            'answer_cache': ChatModel.get_answer_cache().stats(),
+            'scheduler': ChatModel.scheduler_stats(),
+        })
+
+    @action(detail=False, methods=['post'])
+    def cancel(self, request):
+        """Stop a running stream; its partial reply is saved and ends the stream."""
+        stream_id = request.data.get('stream_id')
+        if not stream_id or not cancel_stream(request.user.id, stream_id):
+            return Response({'error': 'Stream not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'status': 'Cancelling'})
+
     @action(detail=False, methods=['post'])
     def chat(self, request):
         user_message = request.data.get('message')
@@ -556,6 +1001,11 @@ class ChatViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        # Fail fast rather than holding the request until the model has loaded
+        unavailable = self.model_unavailable(user_message, conversation_id)
+        if unavailable:
+            return unavailable
+
         try:
             # Get or create conversation
             if conversation_id:
@@ -580,17 +1030,15 @@ class ChatViewSet(viewsets.ModelViewSet):
             )
 
             try:
-                # Get conversation history
-                history = [
-                    {'role': msg.role, 'content': msg.content}
-                    for msg in conversation.messages.all().order_by('-timestamp')[0:2]
-                    # for msg in conversation.messages.all().order_by('timestamp')
-                ]
+                history = self.get_history(conversation, user_msg)
 
                 # Generate AI response asynchronously
+                metrics = {}
                 async def generate():
                     try:
-                        return await self.chat_model.generate_response(user_message, history)
+                        return await self.chat_model.generate_response(
+                            user_message, history, metrics=metrics, conversation_id=conversation.id
+                        )
                     except asyncio.TimeoutError:
                         raise asyncio.TimeoutError("Model response timed out")
                     except Exception as e:
@@ -612,6 +1060,7 @@ class ChatViewSet(viewsets.ModelViewSet):
                 return Response({
                     'conversation_id': conversation.id,
                     'message': AIMessageSerializer(ai_message).data,
+                    'metrics': metrics,
                     'history': AIMessageSerializer(
                         conversation.messages.all().order_by('timestamp'),
                         many=True
@@ -628,6 +1077,10 @@ class ChatViewSet(viewsets.ModelViewSet):
                     },
                     status=status.HTTP_504_GATEWAY_TIMEOUT
                 )
+            except ModelNotReady:
+                # The cached answer expired between the check above and generation
+                user_msg.delete()
+                return self.not_ready_response()
             except Exception as e:
                 logger.error(f"Model generation error: {str(e)}")
                 user_msg.delete()
@@ -2,6 +2,7 @@
 ASGI config for power_analysis project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP goes to Django; WebSocket connections go to the push consumers in api.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
@@ -13,4 +14,50 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "power_analysis.settings")
 
-application = get_asgi_application()
+# Set up Django before importing anything that touches models
+django_asgi_app = get_asgi_application()
+
+from channels.auth import AuthMiddlewareStack  # noqa: E402
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from channels.security.websocket import AllowedHostsOriginValidator  # noqa: E402
+from api.routing import websocket_urlpatterns  # noqa: E402
+from api.chat_model import ChatModel  # noqa: E402
+
+
+class ChatModelStartup:
+    """
+    Starts loading the chat model when the server starts, not when this module is imported.
+
+    uvicorn and hypercorn send a lifespan startup event; daphne does not, so
+    there the first connection starts the load. Either way the server
+    accepts requests while the model loads in the background.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.started = False
+
+    def start(self):
+        if not self.started:
+            self.started = True
+            ChatModel.start_loading()
+
+    async def __call__(self, scope, receive, send):
+        self.start()
+        if scope['type'] != 'lifespan':
+            return await self.app(scope, receive, send)
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+application = ChatModelStartup(ProtocolTypeRouter({
+    "http": django_asgi_app,
+    # Authenticated by the same session cookie as the API; the origin check stands in
+    # for CSRF protection, which WebSocket handshakes do not get
+    "websocket": AllowedHostsOriginValidator(AuthMiddlewareStack(URLRouter(websocket_urlpatterns))),
+}))
@@ -36,6 +36,7 @@ ALLOWED_HOSTS = ['*']
 # Application definition
 
 INSTALLED_APPS = [
+    "daphne",  # ASGI runserver (HTTP + WebSockets); must come before staticfiles
     "django.contrib.admin",
     "django.contrib.auth",
     "django.contrib.contenttypes",
@@ -43,6 +44,7 @@ INSTALLED_APPS = [
     "django.contrib.messages",
     "django.contrib.staticfiles",
     'rest_framework',
+    'channels',
     'api',
     'drf_spectacular',
     'corsheaders',
@@ -52,6 +54,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',  # Must be before CommonMiddleware
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.LargeResponseGZipMiddleware',  # Compress large API responses
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -92,14 +95,105 @@ AI_MODEL_SETTINGS = {
     'MAX_LENGTH': 400,  # Maximum number of tokens for generation
     'TEMPERATURE': 0.2,
     'TOP_P': 0.9,
-    'CONTEXT_WINDOW': 5,  # Number of previous messages to include as context
+    'CONTEXT_WINDOW': 5,  # Context holds between this many and twice this many minus one previous messages
+    'MAX_BATCH_SIZE': 8,  # Generations decoded together by the batching scheduler
+    'BATCH_WAIT_MS': 10,  # How long an idle scheduler waits for more prompts to prefill together
+    'PREFIX_CACHE_TOKENS': 8192,  # Conversation key/value cache budget (about 200MB in float32 for the 0.5B model)
+    # Serving processes load the model on a background thread at startup; off, chat answers only from its cache
+    'LOAD_ON_STARTUP': os.getenv('CHAT_MODEL_LOAD_ON_STARTUP', 'True') == 'True',
+    # Unix socket of `manage.py run_chat_worker`; when set, web processes send generation there instead of loading the model
+    'WORKER_SOCKET': os.getenv('CHAT_WORKER_SOCKET', ''),
+    'WORKER_TIMEOUT': int(os.getenv('CHAT_WORKER_TIMEOUT', '60')),  # seconds without a token before a request gives up
+    'CPU_QUANTIZATION': os.getenv('CHAT_MODEL_QUANTIZATION', ''),  # 'int8' for dynamic int8 Linear layers on CPU; '' keeps float32
+    'CPU_THREADS': int(os.getenv('CHAT_MODEL_THREADS', '0')),  # intra-op threads for CPU inference; 0 keeps torch's default (all cores)
+}
+
+# Fleet summary settings
+FLEET_SETTINGS = {
+    'CRITICAL_FDD_CLASSES': [4],  # FDD classes treated as critical (4 = low-temperature overheating)
+    'CRITICAL_RUL': 30,  # Latest RUL at or below this value is critical
+    'SUMMARY_CACHE_TIMEOUT': 300,  # seconds
+}
+
+# Cold-storage archival of old measurements (manage.py compact_measurements)
+ARCHIVE_SETTINGS = {
+    'AGE_DAYS': int(os.getenv('ARCHIVE_AGE_DAYS', '365')),  # Whole months older than this are archived
+    'BATCH_SIZE': 5000,  # Rows moved per transaction
+    'MAX_CHUNKS': 500,  # Transformer-months processed per run
+}
+
+NOTIFICATION_SETTINGS = {
+    'BULK_BATCH_SIZE': 500,  # Rows per INSERT when fanning out notifications
+    'BACKGROUND_THRESHOLD': 200,  # Staff fan-outs larger than this run in a background worker
+}
+
+# Answers to context-free first chat questions (api.answer_cache)
+CHAT_CACHE_SETTINGS = {
+    'ENABLED': os.getenv('CHAT_CACHE_ENABLED', 'True') == 'True',
+    'TTL': int(os.getenv('CHAT_CACHE_TTL', str(7 * 24 * 3600))),  # seconds
+    'MAX_QUESTION_LENGTH': 300,  # Longer questions are too specific to be worth caching
+    # Optional local sentence encoder for the paraphrase tier, e.g. sentence-transformers/all-MiniLM-L6-v2
+    'EMBEDDING_MODEL': os.getenv('CHAT_CACHE_EMBEDDING_MODEL', ''),
+    'SIMILARITY_THRESHOLD': float(os.getenv('CHAT_CACHE_SIMILARITY', '0.92')),  # Cosine similarity for a paraphrase hit
+    'MAX_EMBEDDINGS': 2000,  # Questions kept in the in-process similarity index
+}
+
+# Retention of notifications and chat history (manage.py apply_retention)
+RETENTION_SETTINGS = {
+    'READ_NOTIFICATION_DAYS': int(os.getenv('RETENTION_NOTIFICATION_DAYS', '30')),  # Read notifications older than this are deleted
+    'RESOLVED_SESSION_DAYS': int(os.getenv('RETENTION_SESSION_DAYS', '180')),  # Resolved sessions idle this long keep only first and last message
+    'AI_CONVERSATION_DAYS': int(os.getenv('RETENTION_AI_CONVERSATION_DAYS', '90')),  # Assistant conversations idle this long are deleted
+    'BATCH_SIZE': 1000,  # Rows deleted per transaction
+    'PAUSE': 0.05,  # Seconds between batches, leaves room for writers
+}
+
+ANOMALY_SETTINGS = {
+    'ALPHA': 0.1,  # EWMA weight of the newest measurement
+    'Z_THRESHOLD': 4.0,  # Flag readings this many standard deviations from the EWMA mean
+    'WARMUP': 10,  # Measurements observed before a transformer can be flagged
+    'MIN_STD': {'level': 1.0, 'rate': 0.1},  # Floors (ppm, ppm/hour) so flat histories do not flag noise
+}
+
+# Cache settings (local memory by default, single node)
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'power-analysis'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # Chat answer cache; its own store so the entry limit applies to answers only
+    'chat_answers': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CHAT_CACHE_LOCATION', 'power-analysis-chat'),
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('CHAT_CACHE_MAX_ENTRIES', '2000'))},
+    },
 }
 
 # Async Settings
-# ASGI_APPLICATION = "power_analysis.asgi.application"
+ASGI_APPLICATION = "power_analysis.asgi.application"
+
+# WebSocket push (api.consumers); in-memory for a single node and tests, Redis when REDIS_URL is set
+if os.getenv('REDIS_URL'):
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [os.getenv('REDIS_URL')]},
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}
+    }
+
+# Responses smaller than this are sent uncompressed
+RESPONSE_COMPRESSION_MIN_BYTES = 8 * 1024
 
 # DRF Settings
 REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
     ],
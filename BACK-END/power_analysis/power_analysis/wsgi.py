@@ -7,10 +7,32 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/wsgi/
 """
 
+import logging
 import os
 
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "power_analysis.settings")
 
-application = get_wsgi_application()
+django_application = get_wsgi_application()
+
+from api.chat_model import ChatModel  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+_started = False
+
+
+def application(environ, start_response):
+    # Start loading the chat model in the worker that serves the first request,
+    # not at import, so preloading parents and test imports never load it
+    global _started
+    if not _started:
+        _started = True
+        # WSGI drains an async response before sending it, so SSE arrives in one piece
+        logger.warning(
+            "Serving under WSGI: /api/chat/stream/ replies are buffered until generation ends. "
+            "Run an ASGI server (daphne power_analysis.asgi:application) to stream them."
+        )
+        ChatModel.start_loading()
+    return django_application(environ, start_response)
@@ -2,6 +2,7 @@ import { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { MessageSquare, Send, ArrowLeft } from 'lucide-react';
 import api from '../lib/axios';
+import { subscribeToEvents } from '../lib/events';
 import { useAuthStore } from '../stores/auth';
 import { useThemeStore } from '../stores/theme';
 import { formatDistanceToNow } from 'date-fns';
@@ -32,6 +33,18 @@ interface SupportSession {
   latest_timestamp?: string; // Latest message timestamp
 }
 
+interface SupportSessionSummary {
+  id: number;
+  user: number;
+  user_name: string;
+  title: string;
+  created_at: string;
+  updated_at: string;
+  is_resolved: boolean;
+  unread_count: number;
+  last_message: { id: number; sender: number; content: string; timestamp: string } | null;
+}
+
 const AdminChat: React.FC = () => {
   const { t } = useTranslation();
   const { user } = useAuthStore();
@@ -43,7 +56,20 @@ const AdminChat: React.FC = () => {
   const [newMessage, setNewMessage] = useState('');
   const [sendingMessage, setSendingMessage] = useState(false);
   const [error, setError] = useState<string | null>(null);
+  // Cursor of the next older page of the open thread, null once it is fully loaded
+  const [olderMessagesUrl, setOlderMessagesUrl] = useState<string | null>(null);
+  const [loadingOlder, setLoadingOlder] = useState(false);
+  // Next page of older sessions, null once all are loaded
+  const [nextSessionsUrl, setNextSessionsUrl] = useState<string | null>(null);
+  const [loadingMoreSessions, setLoadingMoreSessions] = useState(false);
+  // Once older pages are loaded, refreshes must not reset the cursor back to page 2
+  const olderSessionsLoadedRef = useRef(false);
   const messagesEndRef = useRef<HTMLDivElement>(null);
+  // Read by the push listener, which is subscribed once
+  const selectedSessionIdRef = useRef<number | null>(null);
+  const sessionIdsRef = useRef<Set<number>>(new Set());
+  selectedSessionIdRef.current = selectedSession?.id ?? null;
+  sessionIdsRef.current = new Set(sessions.map(session => session.id));
 
   // Only staff/admin users should access this component
   useEffect(() => {
@@ -52,40 +78,36 @@ const AdminChat: React.FC = () => {
     }
   }, [user, navigate]);
 
-  // Fetch all support sessions
+  const toSession = (session: SupportSessionSummary): SupportSession => ({
+    ...session,
+    messages: [],
+    has_unread: session.unread_count > 0,
+    latest_message: session.last_message?.content || 'No messages',
+    latest_timestamp: session.last_message?.timestamp || session.created_at
+  });
+
+  // Unread first, then newest first
+  const sortSessions = (list: SupportSession[]) => [...list].sort((a, b) => {
+    if (a.has_unread && !b.has_unread) return -1;
+    if (!a.has_unread && b.has_unread) return 1;
+    return new Date(b.latest_timestamp || b.updated_at).getTime() - 
+           new Date(a.latest_timestamp || a.updated_at).getTime();
+  });
+
+  // Newest page of support sessions; older ones are loaded on demand
   const fetchSessions = async () => {
     try {
-      setLoading(true);
+      // The server orders by latest activity, so new messages always land on this page
       const response = await api.get('/api/support-sessions/');
+      const firstPage = response.data.results.map(toSession);
+      const firstPageIds = new Set(firstPage.map((session: SupportSession) => session.id));
       
-      // Process sessions to determine unread status and latest message
-      const processedSessions = response.data.map((session: SupportSession) => {
-        const messages = session.messages || [];
-        const hasUnread = messages.some(
-          (msg: SupportMessage) => !msg.is_read && msg.sender !== user?.id
-        );
-        const latestMessage = messages.length > 0 ? messages[messages.length - 1] : null;
-        
-        return {
-          ...session,
-          has_unread: hasUnread,
-          latest_message: latestMessage?.content || 'No messages',
-          latest_timestamp: latestMessage?.timestamp || session.created_at
-        };
-      });
-      
-      // Sort by latest timestamp descending (newest first)
-      const sortedSessions = processedSessions.sort((a: SupportSession, b: SupportSession) => {
-        // Prioritize unread sessions
-        if (a.has_unread && !b.has_unread) return -1;
-        if (!a.has_unread && b.has_unread) return 1;
-        
-        // Then sort by timestamp
-        return new Date(b.latest_timestamp || b.updated_at).getTime() - 
-               new Date(a.latest_timestamp || a.updated_at).getTime();
-      });
-      
-      setSessions(sortedSessions);
+      // The list returns summaries; a thread is loaded when its session is opened.
+      // Sessions from pages loaded with "load more" are kept.
+      setSessions(prev => sortSessions([...firstPage, ...prev.filter(s => !firstPageIds.has(s.id))]));
+      if (!olderSessionsLoadedRef.current) {
+        setNextSessionsUrl(response.data.next);
+      }
     } catch (error) {
       console.error('Error fetching sessions:', error);
       setError('Failed to load support sessions');
@@ -94,6 +116,29 @@ const AdminChat: React.FC = () => {
     }
   };
 
+  const handleLoadMoreSessions = async () => {
+    if (!nextSessionsUrl) return;
+    
+    try {
+      setLoadingMoreSessions(true);
+      const response = await api.get(nextSessionsUrl);
+      olderSessionsLoadedRef.current = true;
+      setSessions(prev => {
+        const loadedIds = new Set(prev.map(s => s.id));
+        return sortSessions([
+          ...prev,
+          ...response.data.results.map(toSession).filter((s: SupportSession) => !loadedIds.has(s.id))
+        ]);
+      });
+      setNextSessionsUrl(response.data.next);
+    } catch (error) {
+      console.error('Error fetching sessions:', error);
+      setError('Failed to load support sessions');
+    } finally {
+      setLoadingMoreSessions(false);
+    }
+  };
+
   useEffect(() => {
     fetchSessions();
     
@@ -102,15 +147,71 @@ const AdminChat: React.FC = () => {
     return () => clearInterval(interval);
   }, []);
 
-  // Scroll to bottom of messages when selected session changes or new messages come in
+  // New messages arrive over the push socket; the periodic refresh catches up on any it missed
+  useEffect(() => {
+    return subscribeToEvents(async (event) => {
+      if (event.type !== 'support_message.created') return;
+      const message: SupportMessage = event.message;
+
+      if (!sessionIdsRef.current.has(message.session)) {
+        fetchSessions();
+        return;
+      }
+      const isOpen = selectedSessionIdRef.current === message.session;
+      setSelectedSession(prev => prev && prev.id === message.session && !prev.messages.some(m => m.id === message.id)
+        ? { ...prev, messages: [...prev.messages, message] }
+        : prev
+      );
+      setSessions(prev => {
+        const updated = prev.find(s => s.id === message.session);
+        if (!updated) return prev;
+        return [
+          {
+            ...updated,
+            has_unread: updated.has_unread || (!isOpen && message.sender !== user?.id),
+            latest_message: message.content,
+            latest_timestamp: message.timestamp
+          },
+          ...prev.filter(s => s.id !== message.session)
+        ];
+      });
+
+      if (isOpen && message.sender !== user?.id) {
+        try {
+          await api.post('/api/support-messages/mark_session_read/', {
+            session_id: message.session
+          });
+        } catch (error) {
+          console.error('Error marking messages as read:', error);
+        }
+      }
+    });
+  }, [user?.id]);
+
+  // Scroll to bottom of messages when selected session changes or new messages come in,
+  // but not when older messages are added above
+  const selectedMessages = selectedSession?.messages;
+  const lastMessageId = selectedMessages?.length ? selectedMessages[selectedMessages.length - 1].id : null;
   useEffect(() => {
     if (messagesEndRef.current) {
       messagesEndRef.current.scrollIntoView({ behavior: 'smooth' });
     }
-  }, [selectedSession]);
+  }, [selectedSession?.id, lastMessageId]);
 
   const handleSessionSelect = async (session: SupportSession) => {
     setSelectedSession(session);
+    setOlderMessagesUrl(null);
+    
+    try {
+      // Newest page of the thread, shown oldest first
+      const response = await api.get(`/api/support-sessions/${session.id}/messages/`);
+      const messages = [...response.data.results].reverse();
+      setSelectedSession(prev => prev && prev.id === session.id ? { ...prev, messages } : prev);
+      setOlderMessagesUrl(response.data.next);
+    } catch (error) {
+      console.error('Error fetching messages:', error);
+      setError('Failed to load messages');
+    }
     
     // Mark messages as read when session is opened
     if (session.has_unread) {
@@ -134,6 +235,28 @@ const AdminChat: React.FC = () => {
     }
   };
 
+  const handleLoadOlder = async () => {
+    if (!selectedSession || !olderMessagesUrl) return;
+    const sessionId = selectedSession.id;
+    
+    try {
+      setLoadingOlder(true);
+      // The cursor pages backwards through the thread, newest first
+      const response = await api.get(olderMessagesUrl);
+      const older = [...response.data.results].reverse();
+      setSelectedSession(prev => prev && prev.id === sessionId
+        ? { ...prev, messages: [...older, ...prev.messages] }
+        : prev
+      );
+      setOlderMessagesUrl(response.data.next);
+    } catch (error) {
+      console.error('Error fetching older messages:', error);
+      setError('Failed to load messages');
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+
   const handleSendMessage = async (e: React.FormEvent) => {
     e.preventDefault();
     if (!newMessage.trim() || !selectedSession) return;
@@ -149,7 +272,10 @@ const AdminChat: React.FC = () => {
       setSelectedSession(prev => {
         if (!prev) return null;
         
-        const updatedMessages = [...prev.messages, response.data];
+        // The push socket may have delivered it already
+        const updatedMessages = prev.messages.some(m => m.id === response.data.id)
+          ? prev.messages
+          : [...prev.messages, response.data];
         return {
           ...prev,
           messages: updatedMessages,
@@ -300,6 +426,23 @@ const AdminChat: React.FC = () => {
                     </div>
                   ))}
                 </div>
+
+                {nextSessionsUrl && (
+                  <div className="flex justify-center p-3">
+                    <button
+                      type="button"
+                      onClick={handleLoadMoreSessions}
+                      disabled={loadingMoreSessions}
+                      className={`text-xs px-3 py-1 rounded-full disabled:opacity-50 ${
+                        isDarkMode 
+                          ? 'bg-gray-700 text-gray-300 hover:bg-gray-600' 
+                          : 'bg-gray-100 text-gray-600 hover:bg-gray-200'
+                      }`}
+                    >
+                      {t('support.loadMoreSessions')}
+                    </button>
+                  </div>
+                )}
               </>
             )}
           </div>
@@ -339,6 +482,22 @@ const AdminChat: React.FC = () => {
                 </div>
               ) : (
                 <div className="space-y-4">
+                  {olderMessagesUrl && (
+                    <div className="flex justify-center">
+                      <button
+                        type="button"
+                        onClick={handleLoadOlder}
+                        disabled={loadingOlder}
+                        className={`text-xs px-3 py-1 rounded-full disabled:opacity-50 ${
+                          isDarkMode 
+                            ? 'bg-gray-700 text-gray-300 hover:bg-gray-600' 
+                            : 'bg-gray-100 text-gray-600 hover:bg-gray-200'
+                        }`}
+                      >
+                        {t('support.loadOlder')}
+                      </button>
+                    </div>
+                  )}
                   {selectedSession.messages.map(message => (
                     <div 
                       key={message.id} 
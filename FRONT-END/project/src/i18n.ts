@@ -24,6 +24,8 @@ const resources = {
         noActiveSessions: 'No active support sessions',
         noMessagesYet: 'No messages yet',
         selectConversation: 'Select a conversation to start messaging',
+        loadOlder: 'Load older messages',
+        loadMoreSessions: 'Load older conversations',
       },
       adminInput:"Type your message to the administrator...",
       welcome: 'Welcome',
@@ -327,6 +329,8 @@ const resources = {
         noActiveSessions: 'لا توجد جلسات دعم نشطة',
         noMessagesYet: 'لا توجد رسائل حتى الآن',
         selectConversation: 'اختر محادثة للبدء بالمراسلة',
+        loadOlder: 'عرض الرسائل الأقدم',
+        loadMoreSessions: 'عرض المحادثات الأقدم',
       },
       adminInput:"اكتب رسالتك للادارة...",
       welcome: 'مرحبا',
@@ -624,6 +628,8 @@ const resources = {
         noActiveSessions: 'Нет активных сессий поддержки',
         noMessagesYet: 'Пока нет сообщений',
         selectConversation: 'Выберите разговор, чтобы начать обмен сообщениями',
+        loadOlder: 'Загрузить более ранние сообщения',
+        loadMoreSessions: 'Загрузить более ранние разговоры',
       },
       adminInput:"Введите ваше сообщение администратору...",
       welcome: 'Добро пожаловать',
@@ -0,0 +1,66 @@
+import api from './axios';
+
+// Push events from /ws/events/; the socket is authenticated by the session cookie
+export interface PushEvent {
+  type: string;
+  [key: string]: any;
+}
+
+type Listener = (event: PushEvent) => void;
+
+const listeners = new Set<Listener>();
+let socket: WebSocket | null = null;
+let pingTimer: ReturnType<typeof setInterval> | null = null;
+let reconnectTimer: ReturnType<typeof setTimeout> | null = null;
+let reconnectDelay = 1000;
+
+const eventsUrl = () => {
+  const base = new URL(api.defaults.baseURL || window.location.origin);
+  base.protocol = base.protocol === 'https:' ? 'wss:' : 'ws:';
+  base.pathname = '/ws/events/';
+  return base.toString();
+};
+
+const connect = () => {
+  reconnectTimer = null;
+  socket = new WebSocket(eventsUrl());
+
+  socket.onopen = () => {
+    reconnectDelay = 1000;
+    // Keeps proxies from closing an idle socket
+    pingTimer = setInterval(() => socket?.send(JSON.stringify({ type: 'ping' })), 30000);
+  };
+
+  socket.onmessage = (message) => {
+    const event: PushEvent = JSON.parse(message.data);
+    listeners.forEach(listener => listener(event));
+  };
+
+  socket.onclose = (close) => {
+    if (pingTimer) clearInterval(pingTimer);
+    pingTimer = null;
+    socket = null;
+    // 4401: not logged in; the polling fallback keeps working until the next subscribe
+    if (listeners.size > 0 && close.code !== 4401) {
+      reconnectTimer = setTimeout(connect, reconnectDelay);
+      reconnectDelay = Math.min(reconnectDelay * 2, 30000);
+    }
+  };
+};
+
+// One shared socket for all subscribers; it closes when the last one unsubscribes
+export const subscribeToEvents = (listener: Listener) => {
+  listeners.add(listener);
+  if (!socket && !reconnectTimer) {
+    connect();
+  }
+
+  return () => {
+    listeners.delete(listener);
+    if (listeners.size === 0) {
+      if (reconnectTimer) clearTimeout(reconnectTimer);
+      reconnectTimer = null;
+      socket?.close();
+    }
+  };
+};
@@ -6,6 +6,7 @@ import Plot from 'react-plotly.js';
 import { format } from 'date-fns';
 import { useAuthStore } from '../stores/auth';
 import api from '../lib/axios';
+import { subscribeToEvents } from '../lib/events';
 import { useTranslation } from 'react-i18next';
 import { formatRUL } from '../utils/durationFormatter';
 import { Activity, Bell } from 'lucide-react';
@@ -26,14 +27,18 @@ interface Measurement {
 
 interface Notification {
   id: number;
-  message: number;
-  session: number;
+  message: number | null;
+  session: number | null;
   created_at: string;
   is_read: boolean;
   sender_name: string;
   message_content: string;
   session_title: string;
-  notification_type?: string; // Optional field to distinguish notification types
+  notification_type: 'support_message' | 'anomaly';
+  // Set for anomaly notifications only
+  transformer: number | null;
+  measurement: number | null;
+  anomaly_timestamp: string | null;
 }
 
 // Helper function to group measurements by interval
@@ -254,6 +259,19 @@ export default function Dashboard() {
       return () => clearInterval(interval);
     }
   }, [isAuthenticated, user, fetchNotifications]);
+
+  // Pushed events keep the badge and list current between polls
+  useEffect(() => {
+    if (!isAuthenticated) return;
+    return subscribeToEvents(event => {
+      if (event.type === 'notification.created' && event.notification.is_for_admin === !!user?.is_staff) {
+        setUnreadCount(prevCount => prevCount + 1);
+        fetchNotifications();
+      } else if (event.type === 'notifications.read' && event.is_for_admin === !!user?.is_staff) {
+        setUnreadCount(event.unread_count);
+      }
+    });
+  }, [isAuthenticated, user?.is_staff, fetchNotifications]);
   
   // Close notifications panel when clicking outside
   useEffect(() => {
@@ -315,6 +333,19 @@ export default function Dashboard() {
     setIsNotificationOpen(false);
   };
   
+  // Anomaly alerts have no conversation: show the transformer's measurements on the day of the anomaly
+  const handleViewAnomaly = (notification: Notification) => {
+    setSelectedTransformer(notification.transformer);
+    if (notification.anomaly_timestamp) {
+      const day = format(new Date(notification.anomaly_timestamp), 'yyyy-MM-dd');
+      setStartDate(day);
+      setEndDate(day);
+    }
+    setCurrentPage(1);
+    setIsNotificationOpen(false);
+    document.getElementById('chart-transformer')?.scrollIntoView({ behavior: 'smooth' });
+  };
+  
   const handleCancelTransformerModal = useCallback(() => {
     // If user has entered a name and not submitting, ask for confirmation
     if (newTransformerName.trim() && !isSubmitting) {
@@ -590,7 +621,11 @@ export default function Dashboard() {
                     if (!notification.is_read) {
                       handleMarkAsRead(notification.id);
                     }
-                    handleViewConversation(notification.session);
+                    if (notification.notification_type === 'anomaly') {
+                      handleViewAnomaly(notification);
+                    } else if (notification.session !== null) {
+                      handleViewConversation(notification.session);
+                    }
                   }}
                 >
                   <div className="flex justify-between items-start">
@@ -1,9 +1,10 @@
 import { Send, MessageSquare, Bot, AlertCircle, Trash2, Activity } from 'lucide-react';
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useTranslation } from 'react-i18next';
 import { useAuthStore } from '../stores/auth';
 import { useThemeStore } from '../stores/theme';
 import api from '../lib/axios';
+import { subscribeToEvents } from '../lib/events';
 
 interface Message {
   role: 'user' | 'assistant';
@@ -118,12 +119,13 @@ const Support = () => {
         params: { is_resolved: false }
       });
       
-      const data = response.data;
+      const data = response.data.results;
       
       if (data.length > 0) {
-        // Use the most recent session
-        setCurrentSession(data[0]);
-        setAdminMessages(data[0].messages || []);
+        // Use the most recent session; the list only has summaries, so load the thread
+        const sessionResponse = await api.get(`/api/support-sessions/${data[0].id}/`);
+        setCurrentSession(sessionResponse.data);
+        setAdminMessages(sessionResponse.data.messages || []);
       } else {
         // Create a new session
         // Note: Backend automatically sets user from the authenticated request
@@ -230,7 +232,8 @@ const Support = () => {
 
       // Add the message from the response to our list
       const newMessage = response.data;
-      setAdminMessages(prev => [...prev, newMessage]);
+      // The push socket may have delivered it already
+      setAdminMessages(prev => prev.some(msg => msg.id === newMessage.id) ? prev : [...prev, newMessage]);
     } catch (error: any) {
       console.error('Error sending message to admin:', error);
       setError(error.response?.data?.detail || 'Failed to send message');
@@ -303,31 +306,43 @@ RUL: ${measurement.rul} hours`;
     }
   };
 
+  // Newest message in the thread; polls only ask for messages after it
+  const lastMessageIdRef = useRef(0);
+  lastMessageIdRef.current = adminMessages.reduce((latest, msg) => Math.max(latest, msg.id ?? 0), 0);
+
   // Add session refresh mechanism
   useEffect(() => {
     // Only set up polling if on admin tab and we have a current session
     if (activeTab === 'admin' && currentSession?.id && !user?.is_staff) {
-      // Function to refresh messages
+      const sessionId = currentSession.id;
+
+      // Function to fetch messages newer than the ones shown
       const refreshSession = async () => {
         try {
-          const response = await api.get(`/api/support-sessions/${currentSession.id}/`);
-          // Only update if there are new messages
-          if (response.data.messages.length > adminMessages.length) {
-            const messages = response.data.messages || [];
-            setAdminMessages(messages.map((msg: AdminMessage) => ({
-              ...msg,
-              highlight: !msg.is_read && msg.sender !== user?.id
-            })));
+          const response = await api.get(`/api/support-sessions/${sessionId}/messages/`, {
+            params: { after: lastMessageIdRef.current }
+          });
+          const newer: AdminMessage[] = response.data;
+          if (newer.length === 0) return;
+
+          setAdminMessages(prev => {
+            const shown = new Set(prev.map(msg => msg.id));
+            return [
+              ...prev,
+              ...newer
+                .filter(msg => !shown.has(msg.id))
+                .map(msg => ({ ...msg, highlight: !msg.is_read && msg.sender !== user?.id }))
+            ];
+          });
             
-            // Mark messages as read
-            if (messages.some((msg: AdminMessage) => !msg.is_read && msg.sender !== user?.id)) {
-              try {
-                await api.post('/api/support-messages/mark_session_read/', {
-                  session_id: currentSession.id
-                });
-              } catch (error) {
-                console.error('Error marking messages as read:', error);
-              }
+          // Mark messages as read
+          if (newer.some(msg => !msg.is_read && msg.sender !== user?.id)) {
+            try {
+              await api.post('/api/support-messages/mark_session_read/', {
+                session_id: sessionId
+              });
+            } catch (error) {
+              console.error('Error marking messages as read:', error);
             }
           }
         } catch (error) {
@@ -343,7 +358,33 @@ RUL: ${measurement.rul} hours`;
       
       return () => clearInterval(interval);
     }
-  }, [activeTab, currentSession?.id, user?.id, user?.is_staff, adminMessages.length]);
+  }, [activeTab, currentSession?.id, user?.id, user?.is_staff]);
+
+  // Replies arrive over the push socket; the polling above catches up on any it missed
+  useEffect(() => {
+    if (!currentSession?.id || user?.is_staff) return;
+    const sessionId = currentSession.id;
+
+    return subscribeToEvents(async (event) => {
+      if (event.type !== 'support_message.created' || event.message.session !== sessionId) return;
+      const message: AdminMessage = event.message;
+      const fromOther = message.sender !== user?.id;
+      setAdminMessages(prev => prev.some(msg => msg.id === message.id)
+        ? prev
+        : [...prev, { ...message, highlight: fromOther }]
+      );
+
+      if (fromOther && activeTab === 'admin') {
+        try {
+          await api.post('/api/support-messages/mark_session_read/', {
+            session_id: sessionId
+          });
+        } catch (error) {
+          console.error('Error marking messages as read:', error);
+        }
+      }
+    });
+  }, [activeTab, currentSession?.id, user?.id, user?.is_staff]);
 
   const renderTabContent = () => {
     if (activeTab === 'ai') {